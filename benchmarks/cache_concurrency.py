@@ -0,0 +1,87 @@
+"""Concurrent cache-hit benchmark: global asyncio.Lock vs lock-free reads.
+
+Runs N reader tasks doing cache lookups while a writer keeps refilling the
+cache, once with every operation behind a shared asyncio.Lock (the old
+get_cached_html/cache_html behaviour) and once calling ResponseCache directly.
+
+Usage: python benchmarks/cache_concurrency.py [--readers 200] [--lookups 500]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.cache import ResponseCache
+
+PAGE = "x" * 20000
+
+def make_cache(keys: int) -> ResponseCache:
+    cache = ResponseCache(f"bench-{time.perf_counter_ns()}", max_entries=keys * 2, max_bytes=1 << 30, ttl=300)
+    for i in range(keys):
+        cache.set(f"https://example.test/page/{i}", PAGE, size=len(PAGE))
+    return cache
+
+async def run(readers: int, lookups: int, keys: int, locked: bool) -> dict:
+    cache = make_cache(keys)
+    lock = asyncio.Lock()
+    stop = asyncio.Event()
+    latencies = []
+
+    async def writer():
+        i = 0
+        while not stop.is_set():
+            key = f"https://example.test/page/{i % keys}"
+            if locked:
+                async with lock:
+                    # The old critical section yielded inside the lock (print + hashing)
+                    await asyncio.sleep(0)
+                    cache.set(key, PAGE, size=len(PAGE))
+            else:
+                cache.set(key, PAGE, size=len(PAGE))
+                await asyncio.sleep(0)
+            i += 1
+
+    async def reader(n: int):
+        for i in range(lookups):
+            key = f"https://example.test/page/{(n + i) % keys}"
+            start = time.perf_counter()
+            if locked:
+                async with lock:
+                    cache.get(key)
+            else:
+                cache.get(key)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    writer_task = asyncio.create_task(writer())
+    start = time.perf_counter()
+    await asyncio.gather(*(reader(n) for n in range(readers)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await writer_task
+
+    latencies.sort()
+    total = readers * lookups
+    return {
+        "lookups_per_sec": total / elapsed,
+        "p50_us": latencies[total // 2] * 1e6,
+        "p99_us": latencies[int(total * 0.99)] * 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=200)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--keys", type=int, default=100)
+    args = parser.parse_args()
+
+    for label, locked in (("global lock", True), ("lock-free", False)):
+        result = asyncio.run(run(args.readers, args.lookups, args.keys, locked))
+        print(f"{label:12} {result['lookups_per_sec']:>12,.0f} lookups/s   "
+              f"p50 {result['p50_us']:8.1f} us   p99 {result['p99_us']:8.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Stand-in for the upstream site, used by the proxy benchmarks.
+
+Routes:
+    /dashboard, /page/{n}   HTML pages (> 1000 chars) with ETag/Last-Modified, 304 on match
+    /static/{name}.js|.css  text assets of ASSET_KB kilobytes
+    /static/{name}.woff2    binary asset of LARGE_ASSET_KB kilobytes, streamed in chunks
+    /slow/{name}.js         small asset delivered after SLOW_MS milliseconds
+    /blocked/{name}.js      403, like a Cloudflare block
+
+Usage: python benchmarks/fake_upstream.py [--port 9900]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+import uvicorn
+
+ASSET_KB = int(os.getenv("FAKE_ASSET_KB", 64))
+LARGE_ASSET_KB = int(os.getenv("FAKE_LARGE_ASSET_KB", 4096))
+SLOW_MS = int(os.getenv("FAKE_SLOW_MS", 250))
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+app = FastAPI()
+
+def _page(name: str) -> str:
+    rows = "".join(f"<li>Item {i} of {name}</li>" for i in range(200))
+    return f"<!DOCTYPE html><html><head><title>{name}</title></head><body><h1>{name}</h1><ul>{rows}</ul></body></html>"
+
+@app.get("/dashboard")
+@app.get("/page/{name}")
+async def page(request: Request, name: str = "dashboard"):
+    html = _page(name)
+    etag = '"' + hashlib.md5(html.encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(html, media_type="text/html", headers=headers)
+
+@app.get("/static/{name}.woff2")
+async def large_asset(name: str):
+    chunk = b"\0" * 65536
+
+    async def body():
+        for _ in range(LARGE_ASSET_KB // 64):
+            yield chunk
+
+    return StreamingResponse(body(), media_type="font/woff2", headers={"Content-Length": str(LARGE_ASSET_KB // 64 * 65536)})
+
+@app.get("/static/{name}.{ext}")
+async def asset(name: str, ext: str):
+    media_type = "text/css" if ext == "css" else "application/javascript"
+    return Response(b"/*" + b"x" * (ASSET_KB * 1024 - 4) + b"*/", media_type=media_type)
+
+@app.get("/slow/{name}.js")
+async def slow_asset(name: str):
+    await asyncio.sleep(SLOW_MS / 1000)
+    return Response(b"console.log('slow');", media_type="application/javascript")
+
+@app.get("/blocked/{name}.js")
+async def blocked(name: str):
+    return Response("Blocked", status_code=403)
+
+def run(host: str = "127.0.0.1", port: int = 9900):
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake upstream for proxy benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9900)
+    args = parser.parse_args()
+    run(args.host, args.port)
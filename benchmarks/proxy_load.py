@@ -0,0 +1,248 @@
+"""Load benchmark for api.proxy.router and api.simple_proxy.router.
+
+Starts benchmarks/fake_upstream.py in a separate process, points TARGET_URL at
+it, mounts the chosen router in a FastAPI app (in-process over ASGI, or under
+uvicorn on a local port) and drives concurrent load with a weighted mix of
+HTML pages, static assets, a large streamed font, slow responses and 403s.
+
+Reports p50/p95/p99 latency and req/s per scenario, how many responses were
+4xx and 429, process RSS (current and peak) and the cache/single-flight
+counters. Per-client rate limiting stays off unless RATE_LIMIT_ENABLED is set:
+all load comes from one address and would mostly be measured as 429s.
+
+Usage:
+    python benchmarks/proxy_load.py --router both --requests 5000 --concurrency 50
+    python benchmarks/proxy_load.py --router simple --mode uvicorn --json result.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+sys.path.insert(0, BENCH_DIR)
+
+# (scenario, weight, path template); {n} is replaced with a random page/asset number
+SCENARIOS = [
+    ("html", 40, "/page/{n}"),
+    ("dashboard", 10, "/dashboard"),
+    ("js", 20, "/static/app{n}.js"),
+    ("css", 10, "/static/style{n}.css"),
+    ("large_font", 5, "/static/font{n}.woff2"),
+    ("slow", 10, "/slow/widget{n}.js"),
+    ("blocked", 5, "/blocked/tracker{n}.js")
+]
+
+def _run_upstream(port: int):
+    import fake_upstream
+    fake_upstream.run(port=port)
+
+def start_upstream(port: int) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(target=_run_upstream, args=(port,), daemon=True)
+    process.start()
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/dashboard", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Fake upstream did not start")
+
+def write_bench_cookies() -> str:
+    """Fresh cookie file so the proxy's session check passes"""
+    fd, path = tempfile.mkstemp(prefix="bench_cookies_", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"timestamp": time.time(), "url": "bench", "cookies": [{"name": "session", "value": "bench"}]}, f)
+    return path
+
+def rss_mb() -> dict:
+    """Current and peak resident set size of this process"""
+    current = peak = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"rss_mb": current, "peak_rss_mb": peak}
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def build_app(router_name: str):
+    from fastapi import FastAPI
+    if router_name == "proxy":
+        from api.proxy import router
+    else:
+        from api.simple_proxy import router
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+async def drive_load(client: httpx.AsyncClient, total: int, concurrency: int, distinct: int) -> dict:
+    names = [name for name, _, _ in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    templates = {name: template for name, _, template in SCENARIOS}
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    client_errors = {name: 0 for name in names}
+    rate_limited = {name: 0 for name in names}
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            name = random.choices(names, weights)[0]
+            path = templates[name].format(n=random.randrange(distinct))
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                await response.aread()
+                if response.status_code >= 500:
+                    errors[name] += 1
+                elif response.status_code >= 400:
+                    client_errors[name] += 1  # includes the expected 403s of "blocked"
+                    if response.status_code == 429:
+                        rate_limited[name] += 1
+            except httpx.HTTPError:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {"elapsed_s": elapsed, "requests": total, "req_per_s": total / elapsed, "scenarios": {}}
+    everything = []
+    for name in names:
+        values = sorted(latencies[name])
+        everything.extend(values)
+        report["scenarios"][name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "4xx": client_errors[name],
+            "429": rate_limited[name],
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000
+        }
+    everything.sort()
+    report["p50_ms"] = percentile(everything, 0.50) * 1000
+    report["p95_ms"] = percentile(everything, 0.95) * 1000
+    report["p99_ms"] = percentile(everything, 0.99) * 1000
+    return report
+
+async def bench_router(router_name: str, args) -> dict:
+    from utils.cache import get_cache_stats
+    from utils.singleflight import get_singleflight_stats
+
+    app = build_app(router_name)
+    server = None
+    if args.mode == "uvicorn":
+        import uvicorn
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.proxy_port, log_level="warning"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.proxy_port}", timeout=60)
+    else:
+        # ASGITransport sends no lifespan events: run the startup hooks (the disk cache) ourselves
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://proxy", timeout=60)
+
+    try:
+        # Warm-up fills the caches and the upstream pool
+        await drive_load(client, min(args.requests, args.concurrency * 4), args.concurrency, args.distinct)
+        report = await drive_load(client, args.requests, args.concurrency, args.distinct)
+    finally:
+        await client.aclose()
+        if server is None:
+            await lifespan.__aexit__(None, None, None)
+        else:
+            server.should_exit = True
+            await server_task
+
+    report.update(rss_mb())
+    report["cache"] = get_cache_stats()
+    report["singleflight"] = get_singleflight_stats()
+    return report
+
+def print_report(router_name: str, report: dict):
+    print(f"\n=== {router_name} router: {report['requests']} requests in {report['elapsed_s']:.2f}s "
+          f"({report['req_per_s']:.0f} req/s) ===")
+    print(f"{'scenario':12} {'count':>7} {'errors':>7} {'4xx':>7} {'429':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in report["scenarios"].items():
+        print(f"{name:12} {stats['count']:>7} {stats['errors']:>7} {stats['4xx']:>7} {stats['429']:>7} "
+              f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+    print(f"{'all':12} {'':>7} {'':>7} {'':>7} {'':>7} {report['p50_ms']:>9.2f} {report['p95_ms']:>9.2f} {report['p99_ms']:>9.2f}")
+    print(f"RSS {report['rss_mb']} MB, peak {report['peak_rss_mb']} MB")
+    for cache, stats in report["cache"].items():
+        print(f"cache {cache}: hit ratio {stats['hit_ratio']:.2%}, {stats['entries']} entries, "
+              f"{stats['evictions']} evictions")
+
+async def bench_all(routers: list, args) -> dict:
+    # One event loop for every router: the shared session client and its
+    # lock belong to the loop that created them
+    reports = {}
+    for router_name in routers:
+        reports[router_name] = await bench_router(router_name, args)
+        print_report(router_name, reports[router_name])
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy load benchmark against a fake upstream")
+    parser.add_argument("--router", choices=["proxy", "simple", "both"], default="both")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=20, help="distinct pages/assets per scenario")
+    parser.add_argument("--upstream-port", type=int, default=9900)
+    parser.add_argument("--proxy-port", type=int, default=9901)
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    upstream = start_upstream(args.upstream_port)
+    os.environ["TARGET_URL"] = f"http://127.0.0.1:{args.upstream_port}/"
+    # Every request comes from this process; set RATE_LIMIT_ENABLED=1 to measure the limiter itself
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    # A fresh disk tier per run, so every run starts cold and leaves ./asset_cache alone
+    disk_cache_dir = tempfile.mkdtemp(prefix="bench_asset_cache_")
+    os.environ["DISK_CACHE_DIR"] = disk_cache_dir
+    cookies_file = write_bench_cookies()
+
+    import auth.session
+    auth.session.COOKIES_FILE = cookies_file
+
+    try:
+        routers = ["proxy", "simple"] if args.router == "both" else [args.router]
+        reports = asyncio.run(bench_all(routers, args))
+    finally:
+        upstream.terminate()
+        os.unlink(cookies_file)
+        shutil.rmtree(disk_cache_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Per-request routing overhead: the old inline code vs the prebuilt RoutingConfig.
+
+Times the work proxy_request does before touching the network for a mix of
+HTML and asset URLs: building the target URL (the old code re-read TARGET_URL
+from the environment), detecting the content type (an ``endswith`` chain vs a
+suffix lookup), building the upstream request headers and cleaning the
+upstream response headers (the old code rebuilt its skip set on every call).
+
+Usage: python benchmarks/request_overhead.py [--iterations 200000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+os.environ.setdefault("TARGET_URL", "https://app.stealthwriter.ai/")
+
+from config import RoutingConfig, SKIP_RESPONSE_HEADERS
+
+PATHS = ["dashboard", "static/app.js", "static/style.css", "fonts/inter.woff2", "img/logo.png", "page/42"]
+UPSTREAM_HEADERS = {
+    "content-type": "application/javascript",
+    "content-encoding": "br",
+    "content-length": "12345",
+    "cache-control": "public, max-age=31536000",
+    "etag": '"abc123"',
+    "server": "cloudflare",
+    "cf-ray": "1234-FRA",
+    "vary": "Accept-Encoding"
+}
+
+# --- the per-request code as it was before RoutingConfig ---
+
+def old_get_content_type(url: str) -> str:
+    if url.endswith('.css'):
+        return 'text/css'
+    elif url.endswith('.js'):
+        return 'application/javascript'
+    elif url.endswith('.woff') or url.endswith('.woff2'):
+        return 'font/woff2'
+    elif url.endswith('.ttf'):
+        return 'font/ttf'
+    elif url.endswith('.svg'):
+        return 'image/svg+xml'
+    elif url.endswith('.png'):
+        return 'image/png'
+    elif url.endswith('.jpg') or url.endswith('.jpeg'):
+        return 'image/jpeg'
+    elif url.endswith('.gif'):
+        return 'image/gif'
+    elif url.endswith('.ico'):
+        return 'image/x-icon'
+    else:
+        return 'text/html'
+
+def old_clean_headers(headers: dict) -> dict:
+    filtered_headers = {}
+    skip_headers = {
+        "content-encoding", "transfer-encoding", "connection",
+        "content-length", "server", "x-frame-options", "cf-ray"
+    }
+    for k, v in headers.items():
+        if k.lower() in skip_headers:
+            continue
+        if isinstance(v, str):
+            clean_value = v.replace('\n', ' ').replace('\r', ' ').strip()
+            if clean_value and len(clean_value) < 8192:
+                filtered_headers[k] = clean_value
+    return filtered_headers
+
+def old_request(path: str, query: str):
+    target_url = os.getenv("TARGET_URL").rstrip("/") + "/" + path
+    if query:
+        target_url += f"?{query}"
+    content_type = old_get_content_type(target_url)
+    headers = {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Referer": "https://app.stealthwriter.ai/dashboard",
+        "Origin": "https://app.stealthwriter.ai",
+        "Sec-Fetch-Site": "same-origin",
+        "DNT": "1"
+    }
+    if content_type == 'text/css':
+        headers["Accept"] = "text/css,*/*;q=0.1"
+    elif content_type == 'application/javascript':
+        headers["Accept"] = "*/*"
+    elif content_type.startswith('image/'):
+        headers["Accept"] = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+    response_headers = old_clean_headers(UPSTREAM_HEADERS)
+    response_headers.update({
+        "Content-Type": content_type,
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+        "Access-Control-Allow-Headers": "*",
+        "Cache-Control": "public, max-age=3600"
+    })
+    return target_url, headers, response_headers
+
+# --- the same work with RoutingConfig ---
+
+routing = RoutingConfig()
+
+def new_clean_headers(headers: dict) -> dict:
+    filtered_headers = {}
+    for k, v in headers.items():
+        if k.lower() in SKIP_RESPONSE_HEADERS:
+            continue
+        if isinstance(v, str):
+            clean_value = v.replace('\n', ' ').replace('\r', ' ').strip()
+            if clean_value and len(clean_value) < 8192:
+                filtered_headers[k] = clean_value
+    return filtered_headers
+
+def new_request(path: str, query: str):
+    target_url = routing.target_url(path, query)
+    content_type = routing.content_type(target_url)
+    headers = routing.request_headers[content_type]
+    response_headers = new_clean_headers(UPSTREAM_HEADERS)
+    response_headers.update(routing.response_headers[content_type])
+    return target_url, headers, response_headers
+
+def check_equivalent():
+    """Both versions must produce the same URL, content type and headers"""
+    for path in PATHS:
+        for query in ("", "v=3"):
+            old_url, old_headers, old_response = old_request(path, query)
+            new_url, new_headers, new_response = new_request(path, query)
+            assert old_url == new_url, (old_url, new_url)
+            assert old_get_content_type(old_url) == routing.content_type(new_url), old_url
+            if old_get_content_type(old_url) != "text/html":
+                assert old_headers == dict(new_headers), path
+                assert old_response == new_response, path
+
+def bench(fn, iterations: int) -> float:
+    def run():
+        for path in PATHS:
+            fn(path, "")
+    total = min(timeit.repeat(run, number=iterations // len(PATHS), repeat=5))
+    return total / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request routing overhead before/after RoutingConfig")
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    check_equivalent()
+    old = bench(old_request, args.iterations)
+    new = bench(new_request, args.iterations)
+    print(f"old inline routing : {old:.3f} us/request")
+    print(f"RoutingConfig      : {new:.3f} us/request")
+    print(f"speedup            : {old / new:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,29 @@
 from fastapi import APIRouter, Request, Response, HTTPException
-from auth.session import get_authenticated_client, force_refresh_session, get_session_status
+from auth.session import get_authenticated_client, force_refresh_session, get_session_status, get_cookie_status
+from auth.cookie_store import save_cookies
 from auth.selenium_login import manual_login_and_capture_cookies, load_manual_cookies
+from fastapi.responses import FileResponse
+from utils.streaming import open_upstream_stream, stream_response, close_upstream, weak_etag
+from config import upstream_settings, env_bool, get_routing, SKIP_RESPONSE_HEADERS
+from utils.cache import ResponseCache, CacheEntry, get_cache_policy, get_cache_stats
+from utils.disk_cache import DiskCache, DiskEntry, claim_worker_directory
+from utils.encoding import accepts_encoding, can_decode, decode_body_async, encoded_size, is_compressible, negotiate, precompress_async, supported_codings
+from utils.conditional import representation_response, representation_etags, variant_etag, is_not_modified, not_modified_response, head_response
+from utils.ranges import requested_ranges, range_response, memory_reader, file_reader
+from utils.helpers import run_in_background
+from utils.rate_limit import throttle, too_many_requests_response, client_limiter, RateLimited
+from utils.request_body import read_request_body, close_request_body, upstream_body, payload_too_large_response, RequestBodyTooLarge
+from utils.negative_cache import create_negative_cache, remember_failure, lookup_failure, is_cacheable_failure
+from utils.browser_pool import BrowserPool, BrowserHandle, BrowserCancelled, PoolFullError
+from utils.circuit_breaker import CircuitOpenError, get_breaker, get_breaker_stats, circuit_open_response
+from utils.metrics import content_class, observe_request, register_collector, UPSTREAM_RESPONSES, SELENIUM_DURATION
+from utils.log import get_logger, bind_request_id
+from utils.singleflight import SingleFlight, flight_key, get_singleflight_stats
+from utils import shared_state
 import os
 import asyncio
 import time
-import json
-import hashlib
-from typing import Optional
+from typing import Optional, Tuple
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -19,45 +36,77 @@ import tempfile
 import shutil
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-# Cache for HTML responses
-_html_cache = {}
-_cache_lock = asyncio.Lock()
+# Cache for HTML responses. ResponseCache operations never await, so they
+# are atomic on the event loop and need no lock.
 _cache_timeout = 300  # 5 minutes
+_html_cache = ResponseCache(
+    "html",
+    max_entries=int(os.getenv("HTML_CACHE_MAX_ENTRIES", 500)),
+    max_bytes=int(os.getenv("HTML_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=_cache_timeout
+)
+shared_state.share_cache(_html_cache)
+
+# Coalesces concurrent upstream fetches for the same page
+_html_flight = SingleFlight("html")
+
+# Recent failures (upstream errors, pages HTTPX and Selenium could not fetch),
+# so repeats are answered without redoing the expensive attempts
+_negative_cache = create_negative_cache("negative")
+
+# Second tier for static assets: content-addressed files on disk, served with
+# sendfile. Opened by open_asset_cache in each serving process, not on import
+_asset_cache = None
+
+def open_asset_cache():
+    """Startup hook: claim this worker's disk cache directory and load its index"""
+    global _asset_cache
+    if _asset_cache is not None or not env_bool("DISK_CACHE_ENABLED", True):
+        return
+    try:
+        # Each worker gets its own subdirectory, however the workers were
+        # started. DISK_CACHE_MAX_BYTES is split between WORKERS processes;
+        # workers started by other means (uvicorn --workers) each get all of it
+        disk_cache_dir = os.getenv("DISK_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "asset_cache"))
+        workers = max(1, int(os.getenv("WORKERS", 1)))
+        _asset_cache = DiskCache(
+            "assets",
+            directory=claim_worker_directory(disk_cache_dir),
+            max_bytes=int(os.getenv("DISK_CACHE_MAX_BYTES", 1024 * 1024 * 1024)) // workers,
+            max_entry_bytes=int(os.getenv("DISK_CACHE_MAX_ENTRY_BYTES", 16 * 1024 * 1024)),
+            ttl=int(os.getenv("DISK_CACHE_TTL", 3600))
+        )
+    except OSError as e:
+        logger.warning("disk_cache_disabled", error=str(e))
+        return
+    # /clear-cache in another worker empties this one's directory too
+    shared_state.on_version_change("cache:assets", _asset_cache.clear)
+
+router.add_event_handler("startup", open_asset_cache)
+
+# Start times of running Selenium fallbacks, for the in-flight metrics
+_selenium_in_flight = {}
+
+# Each Selenium fetch is a whole Chrome process: cap how many run and wait at once
+_selenium_pool = BrowserPool(
+    "selenium",
+    max_concurrent=int(os.getenv("SELENIUM_MAX_CONCURRENT", 2)),
+    max_queue=int(os.getenv("SELENIUM_MAX_QUEUE", 4)),
+    queue_timeout=float(os.getenv("SELENIUM_QUEUE_TIMEOUT", 10))
+)
+_selenium_timeout = float(os.getenv("SELENIUM_TIMEOUT", 45))
 
 def get_content_type(url: str) -> str:
     """Determine content type based on file extension"""
-    if url.endswith('.css'):
-        return 'text/css'
-    elif url.endswith('.js'):
-        return 'application/javascript'
-    elif url.endswith('.woff') or url.endswith('.woff2'):
-        return 'font/woff2'
-    elif url.endswith('.ttf'):
-        return 'font/ttf'
-    elif url.endswith('.svg'):
-        return 'image/svg+xml'
-    elif url.endswith('.png'):
-        return 'image/png'
-    elif url.endswith('.jpg') or url.endswith('.jpeg'):
-        return 'image/jpeg'
-    elif url.endswith('.gif'):
-        return 'image/gif'
-    elif url.endswith('.ico'):
-        return 'image/x-icon'
-    else:
-        return 'text/html'
+    return get_routing().content_type(url)
 
 def clean_headers(headers: dict) -> dict:
     """Clean and filter response headers"""
     filtered_headers = {}
-    skip_headers = {
-        "content-encoding", "transfer-encoding", "connection", 
-        "content-length", "server", "x-frame-options", "cf-ray"
-    }
-    
     for k, v in headers.items():
-        if k.lower() in skip_headers:
+        if k.lower() in SKIP_RESPONSE_HEADERS:
             continue
         
         if isinstance(v, str):
@@ -67,6 +116,106 @@ def clean_headers(headers: dict) -> dict:
     
     return filtered_headers
 
+def _variant_etag(entry: DiskEntry, coding: str) -> str:
+    """ETag of one precompressed copy: the entry's own with the coding appended, else the blob digest"""
+    if entry.etag:
+        return variant_etag(entry.etag, coding)
+    return f'"{entry.variants[coding][0][:32]}"'
+
+async def disk_asset_response(entry: DiskEntry, request: Request) -> Response:
+    """Serve an asset from the disk cache (zero-copy where the server supports it)"""
+    headers = dict(get_routing().response_headers[entry.content_type])
+    accept_encoding = request.headers.get("accept-encoding")
+    decode = entry.encoding is not None and not accepts_encoding(accept_encoding, entry.encoding)
+    # Same validator the miss sent (see cache_asset); without one from upstream
+    # the blob digest is already a strong validator
+    if entry.etag:
+        etag = weak_etag(entry.etag) if decode else entry.etag
+    else:
+        etag = f'"{entry.digest[:32]}{"-identity" if decode else ""}"'
+    headers["ETag"] = etag
+    digest, size, coding = entry.digest, entry.size, entry.encoding
+    if entry.variants:
+        # A decoded body with precompressed copies: pick the one this client prefers
+        variant = negotiate(accept_encoding, [c for c in supported_codings() if c in entry.variants])
+        if variant:
+            (digest, size), coding = entry.variants[variant], variant
+            headers["ETag"] = _variant_etag(entry, variant)
+    if entry.encoding or entry.variants:
+        headers["Vary"] = "Accept-Encoding"
+        if coding and not decode:
+            headers["Content-Encoding"] = coding
+    if entry.last_modified:
+        headers["Last-Modified"] = entry.last_modified
+    if is_not_modified(request.headers, headers["ETag"], entry.last_modified):
+        return not_modified_response(headers)
+    if headers["ETag"] != etag and is_not_modified(request.headers, etag, entry.last_modified):
+        # The client holds the uncompressed copy from the miss; it is still current
+        return not_modified_response(dict(headers, ETag=etag))
+
+    headers["Accept-Ranges"] = "bytes"
+
+    if decode:
+        # The stored copy is compressed and this client cannot take it: decode one for it
+        content = await decode_body_async(await _asset_cache.read(entry), entry.encoding)
+        size, read = len(content), memory_reader(content)
+    else:
+        content = None
+        read = file_reader(_asset_cache.blob_path(digest))
+
+    if request.method == "HEAD":
+        return head_response(headers, size)
+    ranges = requested_ranges(request.headers, size, headers["ETag"], entry.last_modified)
+    if ranges is not None:
+        return range_response(ranges, size, headers, read)
+    if content is not None:
+        return Response(content=content, headers=headers, media_type=entry.content_type)
+    return FileResponse(_asset_cache.blob_path(digest), headers=headers, media_type=entry.content_type)
+
+async def head_upstream(target_url: str, content_type: str) -> Response:
+    """Status and headers for HEAD on a page we have not fetched yet.
+
+    GET answers with the proxy's own copy (rewritten, compressed for the
+    client, tagged with our ETag), so upstream's ETag, Content-Encoding and
+    Content-Length describe a different body. Mirror the headers GET would
+    send and leave out those that depend on a body we do not have.
+    """
+    client = await get_authenticated_client()
+    response = await get_breaker(target_url).call(
+        lambda: open_upstream_stream(client, "HEAD", target_url, headers=get_routing().request_headers[content_type])
+    )
+    await close_upstream(response)
+    UPSTREAM_RESPONSES.inc("proxy", str(response.status_code))
+    headers = dict(get_routing().response_headers[content_type])
+    headers["Vary"] = "Accept-Encoding"
+    if response.status_code == 200:
+        if response.headers.get("last-modified"):
+            headers["Last-Modified"] = response.headers["last-modified"]
+        headers["Accept-Ranges"] = "bytes"
+    head = Response(status_code=response.status_code, headers=headers)
+    del head.headers["content-length"]  # Starlette sets 0 for the empty body; the length is unknown
+    return head
+
+def cache_asset(target_url: str, content_type: str, upstream_headers):
+    """Build the on_body callback that stores a streamed asset (as sent, maybe compressed) on disk.
+
+    The entry keeps the ETag the client was sent with it: upstream's, or its
+    weak form when stream_response decoded the body.
+    """
+    etag = upstream_headers.get("etag")
+    upstream_encoding = upstream_headers.get("content-encoding")
+    last_modified = upstream_headers.get("last-modified")
+    ttl = get_cache_policy(content_type).ttl
+
+    async def store(content: bytes, encoding: Optional[str]):
+        # Decoded text assets also get gzip/brotli copies, so hits need no compression work
+        encoded = await precompress_async(content) if encoding is None and is_compressible(content_type) else None
+        await _asset_cache.put(target_url, content, content_type,
+                               weak_etag(etag) if upstream_encoding and not encoding else etag,
+                               last_modified, ttl, encoding, encoded)
+
+    return lambda content, encoding: run_in_background(store(content, encoding))
+
 def handle_403_response(target_url: str) -> Response:
     """Handle Cloudflare 403 responses with helpful error page"""
     error_html = f"""
@@ -147,29 +296,45 @@ def handle_403_response(target_url: str) -> Response:
     """
     return Response(content=error_html, status_code=403, headers={"Content-Type": "text/html"})
 
-async def get_cached_html(url: str) -> Optional[str]:
-    """Check if we have cached HTML for this URL"""
-    async with _cache_lock:
-        cache_key = hashlib.md5(url.encode()).hexdigest()
-        if cache_key in _html_cache:
-            cached_data = _html_cache[cache_key]
-            if time.time() - cached_data['timestamp'] < _cache_timeout:
-                print(f"📋 Cache hit for: {url}")
-                return cached_data['html']
-            else:
-                # Remove expired cache
-                del _html_cache[cache_key]
-        return None
-
-async def cache_html(url: str, html: str):
-    """Cache HTML response"""
-    async with _cache_lock:
-        cache_key = hashlib.md5(url.encode()).hexdigest()
-        _html_cache[cache_key] = {
-            'html': html,
-            'timestamp': time.time()
-        }
-        print(f"💾 Cached response for: {url}")
+async def get_cached_html(url: str) -> Optional[CacheEntry]:
+    """Check if we have cached HTML for this URL (fresh, or stale but still servable)"""
+    entry = await shared_state.lookup(_html_cache, url)
+    if entry is not None:
+        logger.info("cache_hit", url=url, stale=entry.is_stale())
+    return entry
+
+async def cache_html(url: str, html: str, upstream_headers=None):
+    """Cache HTML response along with the upstream validators used to revalidate it"""
+    policy = get_cache_policy("text/html")
+    upstream_headers = upstream_headers or {}
+    value = {
+        'html': html,
+        'etag': upstream_headers.get("etag"),
+        'last_modified': upstream_headers.get("last-modified")
+    }
+    shared_state.store(_html_cache, url, value, size=len(html), ttl=policy.ttl, stale_ttl=policy.stale_ttl)
+    logger.debug("cached_response", url=url, bytes=len(html))
+    run_in_background(_precompress_html(url, value))
+
+async def _precompress_html(url: str, value: dict):
+    """Attach gzip/brotli copies and their ETags to a cached page so hits need no compression work"""
+    raw = value['html'].encode()
+    encoded = await precompress_async(raw)
+    etags = await asyncio.get_running_loop().run_in_executor(None, representation_etags, raw, encoded)
+    entry = _html_cache.peek(url)
+    if entry is None or entry.value is not value:
+        return  # the page was replaced while we compressed
+    policy = get_cache_policy("text/html")
+    shared_state.store(_html_cache, url, dict(value, encoded=encoded, etags=etags),
+                       size=len(value['html']) + encoded_size(encoded), ttl=policy.ttl, stale_ttl=policy.stale_ttl)
+
+async def html_response(request: Request, html: str, cached: dict = None) -> Response:
+    """HTML for this client: compressed, with a strong ETag, answering 304s and HEAD"""
+    cached = cached or {}
+    return await representation_response(
+        request, html.encode(), get_routing().response_headers["text/html"],
+        encoded=cached.get('encoded'), etags=cached.get('etags'), last_modified=cached.get('last_modified')
+    )
 
 def setup_chrome_for_ec2():
     """Setup Chrome options optimized for EC2 Linux environment"""
@@ -221,8 +386,13 @@ def setup_chrome_for_ec2():
     
     return options, temp_dir
 
-def fetch_html_with_selenium(url: str, cookies: list) -> str:
-    """Use Selenium to fetch HTML content - OPTIMIZED FOR EC2"""
+def fetch_html_with_selenium(url: str, cookies: list, handle: BrowserHandle = None) -> str:
+    """Use Selenium to fetch HTML content - OPTIMIZED FOR EC2
+
+    With a ``handle`` (from the Selenium pool) the fetch can be aborted from
+    outside: the browser is killed and the waits below end early.
+    """
+    handle = handle or BrowserHandle()
     options, temp_dir = setup_chrome_for_ec2()
     
     # Try to find Chrome binary
@@ -242,7 +412,7 @@ def fetch_html_with_selenium(url: str, cookies: list) -> str:
     
     if chrome_binary:
         options.binary_location = chrome_binary
-        print(f"🔍 Using Chrome binary: {chrome_binary}")
+        logger.debug("chrome_binary", path=chrome_binary)
     
     driver = None
     try:
@@ -251,14 +421,15 @@ def fetch_html_with_selenium(url: str, cookies: list) -> str:
         
         # Reduced timeouts for faster failure
         driver = webdriver.Chrome(service=service, options=options)
+        handle.attach(driver.service.process.pid)
         driver.set_page_load_timeout(15)  # Reduced from 30
         driver.implicitly_wait(5)  # Reduced from 10
         
-        print(f"🌐 Loading base URL...")
+        logger.debug("selenium_loading_base_url")
         driver.get("https://app.stealthwriter.ai/")
         
         # Quick cookie addition
-        print(f"🍪 Adding {len(cookies)} cookies...")
+        logger.debug("selenium_adding_cookies", count=len(cookies))
         for cookie in cookies[:10]:  # Limit to first 10 cookies
             try:
                 cookie_dict = {
@@ -269,18 +440,19 @@ def fetch_html_with_selenium(url: str, cookies: list) -> str:
                 }
                 driver.add_cookie(cookie_dict)
             except Exception as e:
-                print(f"⚠️ Cookie add failed: {e}")
+                logger.warning("selenium_cookie_add_failed", error=str(e))
                 continue
                 
-        print(f"🎯 Navigating to target: {url}")
+        handle.check()
+        logger.debug("selenium_navigating", url=url)
         driver.get(url)
         
         # Quick wait - no fancy detection
-        print("⏳ Waiting for page load...")
-        time.sleep(8)  # Simple wait instead of complex detection
+        logger.debug("selenium_waiting_for_page_load")
+        handle.wait(8)  # Simple wait instead of complex detection, cut short if cancelled
         
         html = driver.page_source
-        print(f"📄 Retrieved HTML ({len(html)} characters)")
+        logger.info("selenium_retrieved_html", characters=len(html))
         
         # Basic validation
         if len(html) < 1000:
@@ -289,7 +461,9 @@ def fetch_html_with_selenium(url: str, cookies: list) -> str:
         return html
         
     except Exception as e:
-        print(f"❌ Selenium error: {str(e)}")
+        if handle.cancelled:
+            raise BrowserCancelled("Selenium fetch cancelled")
+        logger.error("selenium_error", error=str(e))
         raise Exception(f"Selenium fetch failed: {str(e)}")
     finally:
         if driver:
@@ -304,171 +478,324 @@ def fetch_html_with_selenium(url: str, cookies: list) -> str:
         except:
             pass
 
-@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
+async def fetch_html(method: str, target_url: str, body, params, cookies: list, cached: dict = None,
+                     fallback: bool = True) -> Tuple[Optional[str], str]:
+    """Fetch and cache an HTML page via HTTPX, falling back to Selenium.
+
+    Returns ``(html, source)`` where source names the path that produced it
+    ('revalidated', 'httpx' or 'selenium'); html is None if both fail, or with
+    source 'circuit_open' when the upstream's circuit breaker refused the call.
+    If ``cached`` (a cache value from cache_html) is given, the HTTPX request is
+    made conditional on its ETag/Last-Modified and a 304 just refreshes it.
+    Without ``fallback`` (background revalidation) only HTTPX is tried.
+    """
+    breaker = get_breaker(target_url)
+    status = None  # upstream status of a failed HTTPX attempt, for the negative cache TTL
+    # 1. Try HTTPX first (faster and more reliable)
+    try:
+        client = await get_authenticated_client()
+        headers = get_routing().request_headers["text/html"]
+        if cached and get_cache_policy("text/html").revalidate:
+            headers = dict(headers)
+            if cached.get('etag'):
+                headers["If-None-Match"] = cached['etag']
+            if cached.get('last_modified'):
+                headers["If-Modified-Since"] = cached['last_modified']
+        
+        response = await breaker.call(lambda: client.request(
+            method,
+            target_url,
+            params=params,
+            timeout=upstream_settings.html_timeout,
+            **upstream_body(body, headers)
+        ))
+        UPSTREAM_RESPONSES.inc("proxy", str(response.status_code))
+
+        if response.status_code == 304 and cached:
+            logger.info("revalidated", url=target_url)
+            if not shared_state.touch(_html_cache, target_url):
+                await cache_html(target_url, cached['html'], response.headers)
+            return cached['html'], "revalidated"
+        
+        # If HTTPX succeeds and content looks good
+        if (response.status_code == 200 and 
+            len(response.text) > 1000 and
+            "Verifying you are human" not in response.text and
+            "Cloudflare" not in response.text):
+            
+            logger.info("httpx_success", url=target_url)
+            await cache_html(target_url, response.text, response.headers)
+            return response.text, "httpx"
+        else:
+            logger.warning("httpx_challenge_or_error", url=target_url, status=response.status_code)
+            if response.status_code != 200:
+                status = response.status_code
+            
+    except CircuitOpenError:
+        return None, "circuit_open"
+    except RequestBodyTooLarge:
+        raise  # the client's fault, a browser retry would not help
+    except Exception as e:
+        logger.warning("httpx_failed", url=target_url, error=str(e))
+
+    if not fallback:
+        # A stale copy is still being served: not worth launching a browser for
+        return None, "failed"
+
+    if breaker.rejecting():
+        # The upstream is down, a browser would only wait on it too
+        logger.warning("selenium_skipped_circuit_open", url=target_url)
+        return None, "circuit_open"
+    
+    # 2. Try Selenium as last resort (but with better error handling)
+    token = object()
+    _selenium_in_flight[token] = time.perf_counter()
+    outcome = "error"
+    try:
+        logger.info("selenium_attempt", url=target_url)
+        
+        # Bounded pool; on timeout the browser is killed, not left running
+        html = await _selenium_pool.run(fetch_html_with_selenium, target_url, cookies, timeout=_selenium_timeout)
+        
+        outcome = "success"
+        await cache_html(target_url, html)
+        return html, "selenium"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.error("selenium_timeout", url=target_url)
+    except PoolFullError as e:
+        outcome = "rejected"
+        logger.warning("selenium_rejected", url=target_url, reason=str(e))
+    except Exception as e:
+        logger.error("selenium_fetch_failed", url=target_url, error=str(e))
+    finally:
+        SELENIUM_DURATION.observe(time.perf_counter() - _selenium_in_flight.pop(token), outcome)
+    if method == "GET" and outcome != "rejected":
+        # Both attempts really ran and failed: don't run them again for a while
+        remember_failure(_negative_cache, target_url, {'status_code': status}, status)
+    return None, "failed"
+
+def _collect_selenium_metrics():
+    now = time.perf_counter()
+    oldest = max((now - started for started in _selenium_in_flight.values()), default=0)
+    yield "proxy_selenium_fetches_in_flight", "gauge", "Selenium fallback fetches currently running", {}, len(_selenium_in_flight)
+    yield "proxy_selenium_oldest_in_flight_seconds", "gauge", "Age of the longest-running Selenium fetch", {}, oldest
+    stats = _selenium_pool.stats()
+    yield "proxy_selenium_pool_running", "gauge", "Browsers currently running in the Selenium pool", {}, stats["running"]
+    yield "proxy_selenium_pool_waiting", "gauge", "Fetches queued for a Selenium pool slot", {}, stats["waiting"]
+    yield "proxy_selenium_pool_rejected_total", "counter", "Fetches rejected because the Selenium pool was saturated", {}, stats["rejected"]
+    yield "proxy_selenium_pool_killed_total", "counter", "Browsers killed after a timeout or cancellation", {}, stats["killed"]
+
+register_collector(_collect_selenium_metrics)
+
 async def proxy_request(path: str, request: Request):
     """Main proxy endpoint with improved error handling"""
+    started = time.perf_counter()
+    request_id = bind_request_id(request.headers.get("x-request-id"))
+    labels = {"content": "other", "source": "error"}
+    status_code = 500
+    try:
+        response = await _proxy_request(path, request, labels)
+        response.headers["X-Request-ID"] = request_id
+        status_code = response.status_code
+        return response
+    finally:
+        observe_request("proxy", labels, status_code, started)
+
+async def _proxy_request(path: str, request: Request, labels: dict):
+    """Serve one proxied request, recording the content class and serving path in ``labels``"""
     try:
         # Check session status
-        session_status = await get_session_status()
-        cookie_status = session_status.get("cookie_status", {})
+        cookie_status = get_cookie_status()
         
         if not cookie_status.get("exists") or cookie_status.get("expired", True):
+            labels["source"] = "no_session"
             return handle_403_response("Session unavailable")
 
         # Handle root path
         if path == "" or path == "/":
             path = "dashboard"
         
-        target_url = os.getenv("TARGET_URL").rstrip("/") + "/" + path
-        
-        # Add query parameters
-        if request.query_params:
-            query_string = str(request.query_params)
-            target_url += f"?{query_string}"
-
-        content_type = get_content_type(target_url)
+        routing = get_routing()
+        target_url = routing.target_url(path, str(request.query_params) if request.query_params else "")
+        content_type = routing.content_type(target_url)
+        labels["content"] = content_class(content_type)
         
         # For HTML pages: Try cache first, then HTTPX, fallback gracefully
         if content_type == "text/html":
             
-            # 1. Check cache first
-            cached_html = await get_cached_html(target_url)
-            if cached_html:
-                return Response(
-                    content=cached_html,
-                    status_code=200,
-                    headers={
-                        "Content-Type": "text/html",
-                        "Access-Control-Allow-Origin": "*",
-                        "Cache-Control": "no-cache"
-                    }
-                )
+            policy = get_cache_policy(content_type)
+            cookies = cookie_status.get("cookies", [])
+
+            # 1. Check cache first. While the upstream's circuit is open any
+            # copy we still hold is served, however stale
+            breaker = get_breaker(target_url)
+            cached = await get_cached_html(target_url)
+            if cached is not None and (not cached.is_stale() or policy.stale_while_revalidate or breaker.rejecting()):
+                if cached.is_stale() and not breaker.rejecting():
+                    # Serve the stale copy now and refresh it in the background,
+                    # HTTPX only: a challenge must not start Chrome on every stale hit.
+                    # Its own flight key, so a real miss never joins an HTTPX-only fetch
+                    run_in_background(_html_flight.do(
+                        flight_key("REVALIDATE", target_url),
+                        lambda: fetch_html("GET", target_url, b"", None, cookies, cached.value, fallback=False)
+                    ))
+                labels["source"] = "cache_stale" if cached.is_stale() else "cache_hit"
+                return await html_response(request, cached.value['html'], cached.value)
+
+            if breaker.rejecting():
+                labels["source"] = "circuit_open"
+                return circuit_open_response(breaker)
+
+            if request.method in ("GET", "HEAD") and await lookup_failure(_negative_cache, target_url) is not None:
+                labels["source"] = "negative_hit"
+                return handle_403_response(target_url)
+
+            # Everything below uses the shared upstream session
+            await throttle(request)
+
+            if request.method == "HEAD":
+                # Nothing cached: ask upstream for the headers only, no body transfer
+                labels["source"] = "head"
+                return await head_upstream(target_url, content_type)
             
-            # 2. Try HTTPX first (faster and more reliable)
+            # 2. Fetch from upstream. Concurrent misses for the same page
+            # share one HTTPX attempt (and at most one Selenium fallback)
+            body = await read_request_body(request)
+            stale_value = cached.value if cached is not None and request.method == "GET" else None
+            fetch = lambda: fetch_html(request.method, target_url, body, request.query_params, cookies, stale_value)
             try:
-                client = await get_authenticated_client()
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-                    "Accept-Language": "en-US,en;q=0.9",
-                    "Accept-Encoding": "gzip, deflate, br",
-                    "Referer": "https://app.stealthwriter.ai/dashboard",
-                    "Origin": "https://app.stealthwriter.ai",
-                    "Sec-Fetch-Site": "same-origin",
-                    "DNT": "1"
-                }
-                
-                body = await request.body()
-                response = await client.request(
-                    request.method,
-                    target_url,
-                    headers=headers,
-                    content=body,
-                    params=request.query_params,
-                    timeout=15  # Reasonable timeout
-                )
-                
-                # If HTTPX succeeds and content looks good
-                if (response.status_code == 200 and 
-                    len(response.text) > 1000 and
-                    "Verifying you are human" not in response.text and
-                    "Cloudflare" not in response.text):
-                    
-                    print(f"⚡ HTTPX success for: {target_url}")
-                    await cache_html(target_url, response.text)
-                    return Response(
-                        content=response.text,
-                        status_code=200,
-                        headers={
-                            "Content-Type": "text/html",
-                            "Access-Control-Allow-Origin": "*",
-                            "Cache-Control": "no-cache"
-                        }
-                    )
+                if request.method == "GET":
+                    (html, source), shared = await _html_flight.do(flight_key(request.method, target_url), fetch)
+                    if shared:
+                        logger.info("coalesced_fetch", url=target_url)
+                        source = "coalesced"
                 else:
-                    print(f"🔄 HTTPX got challenge/error, status: {response.status_code}")
-                    
-            except Exception as e:
-                print(f"⚠️ HTTPX failed: {str(e)}")
-            
-            # 3. Try Selenium as last resort (but with better error handling)
-            try:
-                cookies = cookie_status.get("cookies", [])
-                print(f"🤖 Attempting Selenium for: {target_url}")
-                
-                # Run in executor with timeout
-                html = await asyncio.wait_for(
-                    asyncio.get_event_loop().run_in_executor(
-                        None, fetch_html_with_selenium, target_url, cookies
-                    ),
-                    timeout=45  # 45 second timeout for entire operation
-                )
-                
-                await cache_html(target_url, html)
-                return Response(
-                    content=html,
-                    status_code=200,
-                    headers={
-                        "Content-Type": "text/html",
-                        "Access-Control-Allow-Origin": "*",
-                        "Cache-Control": "no-cache"
-                    }
-                )
-            except asyncio.TimeoutError:
-                print(f"❌ Selenium timeout for: {target_url}")
-                return handle_403_response(target_url)
-            except Exception as e:
-                print(f"❌ Selenium fetch failed: {str(e)}")
+                    html, source = await fetch()
+            except Exception:
+                await close_request_body(body)
+                raise
+            # Unsent if the breaker refused the call, HTTPX failed early or another fetch was joined
+            # (not on cancellation: a shared fetch may still be sending it)
+            await close_request_body(body)
+            labels["source"] = source
+
+            if html is None:
+                if source == "circuit_open":
+                    return circuit_open_response(breaker)
                 return handle_403_response(target_url)
+            # Answer with what the next hit will send: upstream's Last-Modified, the same ETags
+            stored = _html_cache.peek(target_url)
+            return await html_response(request, html, stored.value if stored is not None and stored.value['html'] == html else None)
         
         # For non-HTML assets: Use HTTPX only
         else:
+            headers = routing.request_headers[content_type]
+
+            accept_encoding = request.headers.get("accept-encoding")
+            disk_entry = None
+            if request.method in ("GET", "HEAD") and _asset_cache is not None:
+                disk_entry = await _asset_cache.lookup(target_url)
+                if disk_entry is not None and not (accepts_encoding(accept_encoding, disk_entry.encoding)
+                                                   or can_decode(disk_entry.encoding)):
+                    disk_entry = None  # e.g. a br copy without the brotli module: refetch decoded
+                if disk_entry is not None:
+                    if disk_entry.is_fresh() or get_breaker(target_url).rejecting():
+                        # Expired copies are still better than waiting on a failing upstream
+                        _asset_cache.record_hit()
+                        labels["source"] = "disk_hit" if disk_entry.is_fresh() else "disk_stale"
+                        return await disk_asset_response(disk_entry, request)
+                    # Expired on disk: ask upstream whether our copy is still current
+                    headers = dict(headers)
+                    if disk_entry.etag:
+                        headers["If-None-Match"] = disk_entry.etag
+                    if disk_entry.last_modified:
+                        headers["If-Modified-Since"] = disk_entry.last_modified
+
+            if request.method in ("GET", "HEAD"):
+                failure = await lookup_failure(_negative_cache, target_url)
+                if failure is not None:
+                    labels["source"] = "negative_hit"
+                    return Response(
+                        content=failure.value['content'] if request.method == "GET" else b"",
+                        status_code=failure.value['status_code'],
+                        headers=failure.value['headers']
+                    )
+
+            client_range = request.headers.get("range")
+            if client_range and request.method == "GET" and disk_entry is None:
+                # Miss: let upstream cut the range, unencoded so the offsets match what we send
+                headers = dict(headers, Range=client_range, **{"Accept-Encoding": "identity"})
+                if "if-range" in request.headers:
+                    headers["If-Range"] = request.headers["if-range"]
+
+            await throttle(request)
             client = await get_authenticated_client()
-            headers = {
-                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Referer": "https://app.stealthwriter.ai/dashboard",
-                "Origin": "https://app.stealthwriter.ai",
-                "Sec-Fetch-Site": "same-origin",
-                "DNT": "1"
-            }
-            
-            # Set Accept header based on content type
-            if content_type == 'text/css':
-                headers["Accept"] = "text/css,*/*;q=0.1"
-            elif content_type == 'application/javascript':
-                headers["Accept"] = "*/*"
-            elif content_type.startswith('image/'):
-                headers["Accept"] = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
-
-            body = await request.body()
-            response = await client.request(
-                request.method,
-                target_url,
-                headers=headers,
-                content=body,
-                params=request.query_params,
-                timeout=30
-            )
+            body = await read_request_body(request)
+            # Stream the asset instead of buffering it: the client gets the
+            # first bytes as soon as upstream sends them
+            try:
+                response = await get_breaker(target_url).call(lambda: open_upstream_stream(
+                    client,
+                    request.method,
+                    target_url,
+                    params=request.query_params,
+                    **upstream_body(body, headers)
+                ))
+            except Exception:
+                await close_request_body(body)  # e.g. CircuitOpenError: never sent
+                raise
+            UPSTREAM_RESPONSES.inc("proxy", str(response.status_code))
+
+            if response.status_code == 304 and disk_entry is not None:
+                await close_upstream(response)
+                _asset_cache.touch(target_url)
+                _asset_cache.record_hit(revalidated=True)
+                labels["source"] = "disk_revalidated"
+                return await disk_asset_response(disk_entry, request)
+            labels["source"] = "stream"
             
             filtered_headers = clean_headers(response.headers)
-            filtered_headers.update({
-                "Content-Type": content_type,
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-                "Cache-Control": "public, max-age=3600"
-            })
-            
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=filtered_headers
+            filtered_headers.update(routing.response_headers[content_type])
+            if "location" in filtered_headers:
+                # An unfollowed redirect (the body was streamed): send the client back through us
+                filtered_headers["location"] = routing.proxy_location(filtered_headers["location"])
+            if response.status_code == 206 and "content-length" in response.headers and not response.headers.get("content-encoding"):
+                filtered_headers["Content-Length"] = response.headers["content-length"]
+
+            if request.method == "GET" and is_cacheable_failure(response.status_code, response.headers.get("content-length")):
+                # Small error bodies are buffered and remembered for a short while
+                try:
+                    content = await response.aread()
+                finally:
+                    await close_upstream(response)
+                value = {'status_code': response.status_code, 'content': content, 'headers': filtered_headers}
+                remember_failure(_negative_cache, target_url, value, response.status_code, size=len(content))
+                labels["source"] = "upstream"
+                return Response(content=content, status_code=response.status_code, headers=filtered_headers)
+
+            # Keep a copy of complete 200 GET bodies on disk for the next request
+            on_body = None
+            if request.method == "GET" and response.status_code == 200 and _asset_cache is not None:
+                on_body = cache_asset(target_url, content_type, response.headers)
+            return stream_response(
+                response, filtered_headers,
+                on_body=on_body, max_body=_asset_cache.max_entry_bytes if _asset_cache is not None else 0,
+                accept_encoding=accept_encoding
             )
             
+    except CircuitOpenError as e:
+        labels["source"] = "circuit_open"
+        return circuit_open_response(e.breaker)
+    except RequestBodyTooLarge as e:
+        labels["source"] = "too_large"
+        return payload_too_large_response(e)
+    except RateLimited as e:
+        labels["source"] = "rate_limited"
+        return too_many_requests_response(e)
     except Exception as e:
-        print(f"❌ Proxy error: {str(e)}")
+        logger.error("proxy_error", error=str(e))
+        labels["source"] = "error"
         return handle_403_response(f"Proxy error: {str(e)}")
 
 @router.get("/session-status")
@@ -479,13 +806,19 @@ async def session_status():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@router.get("/proxy-stats")
+async def proxy_stats():
+    """Cache and request-coalescing counters"""
+    return {"cache": get_cache_stats(), "singleflight": get_singleflight_stats(), "circuit_breakers": get_breaker_stats(),
+            "selenium_pool": _selenium_pool.stats(), "rate_limit": client_limiter.stats()}
+
 @router.post("/refresh-session")
 async def refresh_session():
     """Force refresh session"""
     try:
         # Clear cache when refreshing session
-        async with _cache_lock:
-            _html_cache.clear()
+        await shared_state.clear(_html_cache)
+        await shared_state.clear(_negative_cache)
         await force_refresh_session()
         return {"status": "success", "message": "Session refreshed successfully"}
     except Exception as e:
@@ -493,12 +826,17 @@ async def refresh_session():
 
 @router.post("/clear-cache")
 async def clear_cache():
-    """Clear HTML cache"""
+    """Clear the HTML, negative and disk asset caches"""
     try:
-        async with _cache_lock:
-            cache_count = len(_html_cache)
-            _html_cache.clear()
-        return {"status": "success", "message": f"Cleared {cache_count} cached pages"}
+        stats = _html_cache.stats()
+        cache_count = await shared_state.clear(_html_cache)
+        await shared_state.clear(_negative_cache)
+        asset_count = 0
+        if _asset_cache is not None:
+            asset_count = await _asset_cache.clear()
+            await shared_state.bump("cache:assets")
+        return {"status": "success", "message": f"Cleared {cache_count} cached pages and {asset_count} cached assets",
+                "cache_stats": stats}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -516,22 +854,26 @@ async def update_cookies_endpoint(request: Request):
             "cookies": body["cookies"]
         }
         
-        PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        COOKIES_FILE_PATH = os.path.join(PROJECT_ROOT, "manual_cookies.json")
-        
-        with open(COOKIES_FILE_PATH, "w") as f:
-            json.dump(cookies_data, f, indent=2)
+        # Atomic write (temp file + fsync + rename) off the event loop
+        version = await save_cookies(cookies_data)
+        # Other workers reload on their next shared-state poll
+        await shared_state.bump("cookies")
         
-        # Clear cache when updating cookies
-        async with _cache_lock:
-            _html_cache.clear()
+        # Clear cache when updating cookies (remembered 403s included)
+        await shared_state.clear(_html_cache)
+        await shared_state.clear(_negative_cache)
+        # Reloads the cookie file and swaps the client's cookie jar
         await force_refresh_session()
         
         return {
             "status": "success",
             "message": f"Updated {len(body['cookies'])} cookies and refreshed session",
-            "cookie_count": len(body["cookies"])
+            "cookie_count": len(body["cookies"]),
+            "version": version
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update cookies: {str(e)}")
+
+# Registered last so the management endpoints above are not shadowed by the catch-all
+router.add_api_route("/{path:path}", proxy_request, methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
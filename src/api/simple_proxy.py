@@ -1,28 +1,230 @@
 from fastapi import APIRouter, Request, Response, HTTPException
-from auth.session import get_authenticated_client, force_refresh_session, get_session_status
+from auth.session import get_authenticated_client, force_refresh_session, get_session_status, get_cookie_status
+from utils.streaming import open_upstream_stream, stream_response, close_upstream, read_up_to
+from utils.cache import ResponseCache, get_cache_policy
+from utils.helpers import run_in_background, parse_content_length
+from utils.rate_limit import throttle, too_many_requests_response, RateLimited
+from utils.request_body import read_request_body, close_request_body, upstream_body, payload_too_large_response, RequestBodyTooLarge
+from utils.negative_cache import create_negative_cache, remember_failure, lookup_failure, is_cacheable_failure
+from utils.circuit_breaker import CircuitOpenError, get_breaker, circuit_open_response
+from utils.metrics import content_class, observe_request, UPSTREAM_RESPONSES
+from utils.log import get_logger, bind_request_id
+from utils.singleflight import SingleFlight
+from config import get_routing, accept_header, MIME_TYPES
+from utils.encoding import is_compressible, encoded_size, precompress_async
+from utils.conditional import representation_response, representation_etags
+from types import MappingProxyType
+from utils import shared_state
 import os
 import asyncio
 import time
 import json
-import hashlib
 from typing import Optional
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # Cache for responses
-_response_cache = {}
-_cache_lock = asyncio.Lock()
+# No lock: ResponseCache operations never await, so they are atomic on the event loop
 _cache_timeout = 600  # 10 minutes
+_cache_max_entry_bytes = int(os.getenv("CACHE_MAX_ENTRY_BYTES", 1024 * 1024))  # larger bodies are streamed
+_response_cache = ResponseCache(
+    "simple",
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 100)),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=_cache_timeout
+)
+shared_state.share_cache(_response_cache)
+_upstream_flight = SingleFlight("simple")
+# Recent upstream errors, kept apart so they never evict good responses
+_negative_cache = create_negative_cache("simple_negative")
+
+# Enhanced headers to look more like a real browser, built once per content type
+_browser_headers = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-User": "?1",
+    "Sec-Fetch-Dest": "document",
+    "Upgrade-Insecure-Requests": "1",
+    "DNT": "1",
+    "Referer": "https://app.stealthwriter.ai/dashboard",
+}
+_request_headers = {"text/html": MappingProxyType(_browser_headers)}
+for _content_type in set(MIME_TYPES.values()):
+    _accept = accept_header(_content_type)
+    _request_headers[_content_type] = MappingProxyType(dict(_browser_headers, Accept=_accept) if _accept else _browser_headers)
+
+# Client response headers for paths without a static suffix; Content-Type comes from upstream
+_dynamic_response_headers = MappingProxyType({
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Cache-Control": "no-cache"
+})
+
+def _is_cacheable(method: str, response) -> bool:
+    """Successful GET responses not known to be too large are read for the cache (up to the cap)"""
+    if method != "GET" or response.status_code != 200:
+        return False
+    content_length = parse_content_length(response.headers.get("content-length"))
+    return content_length is None or content_length <= _cache_max_entry_bytes
+
+async def fetch_upstream(method: str, path: str, target_url: str, body, params, cache_key: str,
+                         cached: dict = None, range_headers: dict = None) -> dict:
+    """Fetch from upstream and return a cache entry, or an entry holding an open 'stream'.
+
+    With a ``cached`` entry the request is conditional on its validators and a
+    304 refreshes and returns that entry. ``range_headers`` (Range/If-Range)
+    are forwarded as-is; a 206 is always streamed, never cached.
+    """
+    # Make request with authenticated client
+    client = await get_authenticated_client()
+
+    headers = _request_headers[get_routing().content_type(path)]
+
+    if cached and get_cache_policy(cached['headers']["Content-Type"]).revalidate:
+        headers = dict(headers)
+        if cached.get('etag'):
+            headers["If-None-Match"] = cached['etag']
+        if cached.get('last_modified'):
+            headers["If-Modified-Since"] = cached['last_modified']
+    if range_headers:
+        # Unencoded, so the byte offsets match what the client receives
+        headers = dict(headers, **range_headers, **{"Accept-Encoding": "identity"})
+
+    response = await get_breaker(target_url).call(lambda: open_upstream_stream(
+        client,
+        method,
+        target_url,
+        params=params,
+        **upstream_body(body, headers)
+    ))
+    UPSTREAM_RESPONSES.inc("simple", str(response.status_code))
+
+    if response.status_code == 304 and cached:
+        await close_upstream(response)
+        logger.info("revalidated", url=target_url)
+        if not shared_state.touch(_response_cache, cache_key):
+            policy = get_cache_policy(cached['headers']["Content-Type"])
+            shared_state.store(_response_cache, cache_key, cached, size=len(cached['content']) + encoded_size(cached.get('encoded')),
+                               ttl=policy.ttl, stale_ttl=policy.stale_ttl)
+        return cached
+
+    # Static suffixes map to their type and cacheable headers; anything else
+    # (pages, API calls) keeps upstream's Content-Type and is not cached by clients
+    content_type = get_routing().content_type(path)
+    if content_type == "text/html":
+        content_type = response.headers.get("content-type", "text/html")
+        response_headers = dict(_dynamic_response_headers, **{"Content-Type": content_type})
+    else:
+        response_headers = dict(get_routing().response_headers[content_type])
+
+    if response.status_code == 206 and "content-range" in response.headers:
+        response_headers["Content-Range"] = response.headers["content-range"]
+    if "location" in response.headers:
+        # An unfollowed redirect (the body was streamed): send the client back through us
+        response_headers["Location"] = get_routing().proxy_location(response.headers["location"])
+
+    logger.info("proxied", method=method, url=target_url, status=response.status_code)
+
+    if method == "GET" and is_cacheable_failure(response.status_code, response.headers.get("content-length")):
+        # Small error bodies are buffered and remembered for a short while
+        try:
+            content = await response.aread()
+        finally:
+            await close_upstream(response)
+        entry = {'content': content, 'status_code': response.status_code, 'headers': response_headers}
+        remember_failure(_negative_cache, cache_key, entry, response.status_code, size=len(content))
+        return entry
+
+    # Large or uncacheable bodies go straight through to the client
+    if not _is_cacheable(method, response):
+        return {'stream': response, 'status_code': response.status_code, 'headers': response_headers}
+
+    # Bodies without a Content-Length are only read up to the cache limit
+    rest = None
+    try:
+        content, rest = await read_up_to(response, _cache_max_entry_bytes)
+    finally:
+        if rest is None:
+            await close_upstream(response)
+    if rest is not None:
+        # Too large after all: stream what was read and the remainder, uncached
+        return {'stream': response, 'body': rest, 'status_code': response.status_code, 'headers': response_headers}
+
+    entry = {
+        'content': content,
+        'status_code': response.status_code,
+        'headers': response_headers,
+        'etag': response.headers.get("etag"),
+        'last_modified': response.headers.get("last-modified")
+    }
+    # Cache successful GET responses
+    policy = get_cache_policy(content_type)
+    shared_state.store(_response_cache, cache_key, entry, size=len(content), ttl=policy.ttl, stale_ttl=policy.stale_ttl)
+    run_in_background(_precompress_entry(cache_key, entry))
+    return entry
+
+async def _precompress_entry(cache_key: str, entry: dict):
+    """Attach gzip/brotli copies and their ETags to a cached response so hits need no compression work"""
+    encoded = await precompress_async(entry['content']) if is_compressible(entry['headers']["Content-Type"]) else {}
+    etags = await asyncio.get_running_loop().run_in_executor(None, representation_etags, entry['content'], encoded)
+    cache_entry = _response_cache.peek(cache_key)
+    if cache_entry is None or cache_entry.value is not entry:
+        return  # the entry was replaced while we compressed
+    policy = get_cache_policy(entry['headers']["Content-Type"])
+    shared_state.store(_response_cache, cache_key, dict(entry, encoded=encoded, etags=etags),
+                       size=len(entry['content']) + encoded_size(encoded), ttl=policy.ttl, stale_ttl=policy.stale_ttl)
+
+async def entry_response(entry: dict, request: Request) -> Response:
+    """Response for a buffered entry: compressed when worth it, ETag-tagged, answering 304s and HEAD"""
+    return await representation_response(
+        request, entry['content'], entry['headers'], status_code=entry['status_code'],
+        compressible=is_compressible(entry['headers']["Content-Type"]),
+        encoded=entry.get('encoded'), etags=entry.get('etags'), last_modified=entry.get('last_modified')
+    )
+
+async def refresh_in_background(path: str, target_url: str, cache_key: str, cached: dict):
+    """Stale-while-revalidate refresh of a cached GET response"""
+    try:
+        entry, shared = await _upstream_flight.do(
+            cache_key,
+            lambda: fetch_upstream("GET", path, target_url, b"", None, cache_key, cached)
+        )
+        if 'stream' in entry and not shared:
+            # No client is waiting on this body
+            await close_upstream(entry['stream'])
+    except Exception as e:
+        logger.warning("background_refresh_failed", url=target_url, error=str(e))
 
-@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
 async def simple_proxy_request(path: str, request: Request):
     """Simplified proxy that relies only on HTTPX with good cookies"""
+    started = time.perf_counter()
+    request_id = bind_request_id(request.headers.get("x-request-id"))
+    labels = {"content": "other", "source": "error"}
+    status_code = 500
+    try:
+        response = await _simple_proxy_request(path, request, labels)
+        response.headers["X-Request-ID"] = request_id
+        status_code = response.status_code
+        return response
+    finally:
+        observe_request("simple", labels, status_code, started)
+
+async def _simple_proxy_request(path: str, request: Request, labels: dict):
+    """Serve one proxied request, recording the content class and serving path in ``labels``"""
     try:
         # Check session status
-        session_status = await get_session_status()
-        cookie_status = session_status.get("cookie_status", {})
+        cookie_status = get_cookie_status()
         
         if not cookie_status.get("exists") or cookie_status.get("expired", True):
+            labels["source"] = "no_session"
             return Response(
                 content=f"""
                 <html><body>
@@ -39,113 +241,91 @@ async def simple_proxy_request(path: str, request: Request):
         if path == "" or path == "/":
             path = "dashboard"
         
-        target_url = os.getenv("TARGET_URL").rstrip("/") + "/" + path
-        
-        # Add query parameters
-        if request.query_params:
-            query_string = str(request.query_params)
-            target_url += f"?{query_string}"
+        target_url = get_routing().target_url(path, str(request.query_params) if request.query_params else "")
 
         # Check cache for GET requests
         cache_key = f"{request.method}:{target_url}"
-        if request.method == "GET":
-            async with _cache_lock:
-                if cache_key in _response_cache:
-                    cached = _response_cache[cache_key]
-                    if time.time() - cached['timestamp'] < _cache_timeout:
-                        print(f"📋 Cache hit: {target_url}")
-                        return Response(
-                            content=cached['content'],
-                            status_code=cached['status_code'],
-                            headers=cached['headers']
-                        )
-
-        # Make request with authenticated client
-        client = await get_authenticated_client()
-        
-        # Enhanced headers to look more like a real browser
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Cache-Control": "no-cache",
-            "Pragma": "no-cache",
-            "Sec-Fetch-Site": "same-origin",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-User": "?1",
-            "Sec-Fetch-Dest": "document",
-            "Upgrade-Insecure-Requests": "1",
-            "DNT": "1",
-            "Referer": "https://app.stealthwriter.ai/dashboard",
-        }
-        
-        # Adjust content type specific headers
-        if path.endswith('.css'):
-            headers["Accept"] = "text/css,*/*;q=0.1"
-        elif path.endswith('.js'):
-            headers["Accept"] = "*/*"
-        elif any(path.endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico']):
-            headers["Accept"] = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
-
-        body = await request.body()
-        
-        response = await client.request(
-            request.method,
-            target_url,
-            headers=headers,
-            content=body,
-            params=request.query_params,
-            timeout=30
-        )
-        
-        # Determine content type
-        content_type = response.headers.get("content-type", "text/html")
-        if path.endswith('.css'):
-            content_type = 'text/css'
-        elif path.endswith('.js'):
-            content_type = 'application/javascript'
-        elif path.endswith(('.png', '.jpg', '.jpeg')):
-            content_type = f'image/{path.split(".")[-1]}'
-        
-        # Clean response headers
-        response_headers = {
-            "Content-Type": content_type,
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        }
-        
-        # Add caching for static assets
-        if any(path.endswith(ext) for ext in ['.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.woff', '.woff2']):
-            response_headers["Cache-Control"] = "public, max-age=3600"
-        else:
-            response_headers["Cache-Control"] = "no-cache"
-
-        # Cache successful GET responses
-        if request.method == "GET" and response.status_code == 200:
-            async with _cache_lock:
-                _response_cache[cache_key] = {
-                    'content': response.content,
-                    'status_code': response.status_code,
-                    'headers': response_headers,
-                    'timestamp': time.time()
-                }
-                # Limit cache size
-                if len(_response_cache) > 100:
-                    oldest_key = min(_response_cache.keys(), key=lambda k: _response_cache[k]['timestamp'])
-                    del _response_cache[oldest_key]
-
-        print(f"✅ Proxied: {request.method} {target_url} -> {response.status_code}")
-        
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
-            headers=response_headers
-        )
-            
+        # HEAD is answered from the cached GET's metadata
+        lookup_key = f"GET:{target_url}"
+        cached = None
+        breaker = get_breaker(target_url)
+        if request.method in ("GET", "HEAD"):
+            entry = await shared_state.lookup(_response_cache, lookup_key)
+            if entry is not None:
+                cached = entry.value
+                policy = get_cache_policy(cached['headers']["Content-Type"])
+                # While the upstream's circuit is open any copy we hold is served
+                if not entry.is_stale() or policy.stale_while_revalidate or breaker.rejecting():
+                    if entry.is_stale() and breaker.rejecting():
+                        logger.info("cache_hit", url=target_url, stale=True, circuit=breaker.state)
+                    elif entry.is_stale():
+                        # Serve the stale copy now and refresh it in the background
+                        logger.info("cache_hit", url=target_url, stale=True)
+                        run_in_background(refresh_in_background(path, target_url, lookup_key, cached))
+                    else:
+                        logger.info("cache_hit", url=target_url, stale=False)
+                    labels["content"] = content_class(cached['headers']["Content-Type"])
+                    labels["source"] = "cache_stale" if entry.is_stale() else "cache_hit"
+                    return await entry_response(cached, request)
+
+        if breaker.rejecting():
+            labels["source"] = "circuit_open"
+            return circuit_open_response(breaker)
+
+        if request.method in ("GET", "HEAD"):
+            failure = await lookup_failure(_negative_cache, lookup_key)
+            if failure is not None:
+                labels["content"] = content_class(failure.value['headers']["Content-Type"])
+                labels["source"] = "negative_hit"
+                return await entry_response(failure.value, request)
+
+        # Cache hits are free; only work that uses the shared upstream session is rate limited
+        await throttle(request)
+        body = await read_request_body(request)
+        stale = cached if request.method == "GET" else None
+        range_headers = None
+        if request.method == "GET" and "range" in request.headers:
+            # Not in the cache: forward the range and let upstream send only those bytes
+            range_headers = {"Range": request.headers["range"]}
+            if "if-range" in request.headers:
+                range_headers["If-Range"] = request.headers["if-range"]
+            stale = None
+        fetch = lambda: fetch_upstream(request.method, path, target_url, body, request.query_params, cache_key, stale, range_headers)
+        try:
+            if request.method == "GET" and range_headers is None:
+                # Concurrent misses for the same URL share one upstream request
+                entry, shared = await _upstream_flight.do(cache_key, fetch)
+                if shared and 'stream' in entry:
+                    # A streamed body can only be consumed once, fetch our own copy
+                    entry, shared = await fetch(), False
+            else:
+                entry, shared = await fetch(), False
+        except Exception:
+            await close_request_body(body)  # e.g. CircuitOpenError: never sent
+            raise
+        if shared:
+            await close_request_body(body)  # the leader's body was sent, not ours
+
+        labels["content"] = content_class(entry['headers']["Content-Type"])
+        if 'stream' in entry:
+            labels["source"] = "stream"
+            return stream_response(entry['stream'], entry['headers'], accept_encoding=request.headers.get("accept-encoding"),
+                                   body=entry.get('body'))
+        labels["source"] = "coalesced" if shared else "upstream"
+        return await entry_response(entry, request)
+
+    except CircuitOpenError as e:
+        labels["source"] = "circuit_open"
+        return circuit_open_response(e.breaker)
+    except RequestBodyTooLarge as e:
+        labels["source"] = "too_large"
+        return payload_too_large_response(e)
+    except RateLimited as e:
+        labels["source"] = "rate_limited"
+        return too_many_requests_response(e)
     except Exception as e:
-        print(f"❌ Proxy error: {str(e)}")
+        logger.error("proxy_error", error=str(e))
+        labels["source"] = "error"
         return Response(
             content=f"""
             <html><body>
@@ -171,10 +351,12 @@ async def session_status():
 async def refresh_session():
     """Force refresh session"""
     try:
-        async with _cache_lock:
-            _response_cache.clear()
+        await shared_state.clear(_response_cache)
+        await shared_state.clear(_negative_cache)
         await force_refresh_session()
         return {"status": "success", "message": "Session refreshed successfully"}
     except Exception as e:
         return {"status": "error", "message": f"Session refresh failed: {str(e)}"}
-        
\ No newline at end of file
+
+# Registered last so the management endpoints above are not shadowed by the catch-all
+router.add_api_route("/{path:path}", simple_proxy_request, methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+# Go up 3 levels from src/auth/cookie_store.py to get to project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+COOKIES_FILE = os.path.join(PROJECT_ROOT, "manual_cookies.json")
+SNAPSHOT_DIR = os.path.join(PROJECT_ROOT, "cookie_snapshots")
+SNAPSHOTS_TO_KEEP = int(os.getenv("COOKIE_SNAPSHOTS_KEEP", 5))
+
+def _atomic_write_json(path: str, data: dict):
+    """Write JSON to a temp file in the same directory, fsync it, then rename over ``path``"""
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(prefix=".cookies_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # Make the rename itself durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _prune_snapshots():
+    snapshots = sorted(name for name in os.listdir(SNAPSHOT_DIR) if name.endswith(".json"))
+    for name in snapshots[:-SNAPSHOTS_TO_KEEP]:
+        try:
+            os.unlink(os.path.join(SNAPSHOT_DIR, name))
+        except OSError:
+            pass
+
+def write_cookies(cookies_data: dict, path: str = COOKIES_FILE) -> int:
+    """Persist cookies atomically and keep a versioned snapshot; returns the version.
+
+    Readers either see the previous file or the new one, never a partial write.
+    This blocks on disk, so async code should use ``save_cookies`` instead.
+    """
+    version = time.time_ns()
+    cookies_data = dict(cookies_data, version=version)
+
+    _atomic_write_json(path, cookies_data)
+
+    if SNAPSHOTS_TO_KEEP > 0:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        _atomic_write_json(os.path.join(SNAPSHOT_DIR, f"manual_cookies.{version}.json"), cookies_data)
+        _prune_snapshots()
+
+    return version
+
+async def save_cookies(cookies_data: dict, path: str = COOKIES_FILE) -> int:
+    """Async wrapper for write_cookies that runs the disk I/O off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, write_cookies, cookies_data, path)
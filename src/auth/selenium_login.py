@@ -10,6 +10,8 @@ import subprocess
 import json
 import signal
 
+from auth.cookie_store import write_cookies
+
 # Fix: Go up 3 levels from src/auth/selenium_login.py to get to project root  
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 COOKIES_FILE = os.path.join(PROJECT_ROOT, "manual_cookies.json")
@@ -86,9 +88,8 @@ def manual_login_and_capture_cookies():
                 "url": current_url,
                 "cookies": valid_cookies
             }
-            # Fix: Use COOKIES_FILE instead of hardcoded path
-            with open(COOKIES_FILE, "w") as f:
-                json.dump(cookies_data, f, indent=2)
+            # Atomic write so the running server never reads a partial file
+            write_cookies(cookies_data, COOKIES_FILE)
             print(f"💾 Cookies saved to {COOKIES_FILE}")
             return valid_cookies
         else:
@@ -5,15 +5,38 @@ import time
 import json
 import random
 
+from config import upstream_settings
+from utils.upstream_pool import track_pool_wait, pool_stats, pool_occupancy
+from utils.metrics import register_collector
+from utils.circuit_breaker import get_breaker_stats
+from utils.log import get_logger
+from utils import shared_state
+
+logger = get_logger(__name__)
 _master_client = None
 _master_client_lock = asyncio.Lock()
 _last_refresh = 0
 _session_timeout = int(os.getenv("SESSION_TIMEOUT", 3600))
+# Refresh this many seconds before the session expires, off the request path
+_refresh_ahead = int(os.getenv("SESSION_REFRESH_AHEAD", 60))
+_refresh_retry_interval = 30
+_refresh_task = None
+_next_refresh_attempt = 0
+_clients_created = 0
+_cookie_updates = 0
 
 # Fix: Go up 3 levels from src/auth/session.py to get to project root
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 COOKIES_FILE = os.path.join(PROJECT_ROOT, "manual_cookies.json")
 
+# In-memory cookie state, reloaded only when manual_cookies.json changes
+_cookie_status = None
+_cookie_mtime = None
+_cookie_watcher = None
+_cookie_expires_at = None
+_cookie_watch_interval = float(os.getenv("COOKIE_WATCH_INTERVAL", 5))
+_cookie_max_age = 86400 * 7  # 7 days instead of 24 hours
+
 def load_manual_cookies():
     """
     Load cookies from manual_cookies.json file and return status dict for UI/health
@@ -28,7 +51,7 @@ def load_manual_cookies():
         "error": None
     }
     try:
-        print(f"🔍 Looking for cookies at: {COOKIES_FILE}")  # Debug log
+        logger.debug("loading_cookies", path=COOKIES_FILE)
         if not os.path.exists(COOKIES_FILE):
             status["error"] = f"manual_cookies.json file not found at {COOKIES_FILE}"
             return status
@@ -44,7 +67,7 @@ def load_manual_cookies():
             }
 
         cookie_age = time.time() - cookies_data.get("timestamp", time.time())
-        max_age = 86400 * 7  # 7 days instead of 24 hours
+        max_age = _cookie_max_age
 
         status["exists"] = True
         status["count"] = len(cookies_data.get("cookies", []))
@@ -65,28 +88,113 @@ def load_manual_cookies():
         status["error"] = f"Failed to load manual cookies: {e}"
         return status
 
+def _cookie_file_mtime():
+    try:
+        return os.stat(COOKIES_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def reload_cookies() -> dict:
+    """Re-read manual_cookies.json into the in-memory cookie state"""
+    global _cookie_status, _cookie_mtime, _cookie_expires_at
+    _cookie_mtime = _cookie_file_mtime()
+    _cookie_status = load_manual_cookies()
+    _cookie_expires_at = None
+    if _cookie_status["age_hours"] is not None:
+        _cookie_expires_at = time.time() - _cookie_status["age_hours"] * 3600 + _cookie_max_age
+    return _cookie_status
+
+async def reload_cookies_async() -> dict:
+    """reload_cookies without blocking the event loop on disk I/O"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, reload_cookies)
+
+def get_cookie_status() -> dict:
+    """Current cookie status from memory; the file is only read on first use or change"""
+    if _cookie_status is None:
+        reload_cookies()
+    _ensure_cookie_watcher()
+    return _cookie_status
+
+def _ensure_cookie_watcher():
+    global _cookie_watcher
+    if _cookie_watcher is not None and not _cookie_watcher.done():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    _cookie_watcher = loop.create_task(_watch_cookie_file())
+
+async def _watch_cookie_file():
+    """Poll the cookie file's mtime and reload it when it changes or the cookies age out"""
+    while True:
+        await asyncio.sleep(_cookie_watch_interval)
+        try:
+            if _cookie_file_mtime() != _cookie_mtime:
+                logger.info("cookie_file_changed", path=COOKIES_FILE)
+                await reload_cookies_async()
+            elif _cookie_expires_at and not _cookie_status["expired"] and time.time() >= _cookie_expires_at:
+                # Same file, but the cookies have now aged past the limit
+                await reload_cookies_async()
+        except Exception as e:
+            logger.warning("cookie_watcher_error", error=str(e))
+
 async def get_authenticated_client():
-    global _master_client, _last_refresh
+    """Return the shared client without locking; only the first call waits for it to be built"""
+    global _last_refresh
+    client = _master_client
+    if client is not None:
+        if time.time() - _last_refresh > _session_timeout - _refresh_ahead:
+            _schedule_refresh()
+        return client
+
     async with _master_client_lock:
-        current_time = time.time()
-        if (_master_client is None or current_time - _last_refresh > _session_timeout):
+        if _master_client is None:
             await _refresh_session()
-            _last_refresh = current_time
+            _last_refresh = time.time()
         return _master_client
 
+def _schedule_refresh():
+    """Start one background refresh unless one is running or recently failed"""
+    global _refresh_task
+    if _refresh_task is not None and not _refresh_task.done():
+        return
+    if time.time() < _next_refresh_attempt:
+        return
+    _refresh_task = asyncio.ensure_future(_background_refresh())
+
+async def _background_refresh():
+    global _last_refresh, _next_refresh_attempt
+    async with _master_client_lock:
+        # A forced refresh may have run while we waited for the lock
+        if time.time() - _last_refresh <= _session_timeout - _refresh_ahead:
+            return
+        try:
+            await _refresh_session()
+            _last_refresh = time.time()
+        except Exception:
+            # Keep serving with the current client and retry later
+            _next_refresh_attempt = time.time() + _refresh_retry_interval
+
 async def _refresh_session():
-    global _master_client
+    global _master_client, _clients_created, _cookie_updates
     try:
-        if _master_client:
-            await _master_client.aclose()
-            _master_client = None
-
-        print("🔄 Refreshing HTTPX session with manual cookies...")
-        cookie_status = load_manual_cookies()
+        logger.info("session_refreshing")
+        cookie_status = await reload_cookies_async()
         if not cookie_status["exists"] or cookie_status["expired"] or not cookie_status["cookies"]:
             raise Exception(cookie_status.get("error") or "No valid manual cookies available")
 
         cookie_dict = {cookie['name']: cookie['value'] for cookie in cookie_status["cookies"]}
+
+        if _master_client is not None and not _master_client.is_closed:
+            # Swap the cookie jar in place: pooled connections, HTTP/2 streams
+            # and TLS sessions survive, and in-flight requests keep working
+            _master_client.cookies.clear()
+            _master_client.cookies.update(cookie_dict)
+            _cookie_updates += 1
+            logger.info("session_cookies_updated")
+            return
         
         # Enhanced headers with better browser simulation
         headers = {
@@ -108,31 +216,50 @@ async def _refresh_session():
             "sec-ch-ua-platform": '"Windows"'
         }
 
-        # Create client with simplified settings (removed problematic transport)
+        # Pool limits, HTTP/2 and timeouts come from UPSTREAM_* env settings
         _master_client = httpx.AsyncClient(
             cookies=cookie_dict,
             headers=headers,
             follow_redirects=True,
-            timeout=30.0,
-            http2=True,
-            verify=True
+            timeout=upstream_settings.timeout,
+            limits=upstream_settings.limits,
+            http2=upstream_settings.http2,
+            verify=True,
+            event_hooks={"request": [track_pool_wait]}
         )
 
-        print("✅ HTTPX session created successfully")
+        _clients_created += 1
+        logger.info("session_created")
             
     except Exception as e:
-        print(f"❌ Session refresh failed: {str(e)}")
+        logger.error("session_refresh_failed", error=str(e))
         raise
 
 async def force_refresh_session():
-    global _master_client, _last_refresh
+    global _last_refresh
     async with _master_client_lock:
-        _last_refresh = 0
-        return await get_authenticated_client()
+        # Refresh directly: calling get_authenticated_client here would try to
+        # take the (non-reentrant) lock we already hold
+        await _refresh_session()
+        _last_refresh = time.time()
+        return _master_client
+
+async def _on_shared_cookies_changed():
+    """Another worker saved new cookies: reload them and update this worker's client"""
+    global _last_refresh
+    logger.info("shared_cookies_changed", pid=os.getpid())
+    if _master_client is None:
+        await reload_cookies_async()
+        return
+    async with _master_client_lock:
+        await _refresh_session()
+        _last_refresh = time.time()
+
+shared_state.on_version_change("cookies", _on_shared_cookies_changed)
 
 async def get_session_status():
     global _master_client, _last_refresh
-    cookie_status = load_manual_cookies()
+    cookie_status = get_cookie_status()
     if _master_client is None:
         return {"status": "no_session", "last_refresh": None, "cookie_status": cookie_status}
     age = time.time() - _last_refresh
@@ -142,5 +269,25 @@ async def get_session_status():
         "last_refresh": _last_refresh,
         "age_seconds": age,
         "expires_in_seconds": max(0, expires_in),
+        "clients_created": _clients_created,
+        "cookie_updates": _cookie_updates,
+        "pool": get_pool_status(),
+        "worker_pid": os.getpid(),
+        "shared_state": shared_state.get_client().stats() if shared_state.get_client() else None,
+        "circuit_breakers": get_breaker_stats(),
         "cookie_status": cookie_status
     }
+
+def get_pool_status() -> dict:
+    """Upstream pool settings, current occupancy and pool-wait timings"""
+    occupancy = pool_occupancy(_master_client) if _master_client is not None else {}
+    return {"settings": upstream_settings.as_dict(), **occupancy, **pool_stats.stats()}
+
+def _collect_pool_metrics():
+    status = get_pool_status()
+    for state in ("connections", "active", "idle"):
+        if state in status:
+            yield "proxy_upstream_pool_connections", "gauge", "Upstream pool connections by state", {"state": state}, status[state]
+    yield "proxy_upstream_pool_max_connections", "gauge", "Configured upstream pool size", {}, upstream_settings.max_connections
+
+register_collector(_collect_pool_metrics)
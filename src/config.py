@@ -0,0 +1,171 @@
+import os
+from types import MappingProxyType
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+class UpstreamSettings:
+    """Connection pool, HTTP/2 and timeout settings for the upstream HTTPX client"""
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100))
+        self.max_keepalive_connections = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 20))
+        self.keepalive_expiry = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30))
+        self.http2 = env_bool("UPSTREAM_HTTP2", True)
+
+        self.connect_timeout = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 5))
+        self.read_timeout = float(os.getenv("UPSTREAM_READ_TIMEOUT", 30))
+        self.write_timeout = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", 30))
+        self.pool_timeout = float(os.getenv("UPSTREAM_POOL_TIMEOUT", 10))
+        # HTML pages have a Selenium fallback, so give up on HTTPX sooner
+        self.html_read_timeout = float(os.getenv("UPSTREAM_HTML_READ_TIMEOUT", 15))
+
+        self.limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+        self.html_timeout = httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.html_read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "http2": self.http2,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "write_timeout": self.write_timeout,
+            "pool_timeout": self.pool_timeout,
+            "html_read_timeout": self.html_read_timeout
+        }
+
+upstream_settings = UpstreamSettings()
+
+# Suffix -> content type for static assets; any other path is treated as HTML
+MIME_TYPES = MappingProxyType({
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".woff": "font/woff2",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".ico": "image/x-icon"
+})
+
+# Upstream response headers never copied to the client
+SKIP_RESPONSE_HEADERS = frozenset({
+    "content-encoding", "transfer-encoding", "connection",
+    "content-length", "server", "x-frame-options", "cf-ray"
+})
+
+BROWSER_HEADERS = MappingProxyType({
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Referer": "https://app.stealthwriter.ai/dashboard",
+    "Origin": "https://app.stealthwriter.ai",
+    "Sec-Fetch-Site": "same-origin",
+    "DNT": "1"
+})
+
+def accept_header(content_type: str) -> str:
+    """Browser-like Accept value for a content type, or None to keep the client default"""
+    if content_type == "text/html":
+        return "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8"
+    if content_type == "text/css":
+        return "text/css,*/*;q=0.1"
+    if content_type == "application/javascript":
+        return "*/*"
+    if content_type.startswith("image/"):
+        return "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+    return None
+
+class RoutingConfig:
+    """Everything the proxy needs per request that only changes on restart.
+
+    Built once, so the hot path does dict lookups instead of re-reading the
+    environment, re-parsing the target URL and rebuilding header dicts. The
+    header templates are read-only; copy one before adding per-request headers.
+    """
+
+    def __init__(self, target_url: str = None):
+        target_url = target_url or os.getenv("TARGET_URL")
+        if not target_url:
+            raise RuntimeError("TARGET_URL is not set")
+        self.target = urlsplit(target_url)
+        self.target_base = target_url.rstrip("/") + "/"
+
+        # Upstream request headers per content type
+        self.request_headers = {}
+        for content_type in set(MIME_TYPES.values()) | {"text/html"}:
+            headers = dict(BROWSER_HEADERS)
+            accept = accept_header(content_type)
+            if accept:
+                headers["Accept"] = accept
+            self.request_headers[content_type] = MappingProxyType(headers)
+
+        # Client response headers per content type
+        self.response_headers = {
+            content_type: MappingProxyType({
+                "Content-Type": content_type,
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+                "Access-Control-Allow-Headers": "*",
+                "Cache-Control": "public, max-age=3600"
+            })
+            for content_type in set(MIME_TYPES.values())
+        }
+        self.response_headers["text/html"] = MappingProxyType({
+            "Content-Type": "text/html",
+            "Access-Control-Allow-Origin": "*",
+            "Cache-Control": "no-cache"
+        })
+
+    def target_url(self, path: str, query: str = "") -> str:
+        url = self.target_base + path
+        return url + "?" + query if query else url
+
+    def proxy_location(self, location: str) -> str:
+        """A redirect's Location as the client should follow it: through the proxy if it points upstream"""
+        url = urljoin(self.target_base, location)
+        if url.startswith(self.target_base):
+            return "/" + url[len(self.target_base):]
+        return location
+
+    def content_type(self, url: str) -> str:
+        """Content type from the URL's suffix (one rfind and one dict lookup)"""
+        dot = url.rfind(".")
+        if dot == -1:
+            return "text/html"
+        return MIME_TYPES.get(url[dot:], "text/html")
+
+_routing = None
+
+def get_routing() -> RoutingConfig:
+    """The process-wide RoutingConfig, built on first use (main.py builds it at startup)"""
+    global _routing
+    if _routing is None:
+        _routing = RoutingConfig()
+    return _routing
@@ -6,11 +6,18 @@ load_dotenv()
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 import uvicorn
 
 # Import routers
 from api.proxy import router as proxy_router
+from auth.session import get_cookie_status
+from utils.metrics import render_metrics
+from utils import shared_state
+from config import get_routing
+import multiprocessing
+import shutil
+import tempfile
 
 app = FastAPI(
     title="StealthWriter Proxy Server",
@@ -27,13 +34,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def connect_worker_state():
+    """Build the routing config and, in multi-worker mode, attach to the shared state"""
+    get_routing()  # fail fast on a missing TARGET_URL instead of on the first request
+    await shared_state.connect_shared_state()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics (registered before the proxy router so its catch-all does not shadow it)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Include routers
 app.include_router(proxy_router)
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Root endpoint with status and instructions"""
-    cookie_status = load_manual_cookies()
+    cookie_status = get_cookie_status()
     status_text = 'Active' if cookie_status.get("exists") and not cookie_status.get("expired") else 'Expired' if cookie_status.get("exists") else 'Not Found'
     error_text = cookie_status.get("error", "")
     
@@ -72,6 +90,7 @@ async def root():
             <div class="endpoint">POST /refresh-session - Force refresh session</div>
             <div class="endpoint">GET /manual-login - Trigger manual login flow</div>
             <div class="endpoint">POST /update-cookies - Update cookies via API</div>
+            <div class="endpoint">GET /metrics - Prometheus metrics</div>
             
             <h2>🎯 Usage Instructions</h2>
             <ol>
@@ -109,9 +128,31 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", 8000)),
-        reload=False
-    )
+    workers = int(os.getenv("WORKERS", 1))
+    state_server = None
+    socket_dir = None
+    if workers > 1:
+        # One process owns the shared cache tier and state counters; workers
+        # find its socket through the environment they inherit. By default it
+        # lives in a fresh directory only this user can enter (mkdtemp is 0700)
+        socket_path = os.getenv(shared_state.SHARED_STATE_SOCKET_ENV)
+        if not socket_path:
+            socket_dir = tempfile.mkdtemp(prefix="stealthwriter_proxy_")
+            socket_path = os.path.join(socket_dir, "state.sock")
+        os.environ[shared_state.SHARED_STATE_SOCKET_ENV] = socket_path
+        state_server = multiprocessing.Process(target=shared_state.run_state_server, args=(socket_path,), daemon=True)
+        state_server.start()
+
+    try:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=int(os.getenv("PORT", 8000)),
+            workers=workers,
+            reload=False
+        )
+    finally:
+        if state_server is not None:
+            state_server.terminate()
+        if socket_dir is not None:
+            shutil.rmtree(socket_dir, ignore_errors=True)
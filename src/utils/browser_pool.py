@@ -0,0 +1,189 @@
+"""Bounded worker pool for headless-browser fetches, with a wait queue and kill-on-timeout."""
+import asyncio
+import contextvars
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+class PoolFullError(Exception):
+    """Raised when the pool's wait queue is full or a caller waited too long for a slot"""
+
+class BrowserCancelled(Exception):
+    """Raised inside a fetch whose caller gave up on it"""
+
+def _descendants(pid: int) -> List[int]:
+    """All descendant PIDs of ``pid``, children first (Linux /proc)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces or parentheses; fields resume after the last ')'
+        ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    found, pending = [], [pid]
+    while pending:
+        for child in children.get(pending.pop(), ()):
+            found.append(child)
+            pending.append(child)
+    return found
+
+def kill_process_tree(pid: int):
+    """SIGKILL a process and everything it started (chromedriver -> chrome -> renderers)"""
+    try:
+        pids = _descendants(pid)
+    except OSError:
+        pids = []
+    for target in [pid] + pids:
+        try:
+            os.kill(target, signal.SIGKILL)
+        except OSError:
+            pass
+
+class BrowserHandle:
+    """Passed to a pooled fetch so the event loop can abort it from outside.
+
+    The fetch calls ``attach`` with the PID of the driver process once the
+    browser is up, and ``wait`` instead of ``time.sleep``. ``cancel`` kills
+    the attached process tree (or the next one attached) and wakes ``wait``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.pid = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def attach(self, pid: int):
+        with self._lock:
+            self.pid = pid
+            cancelled = self.cancelled
+        if cancelled:
+            kill_process_tree(pid)
+            raise BrowserCancelled("Fetch cancelled while the browser was starting")
+
+    def wait(self, seconds: float):
+        """Sleep that ends early, raising BrowserCancelled, when the fetch is cancelled"""
+        if self._cancelled.wait(seconds):
+            raise BrowserCancelled("Fetch cancelled")
+
+    def check(self):
+        if self.cancelled:
+            raise BrowserCancelled("Fetch cancelled")
+
+    def cancel(self) -> bool:
+        """Abort the fetch; returns whether a running browser was killed"""
+        with self._lock:
+            self._cancelled.set()
+            pid = self.pid
+        if pid is None:
+            return False
+        kill_process_tree(pid)
+        return True
+
+class BrowserPool:
+    """At most ``max_concurrent`` browser fetches, with at most ``max_queue`` callers waiting.
+
+    Each fetch gets its own thread from a dedicated executor, so browser work
+    never occupies the default executor used for file and compression work.
+    A caller arriving with the queue full is rejected at once; a queued caller
+    gives up after ``queue_timeout``. A fetch that exceeds its timeout has its
+    browser killed, and its slot is only reused once the thread has exited.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=name)
+        self._slots = None  # created on first use, inside the running loop
+        self._waiting = 0
+        self._running = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.killed = 0
+
+    async def _acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise PoolFullError(f"{self.name}: {self._running} running, {self._waiting} queued")
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PoolFullError(f"{self.name}: no slot within {self.queue_timeout}s")
+        finally:
+            self._waiting -= 1
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run ``fn(*args, handle=BrowserHandle())`` in the pool.
+
+        Raises PoolFullError without running anything when the pool is
+        saturated, and asyncio.TimeoutError once ``timeout`` expires (after
+        killing the browser).
+        """
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        handle = BrowserHandle()
+        self._running += 1
+
+        def finished(_):
+            # The slot is tied to the thread, not to the caller that may have given up on it
+            loop.call_soon_threadsafe(self._release)
+
+        # Carry the caller's context (request_id for logging) into the worker thread
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, lambda: fn(*args, handle=handle))
+        future.add_done_callback(finished)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._cancel(handle)
+            raise
+        except asyncio.CancelledError:
+            self._cancel(handle)  # the client went away, nobody wants this page now
+            raise
+        self.completed += 1
+        return result
+
+    def _cancel(self, handle: BrowserHandle):
+        if handle.cancel():
+            self.killed += 1
+            logger.warning("browser_killed", pool=self.name, pid=handle.pid)
+
+    def _release(self):
+        self._running -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "waiting": self._waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "killed": self.killed
+        }
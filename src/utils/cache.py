@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+# Every cache created in the process, so stats can be reported in one place
+_caches = {}
+
+class CacheEntry:
+    """A cached value together with its size, freshness and expiry times.
+
+    An entry is fresh for ``ttl`` seconds, then stale for ``stale_ttl`` more
+    seconds (it may still be served while a refresh runs), then expired.
+    """
+    __slots__ = ("value", "size", "ttl", "stale_ttl", "created_at", "fresh_until", "expires_at")
+
+    def __init__(self, value: Any, size: int, ttl: float, stale_ttl: float = 0):
+        self.value = value
+        self.size = size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.touch()
+
+    def touch(self):
+        """Restart the entry's lifetime, e.g. after upstream answered 304"""
+        self.created_at = time.time()
+        self.fresh_until = self.created_at + self.ttl
+        self.expires_at = self.fresh_until + self.stale_ttl
+
+    def is_stale(self, now: float = None) -> bool:
+        return (now or time.time()) >= self.fresh_until
+
+    def is_expired(self, now: float = None) -> bool:
+        return (now or time.time()) >= self.expires_at
+
+class CachePolicy:
+    """How long responses of one content type stay fresh and how they are refreshed"""
+    __slots__ = ("ttl", "stale_ttl", "revalidate")
+
+    def __init__(self, ttl: float = None, stale_ttl: float = 0, revalidate: bool = False):
+        self.ttl = ttl  # None means the cache's own default TTL
+        self.stale_ttl = stale_ttl  # 0 disables stale-while-revalidate
+        self.revalidate = revalidate  # send If-None-Match/If-Modified-Since when refreshing
+
+    @property
+    def stale_while_revalidate(self) -> bool:
+        return self.stale_ttl > 0
+
+# Keyed by the types returned from api.proxy.get_content_type. Override with
+# CACHE_POLICIES, e.g. '{"text/html": {"ttl": 120, "stale_ttl": 0}}'
+DEFAULT_CACHE_POLICIES = {
+    "text/html": {"stale_ttl": 600, "revalidate": True},
+    "text/css": {"stale_ttl": 3600, "revalidate": True},
+    "application/javascript": {"stale_ttl": 3600, "revalidate": True},
+    "font/woff2": {"stale_ttl": 86400, "revalidate": True},
+    "font/ttf": {"stale_ttl": 86400, "revalidate": True},
+    "image/*": {"stale_ttl": 86400, "revalidate": True},
+    "*": {}
+}
+
+def _load_cache_policies() -> dict:
+    policies = {k: dict(v) for k, v in DEFAULT_CACHE_POLICIES.items()}
+    overrides = os.getenv("CACHE_POLICIES")
+    if overrides:
+        for content_type, settings in json.loads(overrides).items():
+            policies.setdefault(content_type, {}).update(settings)
+    return {content_type: CachePolicy(**settings) for content_type, settings in policies.items()}
+
+_cache_policies = _load_cache_policies()
+
+def get_cache_policy(content_type: str) -> CachePolicy:
+    """Policy for a content type, trying the exact type, then 'major/*', then '*'"""
+    base = content_type.split(";")[0].strip().lower()
+    policy = _cache_policies.get(base) or _cache_policies.get(base.split("/")[0] + "/*")
+    return policy or _cache_policies["*"]
+
+class ResponseCache:
+    """LRU cache with a TTL, an entry-count limit and a byte budget.
+
+    All operations are O(1) (an OrderedDict keeps recency order). Expired
+    entries are dropped when they are read and by a background sweep, so keys
+    that are never requested again do not pin memory until the LRU pushes
+    them out.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl: float, sweep_interval: float = 60):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._sweeper = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        register_cache(name, self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def get(self, key) -> Optional[Any]:
+        """Return the cached value, or None on a miss or a stale/expired entry"""
+        entry = self.lookup(key)
+        if entry is None or entry.is_stale():
+            return None
+        return entry.value
+
+    def lookup(self, key) -> Optional[CacheEntry]:
+        """Return the entry if it is fresh or still inside its stale window"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.is_expired():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if entry.is_stale():
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def peek(self, key) -> Optional[CacheEntry]:
+        """Return the entry without touching recency or counters"""
+        return self._entries.get(key)
+
+    def set(self, key, value: Any, size: int, ttl: float = None, stale_ttl: float = 0):
+        """Store a value, evicting least recently used entries to stay in budget"""
+        if key in self._entries:
+            self._remove(key)  # even if the new value is too large: the old one is outdated
+        if size > self.max_bytes:
+            return
+        self._entries[key] = CacheEntry(value, size, self.ttl if ttl is None else ttl, stale_ttl)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+        self._ensure_sweeper()
+
+    def touch(self, key) -> bool:
+        """Mark an entry fresh again without replacing its value"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        entry.touch()
+        return True
+
+    def delete(self, key):
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> int:
+        """Drop every entry and return how many were removed"""
+        count = len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+        return count
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def sweep(self) -> int:
+        """Remove all expired entries and return how many were dropped"""
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry.is_expired(now)]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _ensure_sweeper(self):
+        """Start the background expiry sweep on first use inside an event loop"""
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                logger.debug("cache_swept", cache=self.name, removed=removed)
+
+def register_cache(name: str, cache):
+    """Include any object with a ``stats()`` dict in get_cache_stats and the metrics"""
+    _caches[name] = cache
+
+def get_cache_stats() -> dict:
+    """Stats for every cache in the process, keyed by cache name"""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,213 @@
+"""Per-upstream circuit breakers: stop sending requests to a host that is failing or too slow."""
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit
+
+import httpx
+from starlette.responses import Response
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Every breaker created in the process, keyed by upstream host
+_breakers = {}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, breaker: "CircuitBreaker"):
+        super().__init__(f"Circuit for {breaker.name} is {breaker.state}")
+        self.breaker = breaker
+
+class CircuitBreaker:
+    """Error-rate and latency circuit breaker for one upstream.
+
+    Outcomes of the last ``window`` seconds are kept in a deque. Once at
+    least ``min_calls`` were seen and the share of failures (HTTPX errors and
+    5xx) or of calls slower than ``slow_call_seconds`` reaches its threshold,
+    the circuit opens and callers fail fast for ``open_seconds``. It then
+    goes half-open and lets ``half_open_probes`` requests through: if they
+    all succeed it closes again, any failure re-opens it.
+    """
+
+    def __init__(self, name: str, window: float = 30, min_calls: int = 10, failure_ratio: float = 0.5,
+                 slow_call_seconds: float = 10, slow_call_ratio: float = 0.8, open_seconds: float = 30,
+                 half_open_probes: int = 1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_ratio = slow_call_ratio
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.opened = 0
+        self.rejected = 0
+
+        _breakers[name] = self
+
+    def _expire(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window:
+            _, failed, slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _transition(self, state: str, now: float):
+        if state == self.state:
+            return
+        logger.warning("circuit_state_changed", upstream=self.name, old=self.state, new=state)
+        self.state = state
+        if state == OPEN:
+            self.opened += 1
+            self.opened_at = now
+        elif state == HALF_OPEN:
+            self._probe_successes = 0
+        else:
+            self._calls.clear()
+            self._failures = self._slow = 0
+
+    def rejecting(self) -> bool:
+        """Whether a call made now would be refused (no side effects, unlike allow)"""
+        if self.state == OPEN:
+            return time.monotonic() < self.opened_at + self.open_seconds
+        if self.state == HALF_OPEN:
+            return self._probes_in_flight >= self.half_open_probes
+        return False
+
+    def allow(self) -> bool:
+        """Admit one call; in half-open state this takes a probe slot until record/release"""
+        if self.state == OPEN:
+            now = time.monotonic()
+            if now < self.opened_at + self.open_seconds:
+                self.rejected += 1
+                return False
+            self._transition(HALF_OPEN, now)
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def release(self, probe: bool):
+        """Give back a probe slot for a call that ended without an outcome (e.g. cancelled)"""
+        if probe and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def record(self, failed: bool, duration: float, probe: bool = False):
+        """Record the outcome of a call admitted by allow()"""
+        now = time.monotonic()
+        self.release(probe)
+        slow = duration >= self.slow_call_seconds
+        if self.state == HALF_OPEN and probe:
+            if failed or slow:
+                self._transition(OPEN, now)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED, now)
+            return
+        if self.state != CLOSED:
+            return  # a call that started before the circuit opened
+
+        self._calls.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        self._expire(now)
+        calls = len(self._calls)
+        if calls >= self.min_calls and (self._failures / calls >= self.failure_ratio
+                                        or self._slow / calls >= self.slow_call_ratio):
+            self._transition(OPEN, now)
+
+    async def call(self, fn: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Await ``fn`` through the breaker; 5xx responses and HTTPX errors count as failures.
+
+        Other exceptions (an oversized or aborted client upload) say nothing
+        about the upstream and are not recorded.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self)
+        probe = self.state == HALF_OPEN
+        started = time.perf_counter()
+        try:
+            response = await fn()
+        except httpx.HTTPError:
+            self.record(True, time.perf_counter() - started, probe)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        self.record(response.status_code >= 500, time.perf_counter() - started, probe)
+        return response
+
+    def retry_after(self) -> int:
+        """Seconds until the circuit will let a probe through"""
+        if self.state != OPEN:
+            return 1
+        return max(1, int(self.opened_at + self.open_seconds - time.monotonic() + 0.999))
+
+    def stats(self) -> dict:
+        self._expire(time.monotonic())
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failures": self._failures,
+            "slow_calls": self._slow,
+            "failure_ratio": self._failures / calls if calls else 0.0,
+            "slow_call_ratio": self._slow / calls if calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after() if self.state == OPEN else 0
+        }
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """The breaker for the host of ``url``, created with the CIRCUIT_* settings on first use"""
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            host,
+            window=float(os.getenv("CIRCUIT_WINDOW", 30)),
+            min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", 10)),
+            failure_ratio=float(os.getenv("CIRCUIT_FAILURE_RATIO", 0.5)),
+            slow_call_seconds=float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", 10)),
+            slow_call_ratio=float(os.getenv("CIRCUIT_SLOW_CALL_RATIO", 0.8)),
+            open_seconds=float(os.getenv("CIRCUIT_OPEN_SECONDS", 30)),
+            half_open_probes=int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", 1))
+        )
+    return breaker
+
+def circuit_open_response(breaker: CircuitBreaker) -> Response:
+    """503 sent instead of waiting on an upstream whose circuit is open"""
+    retry_after = breaker.retry_after()
+    return Response(
+        content=f"Upstream {breaker.name} is unavailable, retry in {retry_after}s",
+        status_code=503,
+        headers={"Retry-After": str(retry_after), "Content-Type": "text/plain"}
+    )
+
+def get_breaker_stats() -> dict:
+    """Stats for every circuit breaker in the process, keyed by upstream host"""
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+def state_value(state: str) -> int:
+    """Numeric state for the metrics gauge: 0 closed, 1 half-open, 2 open"""
+    return _STATE_VALUES[state]
@@ -0,0 +1,119 @@
+"""Strong ETags, conditional requests (304), Range and HEAD for responses built from cached bodies."""
+import hashlib
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+from starlette.responses import Response
+
+from utils.encoding import encode_for_client
+from utils.ranges import requested_ranges, range_response, memory_reader
+
+# Headers a 304 repeats from the full response (RFC 9110 15.4.5)
+NOT_MODIFIED_HEADERS = frozenset({
+    "etag", "last-modified", "cache-control", "vary", "expires", "content-location",
+    "access-control-allow-origin"
+})
+
+def make_etag(content: bytes) -> str:
+    """Strong ETag for the exact bytes of one representation"""
+    return '"' + hashlib.blake2b(content, digest_size=16).hexdigest() + '"'
+
+def variant_etag(etag: str, coding: str) -> str:
+    """ETag of a compressed copy: the identity ETag with the coding appended inside the quotes"""
+    return f'{etag[:-1]}-{coding}"'
+
+def representation_etags(content: bytes, encoded: Optional[dict] = None) -> dict:
+    """ETags for the identity body and each precompressed copy, keyed by coding (None = identity).
+
+    Copies are tagged from the identity body, not their own bytes, so a page
+    compressed on the fly for a miss carries (the weak form of) the same tag
+    as the precompressed copy its next hit is served from.
+    """
+    etags = {None: make_etag(content)}
+    for coding in (encoded or {}):
+        etags[coding] = variant_etag(etags[None], coding)
+    return etags
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def is_not_modified(request_headers: Mapping, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """Whether the client's validators show it already has this representation"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return etag is not None and _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def not_modified_response(headers: Mapping) -> Response:
+    return Response(
+        status_code=304,
+        headers={k: v for k, v in headers.items() if k.lower() in NOT_MODIFIED_HEADERS}
+    )
+
+def head_response(headers: Mapping, content_length: int, status_code: int = 200) -> Response:
+    """Headers of a full response without the body"""
+    response = Response(status_code=status_code, headers=headers)
+    response.headers["Content-Length"] = str(content_length)
+    return response
+
+async def representation_response(request, content: bytes, headers: Mapping, status_code: int = 200,
+                                  compressible: bool = True, encoded: Optional[dict] = None,
+                                  etags: Optional[dict] = None, last_modified: Optional[str] = None) -> Response:
+    """Response for a body we hold in memory.
+
+    Negotiates compression (preferring the precompressed ``encoded`` copies),
+    tags the chosen representation with a strong ETag (from ``etags`` when it
+    was computed at cache-fill time), answers matching conditional requests
+    with 304, Range requests with 206 and HEAD with headers only.
+    """
+    coding = None
+    identity = content
+    if compressible:
+        content, coding = await encode_for_client(content, request.headers.get("accept-encoding"), encoded)
+    headers = dict(headers)
+    if compressible:
+        headers["Vary"] = "Accept-Encoding"
+    if coding:
+        headers["Content-Encoding"] = coding
+
+    if status_code == 200:
+        etag = None
+        if etags and (coding is None or coding in (encoded or {})):
+            etag = etags.get(coding)
+        if etag is None:
+            etag = make_etag(identity)
+            if coding:
+                # Compressed just now at the fast level: same tag as the
+                # precompressed copy, but weak as the bytes differ
+                etag = "W/" + variant_etag(etag, coding)
+        headers["ETag"] = etag
+        if last_modified:
+            headers["Last-Modified"] = last_modified
+        if request.method in ("GET", "HEAD") and is_not_modified(request.headers, headers["ETag"], last_modified):
+            return not_modified_response(headers)
+        headers["Accept-Ranges"] = "bytes"
+        if request.method == "GET":
+            ranges = requested_ranges(request.headers, len(content), headers["ETag"], last_modified)
+            if ranges is not None:
+                return range_response(ranges, len(content), headers, memory_reader(content))
+
+    if request.method == "HEAD":
+        return head_response(headers, len(content), status_code)
+    return Response(content=content, status_code=status_code, headers=headers)
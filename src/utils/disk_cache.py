@@ -0,0 +1,336 @@
+"""Content-addressed on-disk cache for static assets.
+
+Bodies are stored once per SHA-256 digest under ``objects/``; an index maps
+each URL to its digest plus the headers needed to serve and revalidate it.
+The index lives in memory as an LRU (OrderedDict) and is flushed to
+``index.json`` in the background, so a restarted server keeps its warm set.
+Files are served with FileResponse, which lets the ASGI server use sendfile.
+
+A DiskCache assumes it is the only process using its directory, so every
+process claims its own ``worker-<n>`` subdirectory (see
+claim_worker_directory) and workers never evict, index or orphan-sweep each
+other's blobs. The price is that an asset may be stored once per worker.
+"""
+import asyncio
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils.cache import register_cache
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Blobs not referenced by the index are removed at startup once they are this old;
+# younger ones may belong to a process still shutting down on the same directory
+ORPHAN_MIN_AGE = 3600
+# Lock files of claimed worker directories, held open for the life of the process
+_worker_locks = []
+
+class DiskEntry:
+    __slots__ = ("digest", "size", "content_type", "etag", "last_modified", "stored_at", "ttl", "encoding", "variants")
+
+    def __init__(self, digest: str, size: int, content_type: str, etag: str = None,
+                 last_modified: str = None, stored_at: float = None, ttl: float = 0, encoding: str = None,
+                 variants: dict = None):
+        self.digest = digest
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.ttl = ttl
+        self.encoding = encoding  # Content-Encoding of the stored bytes, None if decoded
+        self.variants = variants or {}  # coding -> [digest, size] of precompressed copies of a decoded body
+
+    def is_fresh(self, now: float = None) -> bool:
+        return (now or time.time()) < self.stored_at + self.ttl
+
+    def digests(self) -> list:
+        return [self.digest] + [digest for digest, _ in self.variants.values()]
+
+    def to_list(self) -> list:
+        return [self.digest, self.size, self.content_type, self.etag, self.last_modified, self.stored_at, self.ttl,
+                self.encoding, self.variants]
+
+class DiskCache:
+    """LRU of URL -> blob with a byte budget; blob writes and deletes run off the event loop"""
+
+    def __init__(self, name: str, directory: str, max_bytes: int, max_entry_bytes: int, ttl: float,
+                 flush_interval: float = 30):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.index_path = os.path.join(directory, "index.json")
+        self.objects_dir = os.path.join(directory, "objects")
+
+        self._entries = OrderedDict()
+        self._refs = {}  # digest -> number of URLs pointing at it
+        self._bytes = 0
+        self._dirty = False
+        self._flusher = None
+
+        self.hits = 0
+        self.stale_hits = 0  # expired entries confirmed by a 304
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load_index()
+        register_cache(name, self)
+        atexit.register(self.flush)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    async def read(self, entry: DiskEntry) -> bytes:
+        """Read a blob off the event loop (for responses that need the bytes, not the file)"""
+        def read_blob():
+            with open(self.blob_path(entry.digest), "rb") as f:
+                return f.read()
+        return await asyncio.get_running_loop().run_in_executor(None, read_blob)
+
+    async def lookup(self, key: str) -> Optional[DiskEntry]:
+        """Return the entry (fresh or not) if its blobs are still on disk"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self._blobs_exist, entry):
+            # Removed behind our back (manual cleanup)
+            if self._entries.get(key) is entry:
+                await loop.run_in_executor(None, self._unlink_blobs, self._remove(key))
+                self._mark_dirty()
+            self.misses += 1
+            return None
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        return entry
+
+    def record_hit(self, revalidated: bool = False):
+        if revalidated:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+
+    def touch(self, key: str) -> bool:
+        """Start a new freshness period after a 304"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        entry.stored_at = time.time()
+        self._mark_dirty()
+        return True
+
+    async def put(self, key: str, content: bytes, content_type: str, etag: str = None,
+                  last_modified: str = None, ttl: float = None, encoding: str = None, encoded: dict = None):
+        """Write ``content`` (and its ``encoded`` copies, coding -> bytes) to blobs and point ``key`` at them"""
+        encoded = encoded or {}
+        total = len(content) + sum(len(body) for body in encoded.values())
+        if len(content) > self.max_entry_bytes or total > self.max_bytes:
+            return
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, self._write_blob, content)
+        variants = {}
+        for coding, body in encoded.items():
+            variants[coding] = [await loop.run_in_executor(None, self._write_blob, body), len(body)]
+
+        orphans = []
+        if key in self._entries:
+            orphans.extend(self._remove(key))
+        entry = DiskEntry(digest, len(content), content_type, etag, last_modified,
+                          ttl=self.ttl if ttl is None else ttl, encoding=encoding, variants=variants)
+        self._entries[key] = entry
+        self._add_refs(entry)
+        # The same body again: the blob we just wrote is the one the old entry used
+        orphans = [orphan for orphan in orphans if orphan not in self._refs]
+
+        while self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            orphans.extend(self._remove(oldest_key))
+            self.evictions += 1
+        if orphans:
+            await loop.run_in_executor(None, self._unlink_blobs, orphans)
+        self._mark_dirty()
+
+    async def clear(self) -> int:
+        """Forget every entry and delete the blobs off the event loop; returns how many entries were removed"""
+        count = len(self._entries)
+        orphans = list(self._refs)
+        self._entries.clear()
+        self._refs.clear()
+        self._bytes = 0
+        self._mark_dirty()
+        await asyncio.get_running_loop().run_in_executor(None, self._unlink_blobs, orphans)
+        return count
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "blobs": len(self._refs),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def flush(self):
+        """Write the index atomically if it changed"""
+        if self._dirty:
+            self._write_index(self._snapshot())
+
+    def _snapshot(self) -> dict:
+        self._dirty = False
+        return {"version": 1, "entries": [[key] + entry.to_list() for key, entry in self._entries.items()]}
+
+    def _write_index(self, data: dict):
+        fd, temp_path = tempfile.mkstemp(prefix=".index_", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            self._dirty = True
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _add_refs(self, entry: DiskEntry):
+        self._add_ref(entry.digest, entry.size)
+        for digest, size in entry.variants.values():
+            self._add_ref(digest, size)
+
+    def _add_ref(self, digest: str, size: int):
+        if digest not in self._refs:
+            self._refs[digest] = 0
+            self._bytes += size  # identical bodies share one blob and count once
+        self._refs[digest] += 1
+
+    def _remove(self, key: str) -> list:
+        """Drop a key; returns the digests of its blobs that no other key uses"""
+        entry = self._entries.pop(key)
+        orphans = []
+        sizes = [(entry.digest, entry.size)] + [tuple(variant) for variant in entry.variants.values()]
+        for digest, size in sizes:
+            self._refs[digest] -= 1
+            if self._refs[digest] == 0:
+                del self._refs[digest]
+                self._bytes -= size
+                orphans.append(digest)
+        return orphans
+
+    def _write_blob(self, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".blob_", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        return digest
+
+    def _blobs_exist(self, entry: DiskEntry) -> bool:
+        return all(os.path.exists(self.blob_path(digest)) for digest in entry.digests())
+
+    def _unlink_blobs(self, digests: list):
+        for digest in digests:
+            try:
+                os.unlink(self.blob_path(digest))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {"entries": []}
+        except (OSError, ValueError) as e:
+            logger.warning("disk_cache_index_unreadable", cache=self.name, error=str(e))
+            data = {"entries": []}
+
+        for key, *fields in data.get("entries", []):
+            entry = DiskEntry(*fields)
+            if not self._blobs_exist(entry):
+                continue
+            self._entries[key] = entry
+            self._add_refs(entry)
+        self._remove_orphans()
+        logger.info("disk_cache_loaded", cache=self.name, entries=len(self._entries), bytes=self._bytes)
+
+    def _remove_orphans(self):
+        cutoff = time.time() - ORPHAN_MIN_AGE
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if name not in self._refs and os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                except OSError:
+                    pass
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flusher = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # Snapshot on the loop (the index keeps changing), write in a thread
+        data = self._snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_index, data)
+        except Exception as e:
+            logger.warning("disk_cache_flush_failed", cache=self.name, error=str(e))
+
+def claim_worker_directory(directory: str) -> str:
+    """Lock and return the first free ``worker-<n>`` subdirectory of ``directory``.
+
+    Slots are stable across restarts, so a restarted worker picks up the warm
+    set of the one it replaces. There is no upper bound: the number of
+    processes is whatever the server was started with (``WORKERS`` or
+    ``uvicorn --workers``). The lock is released when the process exits.
+    """
+    slot = 0
+    while True:
+        path = os.path.join(directory, f"worker-{slot}")
+        os.makedirs(path, exist_ok=True)
+        fd = os.open(os.path.join(path, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            slot += 1
+            continue
+        _worker_locks.append(fd)
+        return path
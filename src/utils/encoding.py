@@ -0,0 +1,148 @@
+"""Content-Encoding negotiation, compression and decoding helpers."""
+import asyncio
+import gzip
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # br bodies are then only passed through, never decoded here
+    brotli = None
+
+# Bodies smaller than this are sent as-is; the framing overhead is not worth it
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+# Cache fills pay for dense brotli once; bodies compressed per response use a fast level
+BROTLI_CACHE_QUALITY = int(os.getenv("BROTLI_CACHE_QUALITY", 11))
+BROTLI_DYNAMIC_QUALITY = int(os.getenv("BROTLI_DYNAMIC_QUALITY", 4))
+# Larger bodies are cached uncompressed only: dense brotli on a multi-MB bundle takes seconds
+PRECOMPRESS_MAX_BYTES = int(os.getenv("PRECOMPRESS_MAX_BYTES", 2 * 1024 * 1024))
+# Cache fills compress on their own threads, so a burst of them cannot tie up
+# the default executor that cookie reloads, blob reads and decoding share
+_precompress_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PRECOMPRESS_THREADS", 1)),
+                                           thread_name_prefix="precompress")
+
+def parse_accept_encoding(header: Optional[str]) -> dict:
+    """Map each coding in an Accept-Encoding header to its q-value"""
+    preferences = {}
+    if not header:
+        return preferences
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        preferences[coding] = q
+    return preferences
+
+def accepts_encoding(header: Optional[str], coding: Optional[str]) -> bool:
+    """Whether a client sending this Accept-Encoding can take a body in ``coding``"""
+    if not coding or coding == "identity":
+        return True
+    preferences = parse_accept_encoding(header)
+    if coding == "gzip" and "x-gzip" in preferences:
+        preferences.setdefault("gzip", preferences["x-gzip"])
+    return preferences.get(coding, preferences.get("*", 0.0)) > 0
+
+def can_decode(coding: Optional[str]) -> bool:
+    return not coding or coding in ("identity", "gzip", "deflate") or (coding == "br" and brotli is not None)
+
+def decode_body(content: bytes, coding: Optional[str]) -> bytes:
+    """Undo a single Content-Encoding; raises ValueError for codings we cannot decode"""
+    if not coding or coding == "identity":
+        return content
+    if coding == "gzip":
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if coding == "deflate":
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)  # raw deflate without zlib header
+    if coding == "br" and brotli is not None:
+        return brotli.decompress(content)
+    raise ValueError(f"Cannot decode Content-Encoding {coding!r}")
+
+async def decode_body_async(content: bytes, coding: Optional[str]) -> bytes:
+    """decode_body in the default executor; inflating a large asset would stall the event loop"""
+    if not coding or coding == "identity":
+        return content
+    return await asyncio.get_running_loop().run_in_executor(None, decode_body, content, coding)
+
+def supported_codings() -> tuple:
+    """Codings we can produce, most preferred first"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """Text-like types worth compressing (fonts and images are already compressed)"""
+    if not content_type:
+        return False
+    base = content_type.split(";")[0].strip().lower()
+    return (base.startswith("text/") or base.endswith(("javascript", "json", "xml"))
+            or base == "image/svg+xml")
+
+def negotiate(accept_encoding: Optional[str], available) -> Optional[str]:
+    """Pick the client's highest-q coding among ``available`` (earlier wins ties)"""
+    preferences = parse_accept_encoding(accept_encoding)
+    if not preferences:
+        return None
+    best, best_q = None, 0.0
+    for coding in available:
+        q = preferences.get(coding, preferences.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress_body(content: bytes, coding: str, brotli_quality: int = BROTLI_CACHE_QUALITY) -> bytes:
+    if coding == "gzip":
+        return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+    if coding == "br" and brotli is not None:
+        return brotli.compress(content, quality=brotli_quality)
+    raise ValueError(f"Cannot compress with {coding!r}")
+
+def precompress(content: bytes) -> dict:
+    """Every supported encoding of ``content`` that is actually smaller; CPU heavy, run it in a thread"""
+    if len(content) < COMPRESS_MIN_SIZE or len(content) > PRECOMPRESS_MAX_BYTES:
+        return {}
+    encoded = {}
+    for coding in supported_codings():
+        compressed = compress_body(content, coding)
+        if len(compressed) < len(content):
+            encoded[coding] = compressed
+    return encoded
+
+async def precompress_async(content: bytes) -> dict:
+    return await asyncio.get_running_loop().run_in_executor(_precompress_executor, precompress, content)
+
+def encoded_size(encoded: Optional[dict]) -> int:
+    return sum(len(body) for body in (encoded or {}).values())
+
+async def encode_for_client(content: bytes, accept_encoding: Optional[str],
+                            encoded: Optional[dict] = None) -> Tuple[bytes, Optional[str]]:
+    """Body and Content-Encoding to send this client.
+
+    Uses a precompressed copy from ``encoded`` when one matches; otherwise
+    compresses once at a fast level off the event loop, or sends ``content``
+    unchanged when it is small or the client wants no compression.
+    """
+    if encoded:
+        coding = negotiate(accept_encoding, [c for c in supported_codings() if c in encoded])
+        if coding:
+            return encoded[coding], coding
+    if len(content) < COMPRESS_MIN_SIZE:
+        return content, None
+    coding = negotiate(accept_encoding, supported_codings())
+    if coding is None:
+        return content, None
+    compressed = await asyncio.get_running_loop().run_in_executor(None, compress_body, content, coding, BROTLI_DYNAMIC_QUALITY)
+    if len(compressed) >= len(content):
+        return content, None
+    return compressed, coding
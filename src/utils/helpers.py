@@ -1,9 +1,31 @@
+import asyncio
+from typing import Optional
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-run
+_background_tasks = set()
+
 def structured_log(message: str, **kwargs) -> None:
-    import structlog
+    from utils.log import get_logger
 
-    logger = structlog.get_logger()
-    logger.info(message, **kwargs)
+    get_logger().info(message, **kwargs)
 
 def filter_headers(headers: dict) -> dict:
     sensitive_headers = ['Authorization', 'Cookie']
-    return {k: v for k, v in headers.items() if k not in sensitive_headers}
\ No newline at end of file
+    return {k: v for k, v in headers.items() if k not in sensitive_headers}
+
+def parse_content_length(value: Optional[str]) -> Optional[int]:
+    """A Content-Length header as an int, or None if it is missing or malformed"""
+    if value is None:
+        return None
+    try:
+        length = int(value)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine without awaiting it"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
@@ -0,0 +1,91 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+
+import structlog
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json or console
+# Fraction of debug/info events kept; warnings and errors are never sampled out
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+_listener = None
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that hands the raw record to the listener thread.
+
+    The stock ``prepare`` formats the message in the calling thread; here all
+    rendering happens on the listener, and a full queue drops the record
+    instead of blocking the event loop.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+def _sample(logger, method_name: str, event_dict: dict) -> dict:
+    if method_name in ("debug", "info") and LOG_SAMPLE_RATE < 1 and random.random() >= LOG_SAMPLE_RATE:
+        raise structlog.DropEvent
+    return event_dict
+
+def configure_logging():
+    """Route structlog through a queue so rendering and I/O happen off the event loop"""
+    global _listener
+    if _listener is not None:
+        return
+
+    renderer = structlog.processors.JSONRenderer() if LOG_FORMAT == "json" else structlog.dev.ConsoleRenderer(colors=False)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(structlog.stdlib.ProcessorFormatter(
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            renderer
+        ]
+    ))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [_NonBlockingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            _sample,
+            structlog.contextvars.merge_contextvars,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True
+    )
+
+def get_logger(name: str = None):
+    configure_logging()
+    return structlog.get_logger(name)
+
+def bind_request_id(request_id: str = None) -> str:
+    """Attach a correlation ID to every log line emitted while handling this request"""
+    request_id = request_id or uuid.uuid4().hex
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(request_id=request_id)
+    return request_id
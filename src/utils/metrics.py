@@ -0,0 +1,182 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from utils.cache import get_cache_stats
+from utils.singleflight import get_singleflight_stats
+from utils.circuit_breaker import get_breaker_stats, state_value
+from utils.log import get_logger
+
+# Latency buckets in seconds, from cache hits (sub-millisecond) to Selenium fallbacks
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = get_logger(__name__)
+_metrics = []
+_collectors = []
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter, optionally split by label values"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect plus three additions"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            # [per-bucket counts..., +Inf count, sum]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                bucket_label = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, bucket_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+def register_collector(collector: Callable[[], Iterable[tuple]]):
+    """Register a callable run at scrape time.
+
+    It yields ``(name, kind, documentation, labels_dict, value)`` tuples, for
+    values that already live elsewhere (cache stats, pool state) and would be
+    wasteful to mirror on every request.
+    """
+    _collectors.append(collector)
+
+def render_metrics() -> str:
+    """Everything in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+
+    # Samples of one metric family must be contiguous, so group them by name
+    families = {}
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            logger.warning("metrics_collector_failed", error=str(e))
+            continue
+        for name, kind, documentation, labels, value in samples:
+            family = families.setdefault(name, [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"])
+            family.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+def content_class(content_type: str) -> str:
+    """Collapse a content type from get_content_type into a low-cardinality label"""
+    if content_type.startswith("text/html"):
+        return "html"
+    if content_type.startswith("text/css"):
+        return "css"
+    if "javascript" in content_type:
+        return "js"
+    if content_type.startswith("font/"):
+        return "font"
+    if content_type.startswith("image/"):
+        return "image"
+    return "other"
+
+# Shared request metrics for both proxy routers
+REQUESTS = Counter(
+    "proxy_requests_total", "Proxied requests by router, content class, serving path and status",
+    ("router", "content", "source", "status")
+)
+REQUEST_LATENCY = Histogram(
+    "proxy_request_duration_seconds", "Time to produce the response (first byte for streams)",
+    ("router", "content", "source")
+)
+UPSTREAM_RESPONSES = Counter(
+    "proxy_upstream_responses_total", "Responses received from the upstream by status code",
+    ("router", "status")
+)
+SELENIUM_DURATION = Histogram(
+    "proxy_selenium_fetch_duration_seconds", "Duration of completed Selenium fallback fetches",
+    ("outcome",)
+)
+
+def observe_request(router: str, labels: dict, status: int, started: float):
+    """Record one proxied request; ``labels`` holds the 'content' and 'source' set by the handler"""
+    content = labels.get("content", "other")
+    source = labels.get("source", "error")
+    REQUESTS.inc(router, content, source, str(status))
+    REQUEST_LATENCY.observe(time.perf_counter() - started, router, content, source)
+
+def _collect_cache_stats():
+    for cache, stats in get_cache_stats().items():
+        labels = {"cache": cache}
+        yield "proxy_cache_entries", "gauge", "Entries in the response cache", labels, stats["entries"]
+        yield "proxy_cache_bytes", "gauge", "Bytes held by the response cache", labels, stats["bytes"]
+        yield "proxy_cache_hits_total", "counter", "Fresh cache hits", labels, stats["hits"]
+        yield "proxy_cache_stale_hits_total", "counter", "Stale cache hits served while revalidating", labels, stats["stale_hits"]
+        yield "proxy_cache_misses_total", "counter", "Cache misses", labels, stats["misses"]
+        yield "proxy_cache_evictions_total", "counter", "LRU evictions", labels, stats["evictions"]
+        yield "proxy_cache_hit_ratio", "gauge", "Share of lookups served from cache", labels, stats["hit_ratio"]
+
+def _collect_singleflight_stats():
+    for group, stats in get_singleflight_stats().items():
+        labels = {"group": group}
+        yield "proxy_singleflight_in_flight", "gauge", "Upstream fetches currently being coalesced", labels, stats["in_flight"]
+        yield "proxy_singleflight_waiters", "gauge", "Callers waiting on a coalesced fetch", labels, stats["waiters"]
+        yield "proxy_singleflight_shared_total", "counter", "Calls that reused another caller's fetch", labels, stats["shared"]
+        yield "proxy_singleflight_dedup_ratio", "gauge", "Share of calls served by a shared fetch", labels, stats["dedup_ratio"]
+
+def _collect_breaker_stats():
+    for upstream, stats in get_breaker_stats().items():
+        labels = {"upstream": upstream}
+        yield "proxy_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)", labels, state_value(stats["state"])
+        yield "proxy_circuit_failure_ratio", "gauge", "Share of failed upstream calls in the breaker window", labels, stats["failure_ratio"]
+        yield "proxy_circuit_slow_call_ratio", "gauge", "Share of slow upstream calls in the breaker window", labels, stats["slow_call_ratio"]
+        yield "proxy_circuit_opened_total", "counter", "Times the circuit opened", labels, stats["opened"]
+        yield "proxy_circuit_rejected_total", "counter", "Upstream calls refused while the circuit was open", labels, stats["rejected"]
+
+register_collector(_collect_cache_stats)
+register_collector(_collect_singleflight_stats)
+register_collector(_collect_breaker_stats)
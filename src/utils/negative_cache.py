@@ -0,0 +1,81 @@
+"""Short-lived cache of upstream failures, kept apart from the response caches.
+
+Entries live in their own ResponseCache so a burst of 404s can never evict
+good pages, and the whole tier is dropped when the session or cookies change
+(a 403 is often just an expired session).
+"""
+import json
+import os
+from typing import Optional
+
+from utils.cache import ResponseCache, CacheEntry
+from utils import shared_state
+from utils.helpers import parse_content_length
+
+# Seconds a failure is remembered, by exact status, then status class, then
+# 'failed' (HTML whose HTTPX and Selenium attempts both failed). 0 disables.
+# Override with NEGATIVE_CACHE_TTLS, e.g. '{"404": 120, "5xx": 0}'
+DEFAULT_NEGATIVE_TTLS = {
+    "404": 60,
+    "410": 300,
+    "401": 10,
+    "403": 10,
+    "429": 0,  # the upstream's Retry-After is its business, not ours to stretch
+    "4xx": 30,
+    "5xx": 5,
+    "failed": 30
+}
+# Error bodies larger than this are streamed and not remembered
+NEGATIVE_CACHE_MAX_BODY = int(os.getenv("NEGATIVE_CACHE_MAX_BODY", 64 * 1024))
+
+def _load_negative_ttls() -> dict:
+    ttls = dict(DEFAULT_NEGATIVE_TTLS)
+    overrides = os.getenv("NEGATIVE_CACHE_TTLS")
+    if overrides:
+        ttls.update({k: float(v) for k, v in json.loads(overrides).items()})
+    return ttls
+
+_negative_ttls = _load_negative_ttls()
+
+def negative_ttl(status: Optional[int]) -> float:
+    """How long to remember a failure with this upstream status (None = no usable response)"""
+    if status is None:
+        return _negative_ttls.get("failed", 0)
+    ttl = _negative_ttls.get(str(status))
+    if ttl is None:
+        ttl = _negative_ttls.get(f"{status // 100}xx", 0)
+    return ttl
+
+def is_cacheable_failure(status: int, content_length: Optional[str] = None) -> bool:
+    """Whether an upstream error response is worth buffering for the negative cache"""
+    if status < 400 or status == 416 or negative_ttl(status) <= 0:
+        return False
+    # A missing or malformed length is unknown: the body is read up to the limit
+    length = parse_content_length(content_length)
+    return length is None or length <= NEGATIVE_CACHE_MAX_BODY
+
+def create_negative_cache(name: str) -> ResponseCache:
+    """A negative cache for one router, shared across workers like the response caches"""
+    cache = ResponseCache(
+        name,
+        max_entries=int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", 1000)),
+        max_bytes=int(os.getenv("NEGATIVE_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+        ttl=_negative_ttls.get("failed", 0)
+    )
+    shared_state.share_cache(cache)
+    return cache
+
+def remember_failure(cache: ResponseCache, key, value: dict, status: Optional[int], size: int = 0) -> bool:
+    """Store a failure for its status's TTL; returns False if that status is not cached"""
+    ttl = negative_ttl(status)
+    if ttl <= 0 or size > NEGATIVE_CACHE_MAX_BODY:
+        return False
+    shared_state.store(cache, key, value, size=size, ttl=ttl)
+    return True
+
+async def lookup_failure(cache: ResponseCache, key) -> Optional[CacheEntry]:
+    """A remembered failure for ``key`` that has not expired yet"""
+    entry = await shared_state.lookup(cache, key)
+    if entry is None or entry.is_stale():
+        return None
+    return entry
@@ -0,0 +1,137 @@
+"""Byte-range requests (RFC 9110 section 14) served from cached bodies or disk blobs."""
+import asyncio
+import os
+import uuid
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, List, Mapping, Optional, Tuple
+
+from starlette.responses import Response, StreamingResponse
+
+# More ranges than this is treated as abuse and answered with the full body
+MAX_RANGES = int(os.getenv("MAX_RANGES", 16))
+FILE_CHUNK_SIZE = 64 * 1024
+
+Reader = Callable[[int, int], AsyncIterator[bytes]]
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """Inclusive (start, end) pairs for a Range header.
+
+    Returns None when the header should be ignored (absent, not bytes,
+    malformed, too many ranges) and [] when no range is satisfiable.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else max(start, size - 1)
+                if start > end:
+                    return None
+            else:
+                suffix = int(last)  # "-N": the last N bytes
+                if suffix == 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+def if_range_matches(request_headers: Mapping, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """Whether a Range may be honoured given If-Range (strong comparison only)"""
+    if_range = request_headers.get("if-range")
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag is not None and not etag.startswith("W/") and if_range == etag
+    if not last_modified:
+        return False
+    try:
+        return parsedate_to_datetime(if_range) == parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+def requested_ranges(request_headers: Mapping, size: int, etag: Optional[str] = None,
+                     last_modified: Optional[str] = None) -> Optional[List[Tuple[int, int]]]:
+    """parse_range for a request, honouring If-Range"""
+    header = request_headers.get("range")
+    if not header or not if_range_matches(request_headers, etag, last_modified):
+        return None
+    return parse_range(header, size)
+
+def memory_reader(content: bytes) -> Reader:
+    async def read(start: int, end: int):
+        yield content[start:end + 1]
+    return read
+
+def file_reader(path: str) -> Reader:
+    """Read [start, end] of a file in chunks, off the event loop"""
+    async def read(start: int, end: int):
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(None, open, path, "rb")
+        try:
+            await loop.run_in_executor(None, f.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await loop.run_in_executor(None, f.read, min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+    return read
+
+def range_not_satisfiable(size: int, headers: Mapping) -> Response:
+    headers = {k: v for k, v in headers.items() if k.lower() not in ("content-type", "content-length", "content-encoding")}
+    headers["Content-Range"] = f"bytes */{size}"
+    return Response(status_code=416, headers=headers)
+
+def range_response(ranges: List[Tuple[int, int]], size: int, headers: Mapping, read: Reader) -> Response:
+    """206 for one range, or multipart/byteranges for several; 416 when none is satisfiable"""
+    if not ranges:
+        return range_not_satisfiable(size, headers)
+    headers = {k: v for k, v in headers.items() if k.lower() != "content-length"}
+    headers["Accept-Ranges"] = "bytes"
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(read(start, end), status_code=206, headers=headers)
+
+    content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "application/octet-stream")
+    headers = {k: v for k, v in headers.items() if k.lower() != "content-type"}
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n".encode()
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+
+    async def body():
+        for part_header, (start, end) in zip(part_headers, ranges):
+            yield part_header
+            async for chunk in read(start, end):
+                yield chunk
+        yield closing
+
+    length = sum(len(h) + end - start + 1 for h, (start, end) in zip(part_headers, ranges)) + len(closing)
+    headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(body(), status_code=206, headers=headers)
@@ -0,0 +1,205 @@
+"""Per-client token buckets in front of the shared upstream session."""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from config import env_bool
+from utils.metrics import register_collector
+
+class RateLimited(Exception):
+    """Raised when a client's bucket is empty and its wait queue is full or too long"""
+
+    def __init__(self, identity: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {identity}")
+        self.identity = identity
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``.
+
+    Tokens may go negative: each waiting request reserves the next token
+    ahead of time, so waiters are served in arrival order and the wait for
+    a new request is just the current debt divided by the rate.
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated", "waiting")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.waiting = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class ClientLimiter:
+    """Token bucket per client identity, with a bounded per-client wait queue.
+
+    A request takes a token and proceeds at once while the client's bucket
+    has some. Otherwise it reserves the next token and sleeps until it is
+    due, unless that client already has ``max_queue`` requests waiting or
+    the wait would exceed ``max_wait``: then it is rejected immediately. One
+    heavy client only ever queues behind itself. Buckets that have refilled
+    and have no waiters are dropped by a sweep every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, rate: float, burst: float, max_queue: int, max_wait: float,
+                 overrides: Optional[dict] = None, sweep_interval: float = 60):
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.overrides = overrides or {}  # identity -> {"rate": ..., "burst": ...}
+        self.sweep_interval = sweep_interval
+
+        self._buckets = {}
+        self._last_sweep = time.monotonic()
+
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+
+    def _bucket(self, identity: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(identity)
+        if bucket is None:
+            if now - self._last_sweep >= self.sweep_interval:
+                self.sweep(now)
+            settings = self.overrides.get(identity, {})
+            bucket = self._buckets[identity] = TokenBucket(
+                settings.get("rate", self.rate), settings.get("burst", self.burst), now
+            )
+        else:
+            bucket.refill(now)
+        return bucket
+
+    async def acquire(self, identity: str):
+        """Wait for this client's next token; raises RateLimited instead of queueing too long"""
+        now = time.monotonic()
+        bucket = self._bucket(identity, now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            self.admitted += 1
+            return
+        wait = (1 - bucket.tokens) / bucket.rate
+        if bucket.waiting >= self.max_queue or wait > self.max_wait:
+            self.rejected += 1
+            raise RateLimited(identity, wait)
+
+        bucket.tokens -= 1  # reserve the next token
+        bucket.waiting += 1
+        self.delayed += 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            bucket.tokens += 1  # the client went away: hand the token back
+            raise
+        finally:
+            bucket.waiting -= 1
+        self.admitted += 1
+
+    def sweep(self, now: float = None) -> int:
+        """Drop buckets that are full again and have nobody waiting"""
+        now = now or time.monotonic()
+        idle = []
+        for identity, bucket in self._buckets.items():
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst and not bucket.waiting:
+                idle.append(identity)
+        for identity in idle:
+            del self._buckets[identity]
+        self._last_sweep = now
+        return len(idle)
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "clients": len(self._buckets),
+            "waiting": sum(bucket.waiting for bucket in self._buckets.values()),
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected
+        }
+
+def _load_api_keys() -> dict:
+    """Configured API keys (comma-separated API_KEY) -> the identity their requests are keyed by"""
+    keys = [key.strip() for key in os.getenv("API_KEY", "").split(",") if key.strip()]
+    # Identities show up in stats and logs, so never use the key itself
+    return {key: "key:" + hashlib.blake2b(key.encode(), digest_size=6).hexdigest() for key in keys}
+
+_api_keys = _load_api_keys()
+_trust_forwarded_for = env_bool("TRUST_X_FORWARDED_FOR", False)
+
+def client_identity(request: Request) -> str:
+    """The rate-limit key for a request: its API key if it presents a configured one, else its IP"""
+    presented = request.headers.get("x-api-key")
+    if presented is None:
+        authorization = request.headers.get("authorization", "")
+        if authorization[:7].lower() == "bearer ":
+            presented = authorization[7:].strip()
+    if presented:
+        for key, identity in _api_keys.items():
+            if hmac.compare_digest(presented.encode(), key.encode()):
+                return identity
+    if _trust_forwarded_for:
+        # The right-most entry is the address our load balancer saw
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return "ip:" + forwarded.rsplit(",", 1)[-1].strip()
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+def _key_overrides() -> dict:
+    """API-key clients get the RATE_LIMIT_KEY_* allowance; RATE_LIMIT_OVERRIDES sets any identity's"""
+    overrides = {identity: {"rate": float(os.getenv("RATE_LIMIT_KEY_RATE", 50)),
+                            "burst": float(os.getenv("RATE_LIMIT_KEY_BURST", 200))}
+                 for identity in _api_keys.values()}
+    # e.g. '{"ip:10.0.0.5": {"rate": 100, "burst": 400}}'
+    for identity, settings in json.loads(os.getenv("RATE_LIMIT_OVERRIDES", "{}")).items():
+        overrides.setdefault(identity, {}).update(settings)
+    return overrides
+
+# Off unless asked for: clients are keyed by socket IP, so behind a load
+# balancer or NAT (without TRUST_X_FORWARDED_FOR) everyone would share one
+# 10/s bucket. Set RATE_LIMIT_ENABLED=1 only once client_identity can tell
+# clients apart, and size RATE_LIMIT_RATE/BURST for the busiest one.
+rate_limit_enabled = env_bool("RATE_LIMIT_ENABLED", False)
+client_limiter = ClientLimiter(
+    rate=float(os.getenv("RATE_LIMIT_RATE", 10)),
+    burst=float(os.getenv("RATE_LIMIT_BURST", 50)),
+    max_queue=int(os.getenv("RATE_LIMIT_QUEUE", 20)),
+    max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", 5)),
+    overrides=_key_overrides()
+)
+
+def _collect_rate_limit_metrics():
+    stats = client_limiter.stats()
+    yield "proxy_rate_limit_clients", "gauge", "Clients with a live token bucket", {}, stats["clients"]
+    yield "proxy_rate_limit_waiting", "gauge", "Requests queued for a token", {}, stats["waiting"]
+    for outcome in ("admitted", "delayed", "rejected"):
+        yield "proxy_rate_limit_requests_total", "counter", "Rate limiter decisions (delayed requests are also admitted)", {"outcome": outcome}, stats[outcome]
+
+register_collector(_collect_rate_limit_metrics)
+
+async def throttle(request: Request):
+    """Admit a request that is about to use the upstream session, or raise RateLimited"""
+    if rate_limit_enabled:
+        await client_limiter.acquire(client_identity(request))
+
+def too_many_requests_response(error: RateLimited) -> Response:
+    retry_after = max(1, int(error.retry_after + 0.999))
+    return Response(
+        content=f"Too many requests, retry in {retry_after}s",
+        status_code=429,
+        headers={"Retry-After": str(retry_after), "Content-Type": "text/plain"}
+    )
@@ -0,0 +1,136 @@
+"""Client request bodies: size limit, streaming to upstream and optional spooling to disk."""
+import asyncio
+import os
+import tempfile
+from typing import AsyncIterator, Optional, Tuple, Union
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from config import env_bool
+from utils.helpers import parse_content_length
+
+MAX_REQUEST_BODY = int(os.getenv("MAX_REQUEST_BODY_BYTES", 10 * 1024 * 1024))
+# Bodies of known length up to this are read into memory; also the in-memory part of a spool
+REQUEST_BODY_BUFFER = int(os.getenv("REQUEST_BODY_BUFFER_BYTES", 64 * 1024))
+# Receive large uploads completely before contacting upstream, so a slow
+# client does not hold an upstream connection open
+REQUEST_BODY_SPOOL = env_bool("REQUEST_BODY_SPOOL", False)
+REQUEST_BODY_SPOOL_DIR = os.getenv("REQUEST_BODY_SPOOL_DIR") or None
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+class RequestBodyTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Request body exceeds {limit} bytes")
+        self.limit = limit
+
+async def _limited(stream: AsyncIterator[bytes], limit: int):
+    """Pass chunks through, raising RequestBodyTooLarge once more than ``limit`` bytes arrived"""
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > limit:
+            raise RequestBodyTooLarge(limit)
+        if chunk:
+            yield chunk
+
+async def _spool(chunks: AsyncIterator[bytes]) -> Tuple[tempfile.SpooledTemporaryFile, int]:
+    """Write the whole body to a temp file (kept in memory while small), rewound for reading"""
+    loop = asyncio.get_running_loop()
+    spool = tempfile.SpooledTemporaryFile(max_size=REQUEST_BODY_BUFFER, dir=REQUEST_BODY_SPOOL_DIR)
+    try:
+        async for chunk in chunks:
+            await loop.run_in_executor(None, spool.write, chunk)
+        length = spool.tell()
+        await loop.run_in_executor(None, spool.seek, 0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, length
+
+class StreamedBody:
+    """A body passed to upstream as the client sends it, refused past ``limit`` bytes.
+
+    ``length`` is the client's Content-Length, or None for a chunked upload.
+    """
+
+    def __init__(self, stream: AsyncIterator[bytes], limit: int, length: Optional[int] = None):
+        self._chunks = _limited(stream, limit)
+        self.length = length
+
+    def __aiter__(self):
+        return self._chunks
+
+    async def aclose(self):
+        await self._chunks.aclose()
+
+class SpooledBody:
+    """A fully received body in a temp file, streamed to upstream in chunks.
+
+    Iterating closes the file at the end; aclose() releases it when the body
+    is never sent (e.g. the breaker refused the upstream call).
+    """
+
+    def __init__(self, spool: tempfile.SpooledTemporaryFile, length: int):
+        self._spool = spool
+        self.length = length
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, self._spool.read, SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self._spool.close()
+
+    async def aclose(self):
+        self._spool.close()
+
+async def read_request_body(request: Request) -> Union[bytes, StreamedBody, SpooledBody]:
+    """The client's body as HTTPX ``content``, without buffering large uploads.
+
+    A Content-Length above MAX_REQUEST_BODY is refused before anything is
+    read. Small bodies of known length come back as bytes; others as an
+    async iterator that streams to upstream as it arrives (or, with
+    REQUEST_BODY_SPOOL, from a temp file once fully received) and raises
+    RequestBodyTooLarge if a body without a length runs past the limit.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is None and "transfer-encoding" not in request.headers:
+        return b""
+    length = parse_content_length(content_length)
+    if length is not None:
+        if length > MAX_REQUEST_BODY:
+            raise RequestBodyTooLarge(MAX_REQUEST_BODY)
+        if length <= REQUEST_BODY_BUFFER:
+            return await request.body()
+
+    body = StreamedBody(request.stream(), MAX_REQUEST_BODY, length)
+    if REQUEST_BODY_SPOOL:
+        return SpooledBody(*await _spool(body))
+    return body
+
+def upstream_body(body: Union[bytes, StreamedBody, SpooledBody], headers) -> dict:
+    """HTTPX arguments sending ``body`` from read_request_body with ``headers``.
+
+    A streamed body of known length keeps its Content-Length instead of going
+    out chunked. It can only be read once, so redirects are not followed: a
+    307/308 would have to send it again, and goes back to the client instead.
+    """
+    if isinstance(body, bytes):
+        return {"content": body, "headers": headers}
+    if body.length is not None:
+        headers = dict(headers, **{"Content-Length": str(body.length)})
+    return {"content": body, "headers": headers, "follow_redirects": False}
+
+async def close_request_body(body: Union[bytes, StreamedBody, SpooledBody]):
+    """Release a body from read_request_body that upstream did not consume"""
+    aclose = getattr(body, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+def payload_too_large_response(error: RequestBodyTooLarge) -> Response:
+    return Response(content=str(error), status_code=413, headers={"Content-Type": "text/plain", "Connection": "close"})
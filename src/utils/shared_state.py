@@ -0,0 +1,319 @@
+"""Cache and session state shared between uvicorn worker processes.
+
+With ``WORKERS > 1`` main.py starts one state-server process that owns a
+shared tier of every ResponseCache plus a set of version counters, reachable
+over a local Unix socket (no external service). Each worker keeps its own
+in-process cache as a first tier and falls back to the shared tier on a miss,
+so a page fetched by one worker is a hit for all of them. Clearing a cache or
+updating cookies bumps a version counter; workers poll the counters and drop
+their local tier or reload cookies when one changes.
+
+Only caches and version counters are shared. Circuit breakers and the
+per-client rate limiter stay per process, so with N workers each client
+really gets ``RATE_LIMIT_RATE``/``RATE_LIMIT_BURST`` times N, and each
+worker trips its own breaker.
+
+Frames are JSON (bytes as base64), never pickle, so a process on the other
+end of the socket can at worst send bad data. main.py puts the socket in a
+private ``mkdtemp`` directory; a configured path is refused if another user
+owns it.
+
+Without a socket configured every helper here degrades to the local cache.
+"""
+import asyncio
+import base64
+import json
+import os
+import struct
+import time
+from typing import Callable, Optional
+
+from utils.cache import ResponseCache, CacheEntry
+from utils.helpers import run_in_background
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+SHARED_STATE_SOCKET_ENV = "SHARED_STATE_SOCKET"
+POLL_INTERVAL = float(os.getenv("SHARED_STATE_POLL_INTERVAL", 1))
+CLIENT_CONNECTIONS = int(os.getenv("SHARED_STATE_CONNECTIONS", 4))
+REQUEST_TIMEOUT = float(os.getenv("SHARED_STATE_TIMEOUT", 0.5))
+
+_header = struct.Struct("!I")
+
+def _encode(obj):
+    """Cache values as JSON: bytes become {"__b": base64}, dicts with non-string keys {"__d": pairs}"""
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__b": base64.b64encode(obj).decode("ascii")}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(item) for item in obj]
+    if hasattr(obj, "items"):
+        if all(isinstance(key, str) and not key.startswith("__") for key in obj):
+            return {key: _encode(value) for key, value in obj.items()}
+        return {"__d": [[_encode(key), _encode(value)] for key, value in obj.items()]}
+    return obj
+
+def _decode(obj: dict):
+    if len(obj) == 1:
+        if "__b" in obj:
+            return base64.b64decode(obj["__b"])
+        if "__d" in obj:
+            return {key: value for key, value in obj["__d"]}
+    return obj
+
+async def _read_frame(reader: asyncio.StreamReader):
+    size, = _header.unpack(await reader.readexactly(_header.size))
+    return json.loads(await reader.readexactly(size), object_hook=_decode)
+
+def _write_frame(writer: asyncio.StreamWriter, message):
+    payload = json.dumps(_encode(message), separators=(",", ":")).encode()
+    writer.write(_header.pack(len(payload)) + payload)
+
+def _check_owner(path: str):
+    """Refuse a socket path that exists and belongs to another user"""
+    try:
+        owner = os.lstat(path).st_uid
+    except FileNotFoundError:
+        return
+    if owner != os.getuid():
+        raise PermissionError(f"{path} belongs to uid {owner}, not to this user; refusing to use it")
+
+# --- server (runs in its own process) ---
+
+class _StateServer:
+    def __init__(self):
+        self.caches = {}
+        self.versions = {}
+
+    def _cache(self, name: str, limits: dict = None) -> Optional[ResponseCache]:
+        cache = self.caches.get(name)
+        if cache is None and limits is not None:
+            cache = self.caches[name] = ResponseCache(f"shared-{name}", **limits)
+        return cache
+
+    def handle(self, op: str, args: tuple):
+        if op == "get":
+            name, key = args
+            cache = self._cache(name)
+            entry = cache.lookup(key) if cache else None
+            if entry is None:
+                return None
+            now = time.time()
+            return entry.value, entry.size, entry.fresh_until - now, entry.expires_at - max(now, entry.fresh_until)
+        if op == "set":
+            name, limits, key, value, size, ttl, stale_ttl = args
+            self._cache(name, limits).set(key, value, size, ttl=ttl, stale_ttl=stale_ttl)
+            return True
+        if op == "touch":
+            name, key = args
+            cache = self._cache(name)
+            return cache.touch(key) if cache else False
+        if op == "clear":
+            name, = args
+            cache = self._cache(name)
+            count = cache.clear() if cache else 0
+            self.versions[f"cache:{name}"] = self.versions.get(f"cache:{name}", 0) + 1
+            return count, self.versions[f"cache:{name}"]
+        if op == "bump":
+            counter, = args
+            self.versions[counter] = self.versions.get(counter, 0) + 1
+            return self.versions[counter]
+        if op == "versions":
+            return dict(self.versions)
+        if op == "stats":
+            return {name: cache.stats() for name, cache in self.caches.items()}
+        raise ValueError(f"Unknown shared state op: {op}")
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                op, args = await _read_frame(reader)
+                try:
+                    _write_frame(writer, (True, self.handle(op, args)))
+                except Exception as e:
+                    _write_frame(writer, (False, str(e)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, TypeError) as e:
+            logger.warning("shared_state_bad_frame", error=str(e))  # not one of our workers: hang up
+        finally:
+            writer.close()
+
+def run_state_server(path: str):
+    """Process entry point: serve shared state on a Unix socket until killed"""
+    async def main():
+        _check_owner(path)
+        if os.path.lexists(path):
+            os.unlink(path)  # left behind by a previous run of ours
+        state = _StateServer()
+        server = await asyncio.start_unix_server(state.serve_connection, path=path)
+        os.chmod(path, 0o600)  # only our own user may connect
+        logger.info("shared_state_listening", path=path)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+# --- client (one per worker) ---
+
+class _Connection:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self.reader = None
+        self.writer = None
+
+    async def call(self, op: str, args: tuple):
+        async with self.lock:
+            try:
+                if self.writer is None:
+                    _check_owner(self.path)
+                    self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                _write_frame(self.writer, (op, args))
+                await self.writer.drain()
+                ok, result = await _read_frame(self.reader)
+            except BaseException:
+                # Drop the connection so a half-read frame never leaks into the next call
+                if self.writer is not None:
+                    self.writer.close()
+                self.reader = self.writer = None
+                raise
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+class SharedStateClient:
+    """Small pool of Unix-socket connections to the state server"""
+
+    def __init__(self, path: str, callbacks: dict, connections: int = CLIENT_CONNECTIONS):
+        self.path = path
+        self._connections = [_Connection(path) for _ in range(connections)]
+        self._next = 0
+        self._callbacks = callbacks
+        self._versions = {}
+        self._poller = None
+
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.errors = 0
+
+    async def call(self, op: str, *args, default=None):
+        """Run one operation; failures are logged and return ``default``"""
+        connection = self._connections[self._next]
+        self._next = (self._next + 1) % len(self._connections)
+        try:
+            return await asyncio.wait_for(connection.call(op, args), REQUEST_TIMEOUT)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("shared_state_call_failed", op=op, error=str(e))
+            return default
+
+    def note_version(self, counter: str, version: Optional[int]):
+        """Record a version this worker produced itself, so the poll does not call it back"""
+        if version is not None and version > self._versions.get(counter, 0):
+            self._versions[counter] = version
+
+    def start_polling(self):
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll_versions())
+
+    async def _poll_versions(self):
+        self._versions = await self.call("versions", default={}) or {}
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            versions = await self.call("versions")
+            if versions is None:
+                continue
+            for counter, version in versions.items():
+                # Counters only grow; one at or below what we know is our own bump or clear
+                if version <= self._versions.get(counter, 0):
+                    continue
+                self._versions[counter] = version
+                if counter in self._callbacks:
+                    try:
+                        result = self._callbacks[counter]()
+                        if asyncio.iscoroutine(result):
+                            await result
+                    except Exception as e:
+                        logger.warning("shared_state_callback_failed", counter=counter, error=str(e))
+
+    def stats(self) -> dict:
+        return {
+            "socket": self.path,
+            "remote_hits": self.remote_hits,
+            "remote_misses": self.remote_misses,
+            "errors": self.errors
+        }
+
+_client = None
+# counter name -> callback run in every worker when another worker bumps it
+_version_callbacks = {}
+
+def get_client() -> Optional[SharedStateClient]:
+    return _client
+
+def on_version_change(counter: str, callback: Callable):
+    """Run ``callback`` (sync or async) whenever ``counter`` changes on the state server"""
+    _version_callbacks[counter] = callback
+
+def share_cache(cache: ResponseCache):
+    """Register a cache whose contents should be shared across workers"""
+    on_version_change(f"cache:{cache.name}", cache.clear)
+
+async def connect_shared_state(path: str = None) -> Optional[SharedStateClient]:
+    """Connect this worker to the state server, if one is configured"""
+    global _client
+    path = path or os.getenv(SHARED_STATE_SOCKET_ENV)
+    if not path or _client is not None:
+        return _client
+    _client = SharedStateClient(path, _version_callbacks)
+    _client.start_polling()
+    logger.info("shared_state_connected", path=path, pid=os.getpid())
+    return _client
+
+def _limits(cache: ResponseCache) -> dict:
+    return {"max_entries": cache.max_entries, "max_bytes": cache.max_bytes, "ttl": cache.ttl}
+
+async def lookup(cache: ResponseCache, key) -> Optional[CacheEntry]:
+    """Local lookup, falling back to the shared tier and filling the local tier from it"""
+    entry = cache.lookup(key)
+    if entry is not None or _client is None:
+        return entry
+    remote = await _client.call("get", cache.name, key)
+    if remote is None:
+        _client.remote_misses += 1
+        return None
+    _client.remote_hits += 1
+    value, size, fresh_for, stale_for = remote
+    cache.set(key, value, size, ttl=max(0.0, fresh_for), stale_ttl=max(0.0, stale_for))
+    return cache.peek(key)
+
+def store(cache: ResponseCache, key, value, size: int, ttl: float = None, stale_ttl: float = 0):
+    """Set locally and publish to the shared tier in the background"""
+    cache.set(key, value, size, ttl=ttl, stale_ttl=stale_ttl)
+    if _client is not None:
+        run_in_background(_client.call("set", cache.name, _limits(cache), key, value, size, ttl, stale_ttl))
+
+def touch(cache: ResponseCache, key) -> bool:
+    """Mark an entry fresh locally and in the shared tier"""
+    found = cache.touch(key)
+    if _client is not None:
+        run_in_background(_client.call("touch", cache.name, key))
+    return found
+
+async def clear(cache: ResponseCache) -> int:
+    """Clear a cache in this worker, the shared tier and (via the version poll) every other worker"""
+    count = cache.clear()
+    if _client is not None:
+        remote = await _client.call("clear", cache.name)
+        if remote is not None:
+            remote_count, version = remote
+            _client.note_version(f"cache:{cache.name}", version)
+            count = max(count, remote_count)
+    return count
+
+async def bump(counter: str):
+    """Tell the other workers that some shared state (e.g. 'cookies') changed"""
+    if _client is not None:
+        _client.note_version(counter, await _client.call("bump", counter))
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, Tuple
+
+# Every single-flight group created in the process, keyed by name
+_groups = {}
+
+def flight_key(method: str, url: str, headers: dict = None, vary: Iterable[str] = ()) -> str:
+    """Build a coalescing key from the method, URL and the headers that change the response"""
+    parts = [method.upper(), url]
+    if headers:
+        lowered = {k.lower(): v for k, v in headers.items()}
+        parts.extend(f"{name}={lowered.get(name.lower(), '')}" for name in vary)
+    return "|".join(parts)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) starts the work as its own task;
+    callers that arrive while it is running await the same task and share its
+    result or exception. The task is shielded, so a leader whose client
+    disconnects does not cancel the fetch for everyone else.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight = {}
+        self._waiters = {}
+
+        self.leaders = 0
+        self.shared = 0
+
+        _groups[name] = self
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per key; returns ``(result, shared)``"""
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            remaining = self._waiters.get(key, 1) - 1
+            if remaining:
+                self._waiters[key] = remaining
+            else:
+                self._waiters.pop(key, None)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Nobody may be left to retrieve the exception, don't log it as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.shared
+        return {
+            "in_flight": len(self._in_flight),
+            "waiters": sum(self._waiters.values()),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "dedup_ratio": self.shared / calls if calls else 0.0
+        }
+
+def get_singleflight_stats() -> dict:
+    """Stats for every single-flight group in the process, keyed by name"""
+    return {name: group.stats() for name, group in _groups.items()}
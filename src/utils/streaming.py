@@ -0,0 +1,127 @@
+import os
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+import anyio
+import httpx
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+from utils.encoding import accepts_encoding
+
+# Size of the chunks pulled from upstream and handed to the ASGI server
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 64 * 1024))
+
+async def open_upstream_stream(client: httpx.AsyncClient, method: str, url: str,
+                               follow_redirects: Optional[bool] = None, **kwargs) -> httpx.Response:
+    """Send a request upstream without reading the body (caller must close it)"""
+    upstream_request = client.build_request(method, url, **kwargs)
+    if follow_redirects is None:
+        follow_redirects = client.follow_redirects
+    return await client.send(upstream_request, stream=True, follow_redirects=follow_redirects)
+
+async def close_upstream(response: httpx.Response):
+    """Close an upstream response, even if the surrounding task is being cancelled"""
+    with anyio.CancelScope(shield=True):
+        await response.aclose()
+
+async def _iter_upstream(response: httpx.Response, raw: bool = False,
+                         on_body: Optional[Callable[[bytes, Optional[str]], None]] = None, max_body: int = 0):
+    """Yield upstream chunks one at a time.
+
+    Each chunk is only pulled from upstream once the ASGI server has accepted
+    the previous one, so a slow client throttles the upstream read instead of
+    piling data up in memory. If the client disconnects the generator is
+    cancelled and the upstream connection is released in ``finally``.
+
+    With ``raw`` the bytes are forwarded still compressed. With ``on_body``
+    the chunks are also collected, and once the whole body has been sent it
+    is passed to ``on_body`` with its encoding (only if it fits in ``max_body``).
+    """
+    chunks = [] if on_body is not None else None
+    collected = 0
+    iterator = response.aiter_raw(STREAM_CHUNK_SIZE) if raw else response.aiter_bytes(STREAM_CHUNK_SIZE)
+    try:
+        async for chunk in iterator:
+            if chunks is not None:
+                collected += len(chunk)
+                if collected > max_body:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+        if chunks is not None:
+            on_body(b"".join(chunks), response.headers.get("content-encoding") if raw else None)
+    finally:
+        await close_upstream(response)
+
+async def _resume(response: httpx.Response, chunks: List[bytes], iterator: AsyncIterator[bytes]):
+    """Yield the chunks read so far, then the rest of the upstream body"""
+    try:
+        for chunk in chunks:
+            yield chunk
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        await close_upstream(response)
+
+async def read_up_to(response: httpx.Response, limit: int) -> Tuple[Optional[bytes], Optional[AsyncIterator[bytes]]]:
+    """Read a (decoded) body only while it fits in ``limit`` bytes.
+
+    Returns ``(content, None)`` when the whole body fit. Otherwise returns
+    ``(None, rest)`` as soon as the limit is passed, where ``rest`` yields
+    the chunks already read and then the remainder of the stream, so memory
+    never holds more than ``limit`` plus one chunk. The caller must stream
+    ``rest`` (see stream_response's ``body``) or close the response.
+    """
+    iterator = response.aiter_bytes(STREAM_CHUNK_SIZE)
+    chunks = []
+    size = 0
+    async for chunk in iterator:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            return None, _resume(response, chunks, iterator)
+    return b"".join(chunks), None
+
+def passthrough_encoding(response: httpx.Response, accept_encoding: Optional[str]) -> Optional[str]:
+    """The upstream Content-Encoding if the client accepts it as-is, else None (decode)"""
+    coding = response.headers.get("content-encoding", "").strip().lower()
+    if not coding or coding == "identity" or "," in coding:
+        return None
+    return coding if accepts_encoding(accept_encoding, coding) else None
+
+def weak_etag(etag: Optional[str]) -> Optional[str]:
+    """The weak form of an ETag, for a decoded copy of the body it was issued for"""
+    if not etag or etag.startswith("W/"):
+        return etag
+    return "W/" + etag
+
+def stream_response(response: httpx.Response, headers: dict, status_code: int = None,
+                    on_body: Optional[Callable[[bytes, Optional[str]], None]] = None, max_body: int = 0,
+                    accept_encoding: Optional[str] = None,
+                    body: Optional[AsyncIterator[bytes]] = None) -> StreamingResponse:
+    """Wrap an open upstream response in a StreamingResponse.
+
+    When the client's ``accept_encoding`` covers the upstream Content-Encoding
+    the compressed bytes are forwarded untouched; otherwise httpx decodes them.
+    ``on_body`` optionally receives the complete body for caching. ``body``
+    (from read_up_to) replaces the upstream iterator; it is always decoded.
+    A decoded body is not the one upstream's ETag was issued for, so that
+    ETag is sent weak.
+    """
+    coding = passthrough_encoding(response, accept_encoding) if body is None else None
+    if response.headers.get("content-encoding"):
+        headers = dict(headers, Vary="Accept-Encoding")
+        if coding:
+            headers["Content-Encoding"] = coding
+            if "content-length" in response.headers:
+                headers["Content-Length"] = response.headers["content-length"]
+        else:
+            for name in [name for name in headers if name.lower() == "etag"]:
+                headers[name] = weak_etag(headers[name])
+    return StreamingResponse(
+        body if body is not None else _iter_upstream(response, coding is not None, on_body, max_body),
+        status_code=status_code or response.status_code,
+        headers=headers,
+        background=BackgroundTask(close_upstream, response)
+    )
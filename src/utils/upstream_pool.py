@@ -0,0 +1,67 @@
+import time
+
+import httpx
+
+from utils.metrics import Histogram
+
+POOL_WAIT = Histogram(
+    "proxy_upstream_pool_wait_seconds", "Time upstream requests waited for a pooled connection",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+)
+
+class PoolStats:
+    """Pool-wait timings and connection occupancy for the upstream client.
+
+    Pool wait is the time between a request being handed to the transport and
+    the first httpcore trace event, which is only emitted once a connection
+    has been checked out of the pool.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def record_wait(self, seconds: float):
+        self.requests += 1
+        self.total_wait += seconds
+        self.last_wait = seconds
+        if seconds > self.max_wait:
+            self.max_wait = seconds
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "avg_wait_ms": (self.total_wait / self.requests * 1000) if self.requests else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+            "last_wait_ms": self.last_wait * 1000
+        }
+
+pool_stats = PoolStats()
+
+async def track_pool_wait(request: httpx.Request):
+    """HTTPX request hook that times how long the request waits for a connection"""
+    started = time.perf_counter()
+    state = {"acquired": False}
+
+    async def trace(event_name: str, info: dict):
+        if not state["acquired"]:
+            state["acquired"] = True
+            wait = time.perf_counter() - started
+            pool_stats.record_wait(wait)
+            POOL_WAIT.observe(wait)
+            request.extensions["pool_wait"] = wait
+
+    request.extensions["trace"] = trace
+
+def pool_occupancy(client: httpx.AsyncClient) -> dict:
+    """Open/active/idle connection counts from the client's httpcore pool"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "active": len(connections) - idle,
+        "idle": idle
+    }
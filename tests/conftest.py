@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# The app imports its modules relative to src/ (e.g. ``from utils.cache import ...``)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.cache import ResponseCache
+from utils.circuit_breaker import CircuitBreaker
+from utils.disk_cache import DiskCache
+
+# Caches and breakers register themselves by name, so each gets its test's name
+
+@pytest.fixture
+def make_response_cache(request):
+    def make(**kwargs):
+        settings = dict(max_entries=3, max_bytes=100, ttl=60)
+        settings.update(kwargs)
+        return ResponseCache(request.node.name, **settings)
+    return make
+
+@pytest.fixture
+def make_disk_cache(request, tmp_path):
+    def make(name: str = None, **kwargs):
+        settings = dict(max_bytes=1000, max_entry_bytes=500, ttl=60, flush_interval=3600)
+        settings.update(kwargs)
+        return DiskCache(name or request.node.name, str(tmp_path), **settings)
+    return make
+
+@pytest.fixture
+def make_breaker(request):
+    def make(**kwargs):
+        settings = dict(window=60, min_calls=4, failure_ratio=0.5, slow_call_seconds=10,
+                        slow_call_ratio=0.8, open_seconds=60, half_open_probes=1)
+        settings.update(kwargs)
+        return CircuitBreaker(request.node.name, **settings)
+    return make
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils import browser_pool
+from utils.browser_pool import BrowserCancelled, BrowserPool, PoolFullError
+
+@pytest.fixture
+def killed(monkeypatch):
+    """PIDs whose process tree the pool tried to kill"""
+    pids = []
+    monkeypatch.setattr(browser_pool, "kill_process_tree", pids.append)
+    return pids
+
+@pytest.fixture
+def make_pool(request):
+    pools = []
+
+    def factory(**kwargs):
+        settings = dict(max_concurrent=1, max_queue=1, queue_timeout=1)
+        settings.update(kwargs)
+        pool = BrowserPool(request.node.name, **settings)
+        pools.append(pool)
+        return pool
+
+    yield factory
+    for pool in pools:
+        pool._executor.shutdown(wait=True)
+
+def browser(pid, seconds, started=None, exit_gate=None):
+    """Fake fetch: attaches a 'driver' PID and waits like a page load would"""
+    def fetch(handle):
+        handle.attach(pid)
+        if started is not None:
+            started.set()
+        try:
+            handle.wait(seconds)
+        except BrowserCancelled:
+            if exit_gate is not None:
+                exit_gate.wait(5)  # a driver call still unwinding after the kill
+            raise
+        return pid
+    return fetch
+
+def test_runs_the_fetch(make_pool, killed):
+    pool = make_pool()
+    assert asyncio.run(pool.run(browser(1, 0), timeout=1)) == 1
+    assert pool.stats()["completed"] == 1
+    assert killed == []
+
+def test_full_queue_rejects_at_once(make_pool, killed):
+    pool = make_pool(max_queue=1)
+
+    async def run():
+        running = asyncio.ensure_future(pool.run(browser(1, 0.2), timeout=1))
+        await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(pool.run(browser(2, 0), timeout=1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(PoolFullError):
+            await pool.run(browser(3, 0), timeout=1)
+        return await running, await queued
+
+    assert asyncio.run(run()) == (1, 2)
+    assert pool.stats()["rejected"] == 1
+
+def test_queued_caller_gives_up_after_the_queue_timeout(make_pool, killed):
+    pool = make_pool(queue_timeout=0.05)
+
+    async def run():
+        running = asyncio.ensure_future(pool.run(browser(1, 0.3), timeout=1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(PoolFullError):
+            await pool.run(browser(2, 0), timeout=1)
+        return await running
+
+    assert asyncio.run(run()) == 1
+    assert pool.stats()["rejected"] == 1
+
+def test_timeout_kills_the_process_tree(make_pool, killed):
+    pool = make_pool()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(pool.run(browser(4242, 10), timeout=0.05))
+    assert killed == [4242]
+    assert pool.stats()["timeouts"] == 1
+    assert pool.stats()["killed"] == 1
+
+def test_browser_attached_after_cancel_is_killed(make_pool, killed):
+    pool = make_pool()
+    attaching = threading.Event()
+
+    def slow_start(handle):
+        attaching.wait(5)
+        handle.attach(99)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(slow_start, timeout=0.05)
+        attaching.set()
+
+    asyncio.run(run())
+    pool._executor.shutdown(wait=True)
+    assert killed == [99]
+
+def test_slot_is_released_only_when_the_thread_exits(make_pool, killed):
+    pool = make_pool(queue_timeout=0.1)
+    started = threading.Event()
+    exit_gate = threading.Event()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(browser(1, 10, started, exit_gate), timeout=0.05)
+        # The caller gave up, but the killed browser's thread has not returned yet
+        assert pool.stats()["running"] == 1
+        with pytest.raises(PoolFullError):
+            await pool.run(browser(2, 0), timeout=1)
+
+        exit_gate.set()
+        return await pool.run(browser(3, 0), timeout=1)
+
+    assert asyncio.run(run()) == 3
+    assert started.is_set()
+    assert pool.stats()["running"] == 0
@@ -0,0 +1,99 @@
+from utils.cache import CacheEntry, get_cache_policy
+
+def age(cache, key, seconds):
+    entry = cache.peek(key)
+    entry.fresh_until -= seconds
+    entry.expires_at -= seconds
+
+def test_get_and_miss(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "value", size=5)
+    assert cache.get("a") == "value"
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entry_goes_stale_then_expires():
+    entry = CacheEntry("value", 1, ttl=10, stale_ttl=20)
+    now = entry.created_at
+    assert not entry.is_stale(now + 9)
+    assert entry.is_stale(now + 10) and not entry.is_expired(now + 29)
+    assert entry.is_expired(now + 30)
+
+def test_stale_entry_is_looked_up_but_not_returned_by_get(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "value", size=5, ttl=10, stale_ttl=20)
+    age(cache, "a", 15)
+    assert cache.get("a") is None
+    entry = cache.lookup("a")
+    assert entry is not None and entry.is_stale()
+    assert cache.stats()["stale_hits"] == 2
+
+def test_expired_entry_is_dropped_on_read(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "value", size=5, ttl=10, stale_ttl=20)
+    age(cache, "a", 31)
+    assert cache.lookup("a") is None
+    assert "a" not in cache
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["bytes"] == 0
+
+def test_touch_makes_a_stale_entry_fresh(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "value", size=5, ttl=10, stale_ttl=20)
+    age(cache, "a", 15)
+    assert cache.touch("a")
+    assert cache.get("a") == "value"
+    assert not cache.touch("missing")
+
+def test_evicts_least_recently_used_by_count(make_response_cache):
+    cache = make_response_cache()
+    for key in ("a", "b", "c"):
+        cache.set(key, key, size=1)
+    cache.get("a")
+    cache.set("d", "d", size=1)
+    assert "b" not in cache
+    assert all(key in cache for key in ("a", "c", "d"))
+    assert cache.stats()["evictions"] == 1
+
+def test_evicts_to_stay_in_byte_budget(make_response_cache):
+    cache = make_response_cache(max_entries=10)
+    cache.set("a", "a", size=40)
+    cache.set("b", "b", size=40)
+    cache.set("c", "c", size=40)
+    assert "a" not in cache
+    assert cache.stats()["bytes"] == 80
+
+def test_replacing_an_entry_updates_the_byte_count(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "old", size=30)
+    cache.set("a", "new", size=10)
+    assert cache.get("a") == "new"
+    assert cache.stats()["bytes"] == 10
+
+def test_oversized_replacement_drops_the_old_entry(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "old", size=30)
+    cache.set("a", "new", size=101)
+    assert "a" not in cache
+    assert cache.stats()["bytes"] == 0
+
+def test_sweep_removes_only_expired_entries(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "a", size=1, ttl=10)
+    cache.set("b", "b", size=1, ttl=10)
+    age(cache, "a", 11)
+    assert cache.sweep() == 1
+    assert "a" not in cache and "b" in cache
+
+def test_clear(make_response_cache):
+    cache = make_response_cache()
+    cache.set("a", "a", size=1)
+    cache.set("b", "b", size=1)
+    assert cache.clear() == 2
+    assert len(cache) == 0 and cache.stats()["bytes"] == 0
+
+def test_cache_policy_lookup():
+    assert get_cache_policy("text/html; charset=utf-8").stale_while_revalidate
+    assert get_cache_policy("image/webp") is get_cache_policy("image/png")
+    assert get_cache_policy("application/octet-stream") is get_cache_policy("*")
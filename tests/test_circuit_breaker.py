@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+import httpx
+
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitOpenError
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        assert breaker.allow()
+        breaker.record(True, 0.01)
+
+def expire_open_period(breaker):
+    breaker.opened_at -= breaker.open_seconds
+
+def test_stays_closed_below_min_calls(make_breaker):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+
+def test_stays_closed_below_failure_ratio(make_breaker):
+    breaker = make_breaker()
+    for failed in (True, False, False, False, True, False):
+        breaker.record(failed, 0.01)
+    assert breaker.state == CLOSED
+
+def test_opens_on_failures_and_rejects(make_breaker):
+    breaker = make_breaker()
+    trip(breaker)
+    assert breaker.state == OPEN
+    assert breaker.rejecting()
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    assert breaker.retry_after() > 1
+
+def test_opens_on_slow_calls(make_breaker):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(False, 11)
+    assert breaker.state == OPEN
+
+def test_half_open_probe_success_closes(make_breaker):
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open_period(breaker)
+    assert not breaker.rejecting()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the single probe slot is taken
+    breaker.record(False, 0.01, probe=True)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 0
+
+def test_half_open_probe_failure_reopens(make_breaker):
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open_period(breaker)
+    assert breaker.allow()
+    breaker.record(True, 0.01, probe=True)
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+
+def test_released_probe_frees_the_slot(make_breaker):
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open_period(breaker)
+    assert breaker.allow()
+    breaker.release(probe=True)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+def test_call_counts_5xx_and_httpx_errors(make_breaker):
+    breaker = make_breaker(min_calls=2)
+
+    async def server_error():
+        return httpx.Response(502)
+
+    async def connect_error():
+        raise httpx.ConnectError("refused")
+
+    async def run():
+        assert (await breaker.call(server_error)).status_code == 502
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(connect_error)
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(server_error)
+
+    asyncio.run(run())
+    assert breaker.state == OPEN
+
+def test_call_ignores_other_exceptions(make_breaker):
+    breaker = make_breaker(min_calls=1)
+
+    async def client_gone():
+        raise ValueError("upload aborted")
+
+    with pytest.raises(ValueError):
+        asyncio.run(breaker.call(client_gone))
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 0
@@ -0,0 +1,57 @@
+import pytest
+
+from utils.conditional import is_not_modified, make_etag
+
+ETAG = make_etag(b"hello")
+LAST_MODIFIED = "Wed, 21 Oct 2015 07:28:00 GMT"
+
+def test_make_etag_is_strong_and_content_addressed():
+    assert ETAG.startswith('"') and ETAG.endswith('"')
+    assert make_etag(b"hello") == ETAG
+    assert make_etag(b"hello!") != ETAG
+
+def test_no_validators():
+    assert not is_not_modified({}, ETAG, LAST_MODIFIED)
+
+@pytest.mark.parametrize("if_none_match", [ETAG, "W/" + ETAG, f'"other", {ETAG}', "*"])
+def test_if_none_match_hit(if_none_match):
+    assert is_not_modified({"if-none-match": if_none_match}, ETAG, None)
+
+def test_if_none_match_miss():
+    assert not is_not_modified({"if-none-match": '"other"'}, ETAG, None)
+    assert not is_not_modified({"if-none-match": ETAG}, None, None)
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    headers = {"if-none-match": '"other"', "if-modified-since": LAST_MODIFIED}
+    assert not is_not_modified(headers, ETAG, LAST_MODIFIED)
+
+def test_if_modified_since():
+    assert is_not_modified({"if-modified-since": LAST_MODIFIED}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-modified-since": "Thu, 22 Oct 2015 07:28:00 GMT"}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": "Tue, 20 Oct 2015 07:28:00 GMT"}, ETAG, LAST_MODIFIED)
+
+def test_if_modified_since_unusable():
+    assert not is_not_modified({"if-modified-since": LAST_MODIFIED}, ETAG, None)
+    assert not is_not_modified({"if-modified-since": "garbage"}, ETAG, LAST_MODIFIED)
+
+def html_request(**headers):
+    from starlette.requests import Request
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(k.encode(), v.encode()) for k, v in headers.items()]}
+    return Request(scope)
+
+def test_miss_and_precompressed_hit_share_an_etag():
+    import asyncio
+    from utils.conditional import representation_etags, representation_response
+    from utils.encoding import precompress
+
+    body = b"<html>" + b"page " * 1000 + b"</html>"
+    encoded = precompress(body)
+    miss = asyncio.run(representation_response(html_request(**{"accept-encoding": "gzip"}), body, {}))
+    assert miss.headers["etag"].startswith("W/")
+
+    hit = asyncio.run(representation_response(
+        html_request(**{"accept-encoding": "gzip", "if-none-match": miss.headers["etag"]}), body, {},
+        encoded=encoded, etags=representation_etags(body, encoded)
+    ))
+    assert hit.status_code == 304
+    assert hit.headers["etag"] == miss.headers["etag"][2:]
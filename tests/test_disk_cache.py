@@ -0,0 +1,126 @@
+import asyncio
+import os
+
+from utils.disk_cache import claim_worker_directory
+
+def blob_files(cache):
+    return [name for _, _, files in os.walk(cache.objects_dir) for name in files]
+
+def lookup(cache, key):
+    return asyncio.run(cache.lookup(key))
+
+def put(cache, key, content, **kwargs):
+    asyncio.run(cache.put(key, content, "application/javascript", **kwargs))
+
+def test_put_and_read(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"alert(1)", etag='"v1"')
+    entry = lookup(cache, "/a.js")
+    assert entry.etag == '"v1"' and entry.is_fresh()
+    assert asyncio.run(cache.read(entry)) == b"alert(1)"
+
+def test_identical_bodies_share_one_blob(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"same")
+    put(cache, "/b.js", b"same")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 4
+    assert len(blob_files(cache)) == 1
+
+def test_replacing_a_body_removes_the_old_blob(make_disk_cache):
+    cache = make_disk_cache()
+    for version in range(50):
+        put(cache, "/a.js", b"%03d" % version * 10)
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 30
+    assert len(blob_files(cache)) == 1
+
+def test_replacing_with_the_same_body_keeps_the_blob(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"same")
+    put(cache, "/a.js", b"same")
+    assert lookup(cache, "/a.js") is not None
+    assert len(blob_files(cache)) == 1
+
+def test_shared_blob_survives_replacing_one_key(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"same")
+    put(cache, "/b.js", b"same")
+    put(cache, "/a.js", b"changed")
+    assert asyncio.run(cache.read(lookup(cache, "/b.js"))) == b"same"
+    assert len(blob_files(cache)) == 2
+
+def test_evicts_least_recently_used_and_deletes_blobs(make_disk_cache):
+    cache = make_disk_cache()
+    for name in ("a", "b", "c"):
+        put(cache, f"/{name}.js", name.encode() * 400)
+    assert lookup(cache, "/a.js") is None
+    assert cache.stats()["bytes"] == 800
+    assert cache.stats()["evictions"] == 1
+    assert len(blob_files(cache)) == 2
+
+def test_oversized_body_is_not_stored(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"x" * 501)
+    assert lookup(cache, "/a.js") is None
+    assert blob_files(cache) == []
+
+def test_missing_blob_is_a_miss(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"alert(1)")
+    os.unlink(cache.blob_path(lookup(cache, "/a.js").digest))
+    assert lookup(cache, "/a.js") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+def test_touch_restarts_freshness(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"alert(1)", ttl=10)
+    entry = lookup(cache, "/a.js")
+    entry.stored_at -= 11
+    assert not entry.is_fresh()
+    assert cache.touch("/a.js")
+    assert entry.is_fresh()
+
+def test_index_survives_a_restart(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"alert(1)", etag='"v1"', encoding="gzip")
+    cache.flush()
+    reloaded = make_disk_cache(name="reloaded")
+    entry = lookup(reloaded, "/a.js")
+    assert entry.etag == '"v1"' and entry.encoding == "gzip"
+    assert reloaded.stats()["bytes"] == 8
+
+def test_clear_deletes_blobs(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"a")
+    put(cache, "/b.js", b"b")
+    assert asyncio.run(cache.clear()) == 2
+    assert blob_files(cache) == []
+
+def test_claim_worker_directory_takes_the_next_free_slot(tmp_path):
+    first = claim_worker_directory(str(tmp_path))
+    second = claim_worker_directory(str(tmp_path))
+    assert os.path.basename(first) == "worker-0"
+    assert os.path.basename(second) == "worker-1"
+
+def test_encoded_copies_are_stored_counted_and_removed(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"x" * 100, encoded={"gzip": b"g" * 10, "br": b"b" * 8})
+    entry = lookup(cache, "/a.js")
+    assert entry.variants == {"gzip": [entry.variants["gzip"][0], 10], "br": [entry.variants["br"][0], 8]}
+    assert asyncio.run(cache.read(entry)) == b"x" * 100
+    assert cache.stats()["bytes"] == 118
+    assert len(blob_files(cache)) == 3
+
+    put(cache, "/a.js", b"y" * 100)
+    assert lookup(cache, "/a.js").variants == {}
+    assert cache.stats()["bytes"] == 100
+    assert len(blob_files(cache)) == 1
+
+def test_encoded_copies_survive_a_restart(make_disk_cache):
+    cache = make_disk_cache()
+    put(cache, "/a.js", b"x" * 100, encoded={"gzip": b"g" * 10})
+    cache.flush()
+    reloaded = make_disk_cache(name="reloaded")
+    assert lookup(reloaded, "/a.js").variants["gzip"][1] == 10
+    assert reloaded.stats()["bytes"] == 110
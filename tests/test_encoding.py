@@ -0,0 +1,46 @@
+import asyncio
+import gzip
+
+import pytest
+
+from utils import encoding
+from utils.encoding import accepts_encoding, decode_body, encode_for_client, negotiate, precompress, precompress_async
+
+BODY = b"console.log('hello');\n" * 200
+
+@pytest.mark.parametrize("header, coding, expected", [
+    (None, "gzip", False),
+    ("gzip, br", "br", True),
+    ("gzip;q=0", "gzip", False),
+    ("x-gzip", "gzip", True),
+    ("*", "br", True),
+    ("br", None, True),
+])
+def test_accepts_encoding(header, coding, expected):
+    assert accepts_encoding(header, coding) is expected
+
+def test_negotiate_prefers_q_then_order():
+    assert negotiate("gzip;q=0.5, br", ["br", "gzip"]) == "br"
+    assert negotiate("gzip, br", ["br", "gzip"]) == "br"
+    assert negotiate("gzip, br;q=0.1", ["br", "gzip"]) == "gzip"
+    assert negotiate("identity", ["br", "gzip"]) is None
+
+def test_precompress_round_trips():
+    encoded = precompress(BODY)
+    assert set(encoded) == {"br", "gzip"}
+    for coding, body in encoded.items():
+        assert len(body) < len(BODY)
+        assert decode_body(body, coding) == BODY
+
+def test_precompress_skips_small_and_large_bodies(monkeypatch):
+    assert precompress(b"tiny") == {}
+    monkeypatch.setattr(encoding, "PRECOMPRESS_MAX_BYTES", len(BODY) - 1)
+    assert precompress(BODY) == {}
+
+def test_precompress_async():
+    assert asyncio.run(precompress_async(BODY))["gzip"] == precompress(BODY)["gzip"]
+
+def test_encode_for_client_uses_the_precompressed_copy():
+    encoded = {"gzip": gzip.compress(BODY)}
+    assert asyncio.run(encode_for_client(BODY, "gzip", encoded)) == (encoded["gzip"], "gzip")
+    assert asyncio.run(encode_for_client(BODY, "identity", encoded)) == (BODY, None)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+
+from starlette.requests import Request
+
+from utils import negative_cache
+from utils.negative_cache import is_cacheable_failure, lookup_failure, negative_ttl, remember_failure
+
+@pytest.mark.parametrize("status, ttl", [
+    (404, 60), (410, 300), (401, 10), (403, 10), (429, 0), (400, 30), (418, 30), (500, 5), (503, 5), (None, 30)
+])
+def test_ttl_by_status_then_class(status, ttl):
+    assert negative_ttl(status) == ttl
+
+def test_ttl_overrides(monkeypatch):
+    monkeypatch.setenv("NEGATIVE_CACHE_TTLS", '{"404": 120, "5xx": 0}')
+    monkeypatch.setattr(negative_cache, "_negative_ttls", negative_cache._load_negative_ttls())
+    assert negative_ttl(404) == 120
+    assert negative_ttl(502) == 0
+    assert negative_ttl(410) == 300
+
+@pytest.mark.parametrize("status", [200, 304, 416, 429])
+def test_successes_unsatisfiable_ranges_and_throttling_are_not_cached(status):
+    assert not is_cacheable_failure(status)
+
+def test_error_bodies_over_the_limit_are_not_cached():
+    assert is_cacheable_failure(404, str(negative_cache.NEGATIVE_CACHE_MAX_BODY))
+    assert not is_cacheable_failure(404, str(negative_cache.NEGATIVE_CACHE_MAX_BODY + 1))
+
+@pytest.mark.parametrize("content_length", [None, "", "abc", "12, 12", "-1"])
+def test_missing_or_malformed_length_is_unknown(content_length):
+    assert is_cacheable_failure(404, content_length)
+
+def test_remember_failure_uses_the_status_ttl(make_response_cache):
+    cache = make_response_cache()
+    assert remember_failure(cache, "/missing", {"status_code": 404}, 404, size=10)
+    assert not remember_failure(cache, "/throttled", {"status_code": 429}, 429, size=10)
+    assert asyncio.run(lookup_failure(cache, "/missing")).value == {"status_code": 404}
+    assert asyncio.run(lookup_failure(cache, "/throttled")) is None
+    assert cache.peek("/missing").ttl == 60
+
+def test_expired_failures_are_not_returned(make_response_cache):
+    cache = make_response_cache()
+    cache.set("/gone", {"status_code": 404}, 10, ttl=0)
+    assert asyncio.run(lookup_failure(cache, "/gone")) is None
+
+def json_request(payload):
+    body = json.dumps(payload).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"content-type", b"application/json")]}
+    return Request(scope, receive)
+
+@pytest.fixture
+def proxy(monkeypatch):
+    from api import proxy
+
+    async def nothing(*args, **kwargs):
+        return 1
+
+    monkeypatch.setattr(proxy, "force_refresh_session", nothing)
+    monkeypatch.setattr(proxy, "save_cookies", nothing)
+    proxy._negative_cache.clear()
+    yield proxy
+    proxy._negative_cache.clear()
+
+def test_refresh_session_forgets_failures(proxy):
+    remember_failure(proxy._negative_cache, "https://upstream/page", {"status_code": 403}, 403)
+    assert asyncio.run(proxy.refresh_session())["status"] == "success"
+    assert asyncio.run(lookup_failure(proxy._negative_cache, "https://upstream/page")) is None
+
+def test_update_cookies_forgets_failures(proxy):
+    remember_failure(proxy._negative_cache, "https://upstream/page", {"status_code": 403}, 403)
+    result = asyncio.run(proxy.update_cookies_endpoint(json_request({"cookies": []})))
+    assert result["status"] == "success"
+    assert asyncio.run(lookup_failure(proxy._negative_cache, "https://upstream/page")) is None
+
+def test_simple_proxy_refresh_session_forgets_failures(monkeypatch):
+    from api import simple_proxy
+
+    async def nothing():
+        pass
+
+    monkeypatch.setattr(simple_proxy, "force_refresh_session", nothing)
+    remember_failure(simple_proxy._negative_cache, "/page", {"status_code": 403}, 403)
+    assert asyncio.run(simple_proxy.refresh_session())["status"] == "success"
+    assert asyncio.run(lookup_failure(simple_proxy._negative_cache, "/page")) is None
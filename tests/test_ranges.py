@@ -0,0 +1,51 @@
+import pytest
+
+from utils.ranges import MAX_RANGES, if_range_matches, parse_range
+
+ETAG = '"0123456789abcdef"'
+LAST_MODIFIED = "Wed, 21 Oct 2015 07:28:00 GMT"
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-4", [(0, 4)]),
+    ("bytes=5-", [(5, 9)]),
+    ("bytes=-3", [(7, 9)]),
+    ("bytes=-20", [(0, 9)]),
+    ("bytes=8-100", [(8, 9)]),
+    ("bytes=0-1, 4-5", [(0, 1), (4, 5)]),
+    ("BYTES=0-0", [(0, 0)]),
+])
+def test_parse_range_satisfiable(header, expected):
+    assert parse_range(header, 10) == expected
+
+@pytest.mark.parametrize("header", [None, "", "items=0-4", "bytes=", "bytes=4", "bytes=a-b", "bytes=5-2"])
+def test_parse_range_ignored(header):
+    assert parse_range(header, 10) is None
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=20-30", "bytes=-0", "bytes=10-12, -0"])
+def test_parse_range_unsatisfiable(header):
+    assert parse_range(header, 10) == []
+
+def test_parse_range_too_many_ranges_is_ignored():
+    header = "bytes=" + ", ".join(f"{i}-{i}" for i in range(MAX_RANGES + 1))
+    assert parse_range(header, 100) is None
+
+def test_parse_range_empty_body():
+    assert parse_range("bytes=0-", 0) == []
+
+def test_if_range_absent_allows_range():
+    assert if_range_matches({}, ETAG, LAST_MODIFIED)
+
+def test_if_range_etag():
+    assert if_range_matches({"if-range": ETAG}, ETAG, None)
+    assert not if_range_matches({"if-range": '"other"'}, ETAG, None)
+    assert not if_range_matches({"if-range": ETAG}, None, LAST_MODIFIED)
+
+def test_if_range_requires_strong_comparison():
+    assert not if_range_matches({"if-range": "W/" + ETAG}, ETAG, None)
+    assert not if_range_matches({"if-range": "W/" + ETAG}, "W/" + ETAG, None)
+
+def test_if_range_date():
+    assert if_range_matches({"if-range": LAST_MODIFIED}, ETAG, LAST_MODIFIED)
+    assert not if_range_matches({"if-range": "Thu, 22 Oct 2015 07:28:00 GMT"}, ETAG, LAST_MODIFIED)
+    assert not if_range_matches({"if-range": LAST_MODIFIED}, ETAG, None)
+    assert not if_range_matches({"if-range": "not a date"}, ETAG, LAST_MODIFIED)
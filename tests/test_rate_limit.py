@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.rate_limit import ClientLimiter, RateLimited
+
+def test_burst_is_admitted_immediately():
+    limiter = ClientLimiter(rate=1, burst=3, max_queue=0, max_wait=1)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire("ip:a")
+        with pytest.raises(RateLimited):
+            await limiter.acquire("ip:a")
+
+    asyncio.run(run())
+    assert (limiter.admitted, limiter.delayed, limiter.rejected) == (3, 0, 1)
+
+def test_queued_requests_wait_in_order_then_queue_full_is_rejected():
+    limiter = ClientLimiter(rate=10, burst=1, max_queue=2, max_wait=1)
+    finished = []
+
+    async def request(n):
+        await limiter.acquire("ip:a")
+        finished.append((n, time.monotonic()))
+
+    async def run():
+        started = time.monotonic()
+        results = await asyncio.gather(*(request(n) for n in range(4)), return_exceptions=True)
+        return started, results
+
+    started, results = asyncio.run(run())
+    assert isinstance(results[3], RateLimited)
+    assert [n for n, _ in finished] == [0, 1, 2]
+    delays = [at - started for _, at in finished]
+    assert delays[0] < 0.09
+    assert 0.09 <= delays[1] < 0.19  # one token per 100 ms
+    assert 0.19 <= delays[2] < 0.35
+    assert (limiter.admitted, limiter.delayed, limiter.rejected) == (3, 2, 1)
+
+def test_wait_longer_than_max_wait_is_rejected():
+    limiter = ClientLimiter(rate=1, burst=1, max_queue=10, max_wait=0.5)
+
+    async def run():
+        await limiter.acquire("ip:a")
+        with pytest.raises(RateLimited) as error:
+            await limiter.acquire("ip:a")
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.identity == "ip:a"
+    assert error.retry_after == pytest.approx(1, abs=0.05)
+
+def test_clients_have_separate_buckets():
+    limiter = ClientLimiter(rate=1, burst=1, max_queue=0, max_wait=1)
+
+    async def run():
+        await limiter.acquire("ip:a")
+        await limiter.acquire("ip:b")
+        await limiter.acquire("key:c")
+
+    asyncio.run(run())
+    assert limiter.stats()["clients"] == 3
+
+def test_overrides_set_a_client_allowance():
+    limiter = ClientLimiter(rate=1, burst=1, max_queue=0, max_wait=1, overrides={"key:big": {"burst": 5}})
+
+    async def run():
+        for _ in range(5):
+            await limiter.acquire("key:big")
+
+    asyncio.run(run())
+    assert limiter.admitted == 5
+
+def test_cancelled_waiter_returns_its_token():
+    limiter = ClientLimiter(rate=10, burst=1, max_queue=5, max_wait=1)
+
+    async def run():
+        await limiter.acquire("ip:a")
+        waiter = asyncio.ensure_future(limiter.acquire("ip:a"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter._buckets["ip:a"]
+
+    bucket = asyncio.run(run())
+    assert bucket.waiting == 0
+    assert bucket.tokens > -1  # the reservation was handed back
+
+def test_sweep_drops_idle_buckets():
+    limiter = ClientLimiter(rate=1000, burst=1, max_queue=0, max_wait=1)
+    asyncio.run(limiter.acquire("ip:a"))
+    assert limiter.sweep(time.monotonic() + 1) == 1
+    assert limiter.stats()["clients"] == 0
@@ -0,0 +1,140 @@
+import asyncio
+
+import httpx
+import pytest
+
+from starlette.requests import Request
+
+from utils import request_body
+from utils.request_body import RequestBodyTooLarge, SpooledBody, close_request_body, payload_too_large_response, read_request_body, upstream_body
+from utils.streaming import open_upstream_stream
+
+def make_request(chunks, headers):
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(k.encode(), v.encode()) for k, v in headers.items()]}
+    return Request(scope, receive)
+
+async def collect(body):
+    return b"".join([chunk async for chunk in body])
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(request_body, "MAX_REQUEST_BODY", 100)
+    monkeypatch.setattr(request_body, "REQUEST_BODY_BUFFER", 10)
+
+def test_no_body():
+    assert asyncio.run(read_request_body(make_request([b""], {}))) == b""
+
+def test_small_body_is_read_into_memory(limits):
+    request = make_request([b"hello"], {"content-length": "5"})
+    assert asyncio.run(read_request_body(request)) == b"hello"
+
+def test_declared_length_over_the_limit_is_refused_unread(limits):
+    request = make_request([b"x" * 101], {"content-length": "101"})
+    with pytest.raises(RequestBodyTooLarge):
+        asyncio.run(read_request_body(request))
+
+def test_large_body_is_streamed(limits):
+    request = make_request([b"a" * 30, b"b" * 30], {"content-length": "60"})
+
+    async def run():
+        body = await read_request_body(request)
+        assert not isinstance(body, bytes)
+        return await collect(body)
+
+    assert asyncio.run(run()) == b"a" * 30 + b"b" * 30
+
+def send_upstream(request, handler):
+    """Read the client's body and send it through a client that follows redirects, like the upstream session"""
+    async def run():
+        body = await read_request_body(request)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True) as client:
+            response = await open_upstream_stream(client, "POST", "https://upstream/form", **upstream_body(body, {}))
+            await response.aclose()
+            return response
+
+    return asyncio.run(run())
+
+def test_streamed_body_keeps_the_clients_content_length(limits):
+    seen = []
+
+    def handler(upstream_request):
+        seen.append((upstream_request.headers.get("content-length"), upstream_request.headers.get("transfer-encoding"), upstream_request.read()))
+        return httpx.Response(200)
+
+    send_upstream(make_request([b"a" * 30, b"b" * 30], {"content-length": "60"}), handler)
+    assert seen == [("60", None, b"a" * 30 + b"b" * 30)]
+
+def test_chunked_upload_stays_chunked(limits):
+    seen = []
+
+    def handler(upstream_request):
+        seen.append(upstream_request.headers.get("transfer-encoding"))
+        return httpx.Response(200)
+
+    send_upstream(make_request([b"a" * 30, b"b" * 30], {"transfer-encoding": "chunked"}), handler)
+    assert seen == ["chunked"]
+
+def test_redirect_for_a_streamed_body_is_returned_not_followed(limits):
+    urls = []
+
+    def handler(upstream_request):
+        urls.append(str(upstream_request.url))
+        upstream_request.read()
+        return httpx.Response(307, headers={"Location": "https://upstream/elsewhere"})
+
+    response = send_upstream(make_request([b"a" * 30, b"b" * 30], {"content-length": "60"}), handler)
+    assert response.status_code == 307
+    assert urls == ["https://upstream/form"]
+
+def test_small_bodies_follow_redirects(limits):
+    assert upstream_body(b"hello", {"Accept": "*/*"}) == {"content": b"hello", "headers": {"Accept": "*/*"}}
+
+def test_chunked_body_past_the_limit_raises_while_streaming(limits):
+    request = make_request([b"x" * 60, b"x" * 60], {"transfer-encoding": "chunked"})
+
+    async def run():
+        return await collect(await read_request_body(request))
+
+    with pytest.raises(RequestBodyTooLarge):
+        asyncio.run(run())
+
+def test_spooled_body_is_received_before_it_is_sent(limits, monkeypatch):
+    monkeypatch.setattr(request_body, "REQUEST_BODY_SPOOL", True)
+    request = make_request([b"a" * 30, b"b" * 30], {"transfer-encoding": "chunked"})
+
+    async def run():
+        body = await read_request_body(request)
+        assert isinstance(body, SpooledBody)
+        return body.length, await collect(body), body._spool.closed
+
+    assert asyncio.run(run()) == (60, b"a" * 30 + b"b" * 30, True)
+
+def test_spooled_body_past_the_limit_is_refused(limits, monkeypatch):
+    monkeypatch.setattr(request_body, "REQUEST_BODY_SPOOL", True)
+    request = make_request([b"x" * 60, b"x" * 60], {"transfer-encoding": "chunked"})
+    with pytest.raises(RequestBodyTooLarge):
+        asyncio.run(read_request_body(request))
+
+def test_unsent_spooled_body_is_closed(limits, monkeypatch):
+    monkeypatch.setattr(request_body, "REQUEST_BODY_SPOOL", True)
+    request = make_request([b"x" * 60], {"transfer-encoding": "chunked"})
+
+    async def run():
+        body = await read_request_body(request)
+        await close_request_body(body)
+        return body._spool.closed
+
+    assert asyncio.run(run())
+
+def test_close_request_body_accepts_bytes():
+    asyncio.run(close_request_body(b"hello"))
+
+def test_payload_too_large_response():
+    response = payload_too_large_response(RequestBodyTooLarge(100))
+    assert response.status_code == 413
+    assert response.headers["connection"] == "close"
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from auth import session
+
+@pytest.fixture
+def fresh_session(monkeypatch, tmp_path):
+    """Module state reset to 'no client yet', with a valid cookie file"""
+    cookies_file = tmp_path / "manual_cookies.json"
+    cookies_file.write_text(json.dumps({"timestamp": time.time(), "url": "https://upstream/",
+                                        "cookies": [{"name": "sid", "value": "1"}]}))
+    monkeypatch.setattr(session, "COOKIES_FILE", str(cookies_file))
+    monkeypatch.setattr(session, "_master_client", None)
+    monkeypatch.setattr(session, "_master_client_lock", asyncio.Lock())
+    monkeypatch.setattr(session, "_last_refresh", 0)
+    monkeypatch.setattr(session, "_refresh_task", None)
+    monkeypatch.setattr(session, "_next_refresh_attempt", 0)
+    for name in ("_cookie_status", "_cookie_mtime", "_cookie_expires_at"):
+        monkeypatch.setattr(session, name, None)
+    yield session
+    if isinstance(session._master_client, httpx.AsyncClient):
+        asyncio.run(session._master_client.aclose())
+
+def test_force_refresh_completes_without_reentering_the_lock(fresh_session):
+    async def run():
+        first = await asyncio.wait_for(session.force_refresh_session(), 1)
+        second = await asyncio.wait_for(session.force_refresh_session(), 1)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second  # the cookie jar is swapped, the client kept
+    assert session._last_refresh > time.time() - 5
+
+def test_force_refresh_waits_for_the_lock_holder(fresh_session):
+    async def run():
+        async with session._master_client_lock:
+            forced = asyncio.ensure_future(session.force_refresh_session())
+            await asyncio.sleep(0.01)
+            assert not forced.done()
+        return await asyncio.wait_for(forced, 1)
+
+    assert asyncio.run(run()) is not None
+
+def test_near_expiry_returns_at_once_and_refreshes_once(fresh_session, monkeypatch):
+    client = object()
+    monkeypatch.setattr(session, "_master_client", client)
+    monkeypatch.setattr(session, "_last_refresh", time.time() - session._session_timeout + session._refresh_ahead / 2)
+    refreshes = []
+
+    async def slow_refresh():
+        refreshes.append(time.time())
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(session, "_refresh_session", slow_refresh)
+
+    async def run():
+        started = time.perf_counter()
+        clients = await asyncio.gather(*(session.get_authenticated_client() for _ in range(20)))
+        elapsed = time.perf_counter() - started
+        await session._refresh_task
+        return clients, elapsed
+
+    clients, elapsed = asyncio.run(run())
+    assert all(c is client for c in clients)
+    assert elapsed < 0.05  # nobody waited for the refresh
+    assert len(refreshes) == 1
+    assert session._last_refresh > time.time() - 5
+
+def test_failed_background_refresh_is_not_retried_at_once(fresh_session, monkeypatch):
+    monkeypatch.setattr(session, "_master_client", object())
+    monkeypatch.setattr(session, "_last_refresh", time.time() - session._session_timeout)
+    refreshes = []
+
+    async def failing_refresh():
+        refreshes.append(time.time())
+        raise RuntimeError("no cookies")
+
+    monkeypatch.setattr(session, "_refresh_session", failing_refresh)
+
+    async def run():
+        await session.get_authenticated_client()
+        await session._refresh_task
+        await session.get_authenticated_client()
+        return session._refresh_task.done()
+
+    assert asyncio.run(run())
+    assert len(refreshes) == 1
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from utils import shared_state
+from utils.shared_state import SharedStateClient, _StateServer
+
+@pytest.fixture
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(shared_state, "POLL_INTERVAL", 0.01)
+
+async def start_server(tmp_path):
+    path = str(tmp_path / "state.sock")
+    server = await asyncio.start_unix_server(_StateServer().serve_connection, path=path)
+    return server, path
+
+async def stop(server, *clients):
+    for client in clients:
+        if client._poller is not None:
+            client._poller.cancel()
+    server.close()
+    await server.wait_closed()
+
+def test_remote_hit_fills_the_local_tier(tmp_path, monkeypatch, make_response_cache):
+    cache = make_response_cache()
+    value = {"content": b"\x00body", "etags": {None: '"a"', "gzip": '"b"'}}
+
+    async def run():
+        server, path = await start_server(tmp_path)
+        other, this = SharedStateClient(path, {}), SharedStateClient(path, {})
+        monkeypatch.setattr(shared_state, "_client", this)
+        try:
+            await other.call("set", cache.name, shared_state._limits(cache), "/page", value, 5, 60, 30)
+            entry = await shared_state.lookup(cache, "/page")
+            return entry, this
+        finally:
+            await stop(server)
+
+    entry, this = asyncio.run(run())
+    assert entry.value == value
+    assert cache.peek("/page") is entry
+    assert 59 < entry.ttl <= 60 and 29 < entry.stale_ttl <= 30
+    assert (this.remote_hits, this.remote_misses, this.errors) == (1, 0, 0)
+
+def test_remote_miss(tmp_path, monkeypatch, make_response_cache):
+    cache = make_response_cache()
+
+    async def run():
+        server, path = await start_server(tmp_path)
+        client = SharedStateClient(path, {})
+        monkeypatch.setattr(shared_state, "_client", client)
+        try:
+            return await shared_state.lookup(cache, "/page"), client
+        finally:
+            await stop(server)
+
+    entry, client = asyncio.run(run())
+    assert entry is None
+    assert client.remote_misses == 1
+
+def test_bump_calls_back_other_workers_but_not_itself(tmp_path, monkeypatch, fast_poll):
+    calls = {"bumper": 0, "other": 0}
+
+    def callback(worker):
+        def run():
+            calls[worker] += 1
+        return run
+
+    async def run():
+        server, path = await start_server(tmp_path)
+        bumper = SharedStateClient(path, {"cookies": callback("bumper")})
+        other = SharedStateClient(path, {"cookies": callback("other")})
+        monkeypatch.setattr(shared_state, "_client", bumper)
+        try:
+            bumper.start_polling()
+            other.start_polling()
+            await asyncio.sleep(0.05)  # both have their starting versions
+            await shared_state.bump("cookies")
+            await asyncio.sleep(0.1)
+        finally:
+            await stop(server, bumper, other)
+
+    asyncio.run(run())
+    assert calls == {"bumper": 0, "other": 1}
+
+def test_clear_drops_the_shared_tier_and_other_local_tiers(tmp_path, monkeypatch, fast_poll, make_response_cache):
+    cache = make_response_cache()
+    other_cache = make_response_cache()
+    other_cache.set("/page", "old", size=3)
+
+    async def run():
+        server, path = await start_server(tmp_path)
+        this = SharedStateClient(path, {})
+        other = SharedStateClient(path, {f"cache:{cache.name}": other_cache.clear})
+        monkeypatch.setattr(shared_state, "_client", this)
+        try:
+            other.start_polling()
+            await asyncio.sleep(0.05)
+            shared_state.store(cache, "/page", "old", 3)
+            await asyncio.sleep(0.05)
+            await shared_state.clear(cache)
+            await asyncio.sleep(0.1)
+            return await this.call("get", cache.name, "/page")
+        finally:
+            await stop(server, other)
+
+    assert asyncio.run(run()) is None
+    assert "/page" not in other_cache
+
+def test_unreachable_server_degrades_to_the_default(tmp_path):
+    client = SharedStateClient(str(tmp_path / "missing.sock"), {})
+    assert asyncio.run(client.call("versions", default={})) == {}
+    assert client.errors == 1
+
+def test_socket_owned_by_another_user_is_refused(tmp_path, monkeypatch):
+    path = tmp_path / "state.sock"
+    path.touch()
+    monkeypatch.setattr(shared_state.os, "getuid", lambda: path.stat().st_uid + 1)
+    with pytest.raises(PermissionError):
+        shared_state._check_owner(str(path))
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight, flight_key
+
+def test_flight_key_includes_vary_headers():
+    assert flight_key("get", "https://x/a") == "GET|https://x/a"
+    key = flight_key("GET", "https://x/a", {"Accept-Encoding": "gzip"}, vary=("accept-encoding", "range"))
+    assert key == "GET|https://x/a|accept-encoding=gzip|range="
+
+def test_concurrent_calls_share_one_execution():
+    group = SingleFlight("test-share")
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "page"
+
+    async def run():
+        return await asyncio.gather(*(group.do("k", fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert [result for result, _ in results] == ["page"] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert group.stats()["in_flight"] == 0 and group.stats()["waiters"] == 0
+
+def test_different_keys_run_separately():
+    group = SingleFlight("test-keys")
+
+    async def run():
+        return await asyncio.gather(group.do("a", lambda: asyncio.sleep(0, "a")),
+                                    group.do("b", lambda: asyncio.sleep(0, "b")))
+
+    assert asyncio.run(run()) == [("a", False), ("b", False)]
+
+def test_exception_reaches_every_caller_and_is_not_remembered():
+    group = SingleFlight("test-error")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        results = await asyncio.gather(group.do("k", fail), group.do("k", fail), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        return await group.do("k", lambda: asyncio.sleep(0, "recovered"))
+
+    assert asyncio.run(run()) == ("recovered", False)
+
+def test_cancelled_leader_does_not_cancel_the_fetch():
+    group = SingleFlight("test-cancel")
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "page"
+
+    async def run():
+        leader = asyncio.ensure_future(group.do("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.do("k", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == ("page", True)
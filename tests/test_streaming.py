@@ -0,0 +1,29 @@
+import gzip
+
+import httpx
+
+from utils.streaming import passthrough_encoding, stream_response, weak_etag
+
+def gzip_response():
+    return httpx.Response(200, headers={"Content-Encoding": "gzip", "ETag": '"v1"'}, content=gzip.compress(b"body"))
+
+def test_weak_etag():
+    assert weak_etag('"v1"') == 'W/"v1"'
+    assert weak_etag('W/"v1"') == 'W/"v1"'
+    assert weak_etag(None) is None
+
+def test_passthrough_encoding():
+    assert passthrough_encoding(gzip_response(), "gzip, br") == "gzip"
+    assert passthrough_encoding(gzip_response(), "br") is None
+    assert passthrough_encoding(httpx.Response(200), "gzip") is None
+
+def test_passthrough_keeps_the_strong_etag():
+    response = stream_response(gzip_response(), {"etag": '"v1"'}, accept_encoding="gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"v1"'
+
+def test_decoded_body_gets_a_weak_etag():
+    response = stream_response(gzip_response(), {"etag": '"v1"'}, accept_encoding="identity")
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == 'W/"v1"'
+    assert response.headers["vary"] == "Accept-Encoding"